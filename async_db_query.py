@@ -0,0 +1,258 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import pymysql
+from query_cache import QueryCache
+from metrics import Metrics, metrics as default_metrics
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+# Несколько AsyncDBQueryRunner не должны набирать места общего лимита подключений одновременно,
+# иначе каждый может держать часть мест и ждать остальные
+_limiter_lock = threading.Lock()
+
+
+class AsyncDBQuery:
+    """Асинхронный аналог DBQuery на aiomysql.
+
+    Запросы выполняются через пул из connections подключений. Семафор
+    max_concurrency ограничивает число запросов, одновременно выполняемых
+    на сервере (лимит администратора базы); остальные ждут своей очереди,
+    не занимая потоков. stop() отменяет ожидающие и выполняющиеся запросы.
+    """
+
+    def __init__(self, host: str, user: str, password: str, database: str, connections: int = 4,
+                 max_concurrency: Optional[int] = None, connect_timeout: Optional[int] = None,
+                 cache: Optional[QueryCache] = None, metrics: Optional[Metrics] = None):
+        if aiomysql is None:
+            raise ImportError("Для асинхронных запросов нужен пакет aiomysql")
+        self.connection_params = {
+            'host': host,
+            'user': user,
+            'password': password,
+            'db': database,
+            'charset': 'utf8mb4',
+            'cursorclass': aiomysql.DictCursor,
+            'autocommit': True
+        }
+        if connect_timeout:
+            self.connection_params['connect_timeout'] = connect_timeout
+        self.database = database
+        self.connections = max(1, int(connections))
+        self.max_concurrency = max(1, int(max_concurrency or self.connections))
+        self.pool = None
+        self.should_stop = False
+        self.logger = logging.getLogger('AsyncDBQuery')
+        self.count_not_found = 0
+        self.cache = cache
+        self.metrics = metrics or default_metrics
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
+
+    async def connect(self) -> bool:
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            self.pool = await aiomysql.create_pool(minsize=1, maxsize=self.connections, **self.connection_params)
+            return True
+        except pymysql.Error as e:
+            self.logger.error(f"Ошибка подключения: {str(e)}")
+            return False
+
+    async def disconnect(self):
+        if self.pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    async def execute_query(self, query: str, params: tuple = None) -> Optional[List[Dict]]:
+        if self.should_stop or self.pool is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if self.cache:
+            # SQLite-кэш блокирующий: обращения к нему выполняются в пуле потоков, а не в цикле событий
+            cached = await loop.run_in_executor(None, self._cache_get, query, params)
+            if cached is not None:
+                if not cached:
+                    self.count_not_found += 1
+                return cached
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            async with self._semaphore:
+                if self.should_stop:
+                    return None
+                start = time.perf_counter()
+                async with self.pool.acquire() as connection:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(query, params)
+                        res = await cursor.fetchall()
+                self.metrics.observe('db_query', time.perf_counter() - start)
+            if not res:
+                self.count_not_found += 1
+            if self.cache:
+                await loop.run_in_executor(None, self._cache_put, query, params, list(res))
+            return res
+        except asyncio.CancelledError:
+            return None
+        except pymysql.Error as e:
+            self.logger.error(f"Ошибка выполнения запроса: {str(e)}")
+            return None
+        finally:
+            self._tasks.discard(task)
+
+    def _cache_get(self, query: str, params: tuple) -> Optional[List[Dict]]:
+        """Читает результат из кэша; ошибка кэша считается промахом"""
+        try:
+            return self.cache.get(self.database, query, params)
+        except Exception as e:
+            self.logger.warning(f"Ошибка чтения кэша запросов: {str(e)}")
+            return None
+
+    def _cache_put(self, query: str, params: tuple, rows: List[Dict]):
+        """Сохраняет результат в кэш; ошибка кэша не отменяет полученный из базы результат"""
+        try:
+            self.cache.put(self.database, query, params, rows)
+        except Exception as e:
+            self.logger.warning(f"Ошибка записи в кэш запросов: {str(e)}")
+
+    def stop(self):
+        """Отменяет запросы; можно вызывать только из потока цикла событий (см. AsyncDBQueryRunner.stop)"""
+        self.should_stop = True
+        for task in list(self._tasks):
+            task.cancel()
+
+    def get_not_found(self):
+        tmp = self.count_not_found
+        self.count_not_found = 0
+        return tmp
+
+
+class AsyncDBQueryRunner:
+    """Синхронная обертка над AsyncDBQuery с интерфейсом DBQuery.
+
+    Цикл событий работает в отдельном потоке. execute_many держит в работе
+    до in_flight запросов и отдает результаты в порядке запросов, как
+    DBQueryPool.execute_many. limiter - общий семафор подключений (как у
+    DBQuery); обертка занимает в нем connections мест на время работы,
+    поэтому connections не должно превышать размер лимита (иначе connect()
+    ждет до stop()). Если подключиться не удалось, with возбуждает
+    ConnectionError.
+    """
+
+    def __init__(self, host: str, user: str, password: str, database: str, connections: int = 4,
+                 max_concurrency: Optional[int] = None, in_flight: int = 256, connect_timeout: Optional[int] = None,
+                 cache: Optional[QueryCache] = None, limiter: Optional[threading.Semaphore] = None,
+                 metrics: Optional[Metrics] = None):
+        self.db_query = AsyncDBQuery(host, user, password, database, connections=connections,
+                                     max_concurrency=max_concurrency, connect_timeout=connect_timeout, cache=cache,
+                                     metrics=metrics)
+        self.in_flight = max(1, int(in_flight))
+        self.limiter = limiter
+        self.should_stop = False
+        self.logger = logging.getLogger('AsyncDBQueryRunner')
+        self._held = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self):
+        if not self.connect() and not self.should_stop:
+            self.disconnect()
+            raise ConnectionError(f"Не удалось подключиться к базе {self.db_query.database}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def connect(self) -> bool:
+        if self.limiter and not self._acquire_limiter():
+            return False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='AsyncDBQuery', daemon=True)
+        self._thread.start()
+        return self._run(self.db_query.connect())
+
+    def disconnect(self):
+        if self._loop is None:
+            return
+        try:
+            self._run(self.db_query.disconnect())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._release_limiter()
+
+    def _acquire_limiter(self) -> bool:
+        """Занимает connections мест общего лимита; False, если за это время запросы остановлены"""
+        with _limiter_lock:
+            while self._held < self.db_query.connections:
+                if self.limiter.acquire(timeout=0.5):
+                    self._held += 1
+                elif self.should_stop:
+                    self._release_limiter()
+                    return False
+        return True
+
+    def _release_limiter(self):
+        while self._held:
+            self._held -= 1
+            self.limiter.release()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def execute_query(self, query: str, params: tuple = None) -> Optional[List[Dict]]:
+        if self.should_stop or self._loop is None:
+            return None
+        try:
+            return self._run(self.db_query.execute_query(query, params))
+        except concurrent.futures.CancelledError:
+            return None
+
+    def execute_many(self, queries: Iterable[Tuple[str, Optional[tuple]]]) -> Iterator[Optional[List[Dict]]]:
+        """Выполняет запросы (query, params) конкурентно, результаты отдаются в порядке запросов"""
+        pending = collections.deque()
+        queries = iter(queries)
+        while True:
+            while not self.should_stop and len(pending) < self.in_flight:
+                item = next(queries, None)
+                if item is None:
+                    break
+                pending.append(asyncio.run_coroutine_threadsafe(self.db_query.execute_query(*item), self._loop))
+            if not pending:
+                return
+            try:
+                yield pending.popleft().result()
+            except concurrent.futures.CancelledError:
+                yield None
+
+    def stop(self):
+        self.should_stop = True
+        self.db_query.should_stop = True
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.db_query.stop)
+            except RuntimeError:
+                # Цикл событий уже закрыт, отменять нечего
+                pass
+
+    def get_not_found(self):
+        return self.db_query.get_not_found()
@@ -0,0 +1,240 @@
+import logging
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import pandas as pd
+import pymysql
+from pymysql import cursors
+from config import client_policy_batch_query, exportfile_batch_query, exportfile_batch_latest_query
+from excel_writer import save_tables
+from patient_search import PatientSearcher
+
+# Символы, недопустимые в именах файлов Windows
+_UNSAFE_FILENAME = re.compile(r'[/\\:*?"<>|\x00-\x1f]')
+
+
+class BatchPatientSearcher:
+    """Пакетный поиск списка пациентов из CSV или XLSX.
+
+    На каждую базу открывается одно подключение. Полисы всех пациентов ищутся
+    запросами по списку фамилий, строки exportfile* - запросами по спискам
+    SPN и SN блоками по chunk_size значений. Результат сохраняется одной
+    книгой или книгой на каждого пациента.
+    """
+    name_fields = {
+        'patient_lastname': ('фамилия', 'lastname', 'last_name'),
+        'patient_firstname': ('имя', 'firstname', 'first_name'),
+        'patient_patrname': ('отчество', 'patrname', 'patr_name'),
+    }
+
+    def __init__(self, searcher: Optional[PatientSearcher] = None, chunk_size: int = 500):
+        self.searcher = searcher or PatientSearcher()
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger('BatchPatientSearcher')
+
+    def read_patients(self, path: str) -> pd.DataFrame:
+        """Читает список ФИО.
+
+        Колонки ищутся по названиям (Фамилия/Имя/Отчество или lastname/firstname/patrname).
+        Если ни одного названия нет, файл считается файлом без заголовка и берутся
+        первые три колонки, начиная с первой строки.
+        """
+        raw = self._read_table(path)
+        columns = {str(col).strip().lower(): col for col in raw.columns}
+        sources = [next((columns[name] for name in names if name in columns), None)
+                   for names in self.name_fields.values()]
+        if not any(sources):
+            # Первая строка - не заголовок, а первый пациент
+            raw = self._read_table(path, header=None)
+            sources = [None] * len(self.name_fields)
+
+        patients = pd.DataFrame(index=raw.index)
+        for i, (field, source) in enumerate(zip(self.name_fields, sources)):
+            if source is None:
+                source = raw.columns[i] if i < len(raw.columns) else None
+            patients[field] = raw[source].fillna('').str.strip() if source is not None else ''
+
+        patients = patients[(patients != '').any(axis=1)].reset_index(drop=True)
+        self.logger.info(f"Прочитано пациентов: {len(patients)}")
+        return patients
+
+    @staticmethod
+    def _read_table(path: str, header: Optional[int] = 0) -> pd.DataFrame:
+        if path.lower().endswith(('.xlsx', '.xls')):
+            return pd.read_excel(path, dtype=str, header=header)
+        return pd.read_csv(path, dtype=str, sep=None, engine='python', encoding='utf-8-sig', header=header)
+
+    def search(self, patients: pd.DataFrame, db_params_list: List[Dict],
+               progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Dict]:
+        """Ищет всех пациентов в каждой базе (базы - параллельно).
+
+        Для каждой базы возвращается словарь: source_db, policies - номер полиса
+        каждого пациента или None, exportfiles - строки каждой таблицы по пациентам.
+        """
+        with ThreadPoolExecutor(max_workers=len(db_params_list), thread_name_prefix='BatchSearch') as executor:
+            futures = [executor.submit(self._search_database, patients, params) for params in db_params_list]
+            results = []
+            for done, future in enumerate(futures, 1):
+                results.append(future.result())
+                if progress_callback:
+                    progress_callback(done, len(futures))
+            return results
+
+    def _search_database(self, patients: pd.DataFrame, db_params: Dict) -> Dict:
+        db_name = db_params['database']
+        connection = pymysql.connect(
+            host=db_params['host'],
+            user=db_params['user'],
+            password=db_params['password'],
+            database=db_name,
+            cursorclass=cursors.DictCursor,
+            connect_timeout=10
+        )
+        try:
+            policies = self._resolve_policies(connection, patients)
+            found = list(dict.fromkeys(policy for policy in policies if policy))
+            self.logger.info(f"{db_name}: найдено полисов {sum(map(bool, policies))} из {len(patients)}")
+
+            tables = list(self.searcher.get_table_aliases(connection, db_params).items())
+            latest = db_name == 's12'
+            first_table, first_aliases = tables[0]
+            p_rows = self._fetch_rows(connection, first_aliases, 'SPN', found, latest)
+            sns = {}
+            for i, policy in enumerate(policies):
+                rows = p_rows.get(self._key(policy)) if policy else None
+                if rows:
+                    sns[i] = str(rows[0]['SN'])
+
+            exportfiles = {first_table: {i: p_rows[self._key(policies[i])] for i in sns}}
+            for base_table, aliases in tables[1:]:
+                if self.searcher.stop_search:
+                    break
+                rows_by_sn = self._fetch_rows(connection, aliases, 'SN', list(dict.fromkeys(sns.values())), latest)
+                exportfiles[base_table] = {i: rows_by_sn[self._key(sn)] for i, sn in sns.items()
+                                           if self._key(sn) in rows_by_sn}
+
+            return {'source_db': db_name, 'policies': policies, 'exportfiles': exportfiles}
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _key(value) -> str:
+        """Значение так, как его сравнивает MySQL: без учета регистра и хвостовых пробелов"""
+        return str(value).rstrip().casefold()
+
+    def _resolve_policies(self, connection, patients: pd.DataFrame) -> List[Optional[str]]:
+        """Номер полиса для каждого пациента: первый подходящий, как LIMIT 1 при одиночном поиске"""
+        candidates = defaultdict(list)
+        lastnames = list(dict.fromkeys(name for name in patients['patient_lastname'] if name))
+        with connection.cursor() as cursor:
+            for start in range(0, len(lastnames), self.chunk_size):
+                if self.searcher.stop_search:
+                    break
+                chunk = lastnames[start:start + self.chunk_size]
+                query = client_policy_batch_query.replace('%', '%%').replace(
+                    '{LASTNAME_LIST}', ', '.join(['%s'] * len(chunk)))
+                cursor.execute(query, chunk)
+                for row in cursor.fetchall():
+                    candidates[self._key(row['lastName'])].append(row)
+
+        policies = []
+        for patient in patients.to_dict('records'):
+            if not patient['patient_lastname']:
+                # Без фамилии пакетный запрос не подходит, ищем как одиночного пациента
+                policy = None if self.searcher.stop_search else self.searcher.find_client_policy(connection, patient)
+                policies.append(policy['number'] if policy else None)
+                continue
+            policy = next((
+                row['number'] for row in candidates.get(self._key(patient['patient_lastname']), [])
+                if all(not patient[field] or self._key(row[column]) == self._key(patient[field])
+                       for field, column in (('patient_firstname', 'firstName'), ('patient_patrname', 'patrName')))
+            ), None)
+            policies.append(policy)
+        return policies
+
+    def _fetch_rows(self, connection, aliases: List[str], col: str, values: List[str],
+                    latest: bool) -> Dict[str, List[Dict]]:
+        """Строки таблицы для списка значений колонки col, сгруппированные по значению.
+
+        Названия таблицы перебираются, пока одно не сработает без ошибки.
+        """
+        template = exportfile_batch_latest_query if latest else exportfile_batch_query
+        for table_name in aliases:
+            rows_by_value = defaultdict(list)
+            try:
+                with connection.cursor() as cursor:
+                    for start in range(0, len(values), self.chunk_size):
+                        if self.searcher.stop_search:
+                            break
+                        chunk = values[start:start + self.chunk_size]
+                        query = template.replace('exportfile', table_name).replace('{col}', col).replace(
+                            '{VALUE_LIST}', ', '.join(['%s'] * len(chunk)))
+                        cursor.execute(query, chunk)
+                        for row in cursor.fetchall():
+                            rows_by_value[self._key(row[col])].append(row)
+                return rows_by_value
+            except pymysql.Error as e:
+                self.logger.debug(f"Таблица {table_name} недоступна: {str(e)}")
+        self.logger.warning(f"Не удалось прочитать ни одну из таблиц {', '.join(aliases)}")
+        return {}
+
+    def _patient_label(self, patient: Dict) -> str:
+        return ' '.join(name for name in (patient['patient_lastname'], patient['patient_firstname'],
+                                          patient['patient_patrname']) if name)
+
+    def _build_tables(self, patients: pd.DataFrame, results: List[Dict],
+                      indexes: Optional[List[int]] = None) -> Dict[str, pd.DataFrame]:
+        """Листы книги: сводка полисов и строки каждой таблицы с пациентом и источником"""
+        indexes = range(len(patients)) if indexes is None else indexes
+        records = patients.to_dict('records')
+
+        summary = pd.DataFrame({
+            'Фамилия': [records[i]['patient_lastname'] for i in indexes],
+            'Имя': [records[i]['patient_firstname'] for i in indexes],
+            'Отчество': [records[i]['patient_patrname'] for i in indexes],
+        })
+        for result in results:
+            summary[f"Полис ({result['source_db']})"] = [result['policies'][i] for i in indexes]
+        tables = {'Policy Info': summary}
+
+        for base_table in self.searcher.table_aliases:
+            rows = []
+            for i in indexes:
+                for result in results:
+                    for row in result['exportfiles'].get(base_table, {}).get(i, []):
+                        rows.append({'Пациент': self._patient_label(records[i]), 'Источник': result['source_db'],
+                                     **row})
+            tables[base_table] = pd.DataFrame(rows)
+        return tables
+
+    def save_consolidated(self, patients: pd.DataFrame, results: List[Dict], output_path: str):
+        """Сохраняет результаты всех пациентов в одну книгу"""
+        save_tables(output_path, self._build_tables(patients, results))
+        self.logger.info(f"Результаты пакетного поиска сохранены: {output_path}")
+
+    def save_per_patient(self, patients: pd.DataFrame, results: List[Dict], output_dir: str) -> List[str]:
+        """Сохраняет отдельную книгу для каждого найденного пациента, возвращает пути файлов"""
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        used = set()
+        records = patients.to_dict('records')
+        for i, patient in enumerate(records):
+            if not any(result['policies'][i] for result in results):
+                continue
+            label = self._patient_label(patient)
+            name = _UNSAFE_FILENAME.sub('', label).strip(' .').replace(' ', '_') or 'patient'
+            # Пациенты с тем же ФИО получают номер, иначе книги перезаписали бы друг друга
+            unique, number = name, 1
+            while unique.lower() in used:
+                number += 1
+                unique = f"{name}_{number}"
+            if number > 1:
+                self.logger.warning(f"Пациент {label} (строка {i + 1}) уже встречался, книга сохранена как {unique}")
+            used.add(unique.lower())
+            path = os.path.join(output_dir, f"{unique}_results.xlsx")
+            save_tables(path, self._build_tables(patients, results, [i]))
+            paths.append(path)
+        self.logger.info(f"Сохранено книг по пациентам: {len(paths)} в {output_dir}")
+        return paths
@@ -0,0 +1,481 @@
+"""Замер производительности сверки на синтетических реестрах.
+
+Генерирует каталоги реестров с той же структурой файлов, что и 12070709800161
+(C/D/E/I/L/M/N/O/P/R/U .DBF в cp866), загружает exportfilep/exportfileu в
+локальную базу SQLite и замеряет время и пиковую память стадий DBFMerger.
+
+Пример: python benchmark.py --scales 1000 10000 --engine batch
+
+С --check-imports вместо замера сверки проверяется время импорта точек
+входа (python -X importtime) и то, что они не загружают pandas и другие
+тяжелые модули при старте.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+import resource
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from config import main_query
+from dbf_columnar import read_dbf_columns, read_dbf_header
+from dbf_merger import DBFMerger
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '12070709800161')
+NAME_FIELDS = ('FIO', 'IMA', 'OTCH', 'FAMP', 'IMP', 'OTP')
+# Бюджет времени импорта точек входа в секундах (холодный интерпретатор, -X importtime)
+IMPORT_BUDGETS = {'dbf_merger_gui': 0.3, 'cli': 0.3}
+# Модули, которые точки входа загружают только при первом использовании
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'pymysql', 'dbfread')
+NAMES = ('ИВАНОВ', 'ПЕТРОВА', 'СИДОРОВ', 'КУЗНЕЦОВА', 'СМИРНОВ', 'ПОПОВА', 'ВАСИЛЬЕВ', 'НОВИКОВА')
+
+
+def _encode_column(values: np.ndarray, length: int, align_right: bool, encoding: str) -> np.ndarray:
+    """Строки фиксированной ширины поля как массив байт (n, length)"""
+    text = np.asarray(values, dtype=str).astype(f'U{length}')
+    text = np.char.rjust(text, length) if align_right else np.char.ljust(text, length)
+    return np.char.encode(text, encoding).astype(f'S{length}').view(np.uint8).reshape(len(text), length)
+
+
+def _random_values(field, count: int, rng: np.random.Generator) -> np.ndarray:
+    if field.type == 'C':
+        if field.name in NAME_FIELDS:
+            return rng.choice(np.array(NAMES), count)
+        return rng.integers(0, 10 ** min(field.length, 9), count).astype(str)
+    if field.type in 'NF':
+        digits = min(field.length - (field.decimal_count + 1 if field.decimal_count else 0), 9)
+        values = rng.integers(0, 10 ** max(digits - 1, 1), count)
+        return values / 10 ** field.decimal_count if field.decimal_count else values
+    if field.type == 'D':
+        return np.datetime64('2025-01-01') + rng.integers(0, 28, count)
+    return rng.choice(np.array(['T', 'F']), count)
+
+
+def _format_field(field, values: np.ndarray, encoding: str) -> np.ndarray:
+    if field.type in 'NF':
+        if field.decimal_count:
+            text = np.char.mod(f'%.{field.decimal_count}f', values.astype(float))
+        else:
+            text = values.astype(np.int64).astype(str)
+        return _encode_column(text, field.length, True, encoding)
+    if field.type == 'D':
+        text = np.char.replace(values.astype('datetime64[D]').astype(str), '-', '')
+        return _encode_column(text, field.length, False, encoding)
+    return _encode_column(values, field.length, False, encoding)
+
+
+def write_dbf_like(template_path: str, output_path: str, count: int, overrides: Dict[str, np.ndarray],
+                   rng: np.random.Generator, encoding: str = 'cp866', chunk_size: int = 100_000):
+    """Пишет DBF с заголовком (полями) шаблона и count записями.
+
+    Значения полей из overrides берутся как есть, остальные генерируются по типу поля.
+    """
+    with open(template_path, 'rb') as f:
+        header_data = f.read(65536)
+    header = read_dbf_header(header_data, encoding)
+    head = bytearray(header_data[:header.header_length])
+    head[4:8] = count.to_bytes(4, 'little')
+
+    with open(output_path, 'wb') as out:
+        out.write(head)
+        for start in range(0, count, chunk_size):
+            size = min(chunk_size, count - start)
+            records = np.full((size, header.record_length), 0x20, dtype=np.uint8)
+            for field in header.fields:
+                if field.name in overrides:
+                    values = np.asarray(overrides[field.name])[start:start + size]
+                else:
+                    values = _random_values(field, size, rng)
+                records[:, field.offset:field.offset + field.length] = _format_field(field, values, encoding)
+            out.write(records.tobytes())
+        out.write(b'\x1a')
+
+
+def generate_registry(output_dir: str, services: int, template_dir: str = TEMPLATE_DIR,
+                      services_per_patient: float = 2.0, seed: int = 0) -> str:
+    """Создает синтетический реестр из services услуг (строк U).
+
+    Файлы копируют структуру полей шаблонного каталога. Записи получают P
+    (пациенты) и U (услуги); остальные файлы, как и в шаблоне, пустые.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    patients = max(1, int(services / services_per_patient))
+
+    p_sn = np.arange(1, patients + 1)
+    p_dato = np.datetime64('2025-01-01') + rng.integers(0, 28, patients)
+    u_sn = np.sort(rng.integers(1, patients + 1, services))
+    overrides = {
+        'P': {
+            'NS': np.ones(patients, dtype=np.int64),
+            'SN': p_sn,
+            'SPN': (7_000_000_000_000_000 + p_sn).astype(str),
+            'DATN': p_dato,
+            'DATO': p_dato,
+        },
+        'U': {
+            'UID': np.arange(1, services + 1),
+            'NS': np.ones(services, dtype=np.int64),
+            'SN': u_sn,
+            'DATN': p_dato[u_sn - 1],
+            # Разные даты услуг одного пациента: пара SPN/DATO однозначно задает услугу
+            'DATO': p_dato[u_sn - 1] + (np.arange(services) - np.searchsorted(u_sn, u_sn)),
+        },
+    }
+    counts = {'P': patients, 'U': services}
+
+    # Файлы пишутся в алфавитном порядке, как они идут в реестре
+    for filename in sorted(os.listdir(template_dir)):
+        if not filename.upper().endswith('.DBF'):
+            continue
+        letter = filename[0].upper()
+        write_dbf_like(os.path.join(template_dir, filename), os.path.join(output_dir, filename),
+                       counts.get(letter, 0), overrides.get(letter, {}), rng)
+    return output_dir
+
+
+_SQLITE_TYPES = {'C': 'TEXT', 'D': 'DATE', 'L': 'INTEGER'}
+
+
+def load_stand_in_db(db_path: str, registry_dir: str, diff_rate: float = 0.01, missing_rate: float = 0.01,
+                     seed: int = 0) -> str:
+    """Загружает P и U реестра в SQLite как exportfilep/exportfileu.
+
+    Доля diff_rate услуг получает другое значение SUMM (различия при сверке),
+    доля missing_rate услуг не попадает в базу (ненайденные пары).
+    """
+    rng = np.random.default_rng(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    try:
+        for letter, table in (('P', 'exportfilep'), ('U', 'exportfileu')):
+            filename = next(name for name in os.listdir(registry_dir) if name.upper().startswith(letter)
+                            and name.upper().endswith('.DBF'))
+            path = os.path.join(registry_dir, filename)
+            with open(path, 'rb') as f:
+                fields = read_dbf_header(f.read(65536)).fields
+            columns = read_dbf_columns(path)
+            frame = pd.DataFrame(columns)
+
+            if table == 'exportfileu' and len(frame):
+                keep = rng.random(len(frame)) >= missing_rate
+                frame = frame[keep].copy()
+                changed = rng.random(len(frame)) < diff_rate
+                frame.loc[changed, 'SUMM'] = frame.loc[changed, 'SUMM'].astype(float) + 1
+
+            definitions = ', '.join(
+                f'"{field.name}" ' + (_SQLITE_TYPES.get(field.type)
+                                     or ('REAL' if field.decimal_count else 'INTEGER'))
+                for field in fields
+            )
+            connection.execute(f'CREATE TABLE {table} ({definitions})')
+            frame = frame.astype(object).where(frame.notna(), None)
+            for col in frame.columns:
+                if frame[col].map(lambda value: isinstance(value, datetime.date)).any():
+                    frame[col] = frame[col].map(lambda value: value.isoformat() if value else None)
+            placeholders = ', '.join(['?'] * len(frame.columns))
+            connection.executemany(f'INSERT INTO {table} VALUES ({placeholders})',
+                                   frame.itertuples(index=False, name=None))
+
+        connection.execute('CREATE INDEX exportfilep_spn ON exportfilep (SPN, NS)')
+        connection.execute('CREATE INDEX exportfileu_sn ON exportfileu (SN, NS)')
+        connection.commit()
+    finally:
+        connection.close()
+    return db_path
+
+
+class SQLiteQuery:
+    """Замена DBQuery на базе SQLite с тем же интерфейсом.
+
+    Плейсхолдеры pymysql (%s, %(name)s) переводятся в синтаксис sqlite3.
+    Как DictCursor, повторяющиеся колонки получают префикс псевдонима
+    таблицы - последнего JOIN запроса. database - путь к файлу SQLite.
+    """
+
+    _param_pattern = re.compile(r'%\((\w+)\)s|%s|%%')
+    _join_pattern = re.compile(r'JOIN\s+\S+\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+
+    def __init__(self, host: str = '', user: str = '', password: str = '', database: str = '',
+                 connect_timeout: Optional[int] = None, cache: Any = None, metrics: Any = None):
+        self.database = database
+        self.connection = None
+        self.should_stop = False
+        self.count_not_found = 0
+        self.logger = logging.getLogger('SQLiteQuery')
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
+
+    def connect(self) -> bool:
+        self.connection = sqlite3.connect(self.database, detect_types=sqlite3.PARSE_DECLTYPES,
+                                          check_same_thread=False)
+        return True
+
+    def disconnect(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def _translate(self, query: str) -> str:
+        def replace(match):
+            if match.group(0) == '%%':
+                return '%'
+            return f':{match.group(1)}' if match.group(1) else '?'
+        return self._param_pattern.sub(replace, query)
+
+    def _names(self, query: str, description) -> List[str]:
+        joins = self._join_pattern.findall(query)
+        alias = joins[-1] if joins else ''
+        names = []
+        for column in description:
+            name = column[0]
+            names.append(f'{alias}.{name}' if name in names and alias else name)
+        return names
+
+    def _execute(self, query: str, params):
+        cursor = self.connection.execute(self._translate(query), params or ())
+        return cursor, self._names(query, cursor.description or [])
+
+    def execute_query(self, query: str, params=None) -> Optional[List[Dict]]:
+        if self.should_stop:
+            return None
+        cursor, names = self._execute(query, params)
+        res = [dict(zip(names, row)) for row in cursor.fetchall()]
+        if not res:
+            self.count_not_found += 1
+        return res
+
+    def iter_query(self, query: str, params=None, fetch_size: int = 10000) -> Iterator[Dict]:
+        cursor, names = self._execute(query, params)
+        while not self.should_stop:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(names, row))
+
+    def stop(self):
+        self.should_stop = True
+
+    def get_not_found(self):
+        tmp = self.count_not_found
+        self.count_not_found = 0
+        return tmp
+
+
+sqlite3.register_converter('DATE', lambda value: datetime.date.fromisoformat(value.decode()))
+
+
+class _PeakRSS:
+    """Пиковый RSS процесса за время стадии по выборкам /proc/self/statm"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _current(self) -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # Без /proc доступен только общий максимум процесса
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+
+class StageTimer:
+    """Время, пиковый RSS и (по желанию) пик tracemalloc для каждой стадии"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: List[Dict] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: Optional[int] = None):
+        if self.trace_memory:
+            tracemalloc.start()
+        record = {'stage': name}
+        start = time.perf_counter()
+        with _PeakRSS() as rss:
+            yield record
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        record['peak_rss_mb'] = round(rss.peak / 2 ** 20, 1)
+        if self.trace_memory:
+            record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+        if rows is not None:
+            record.setdefault('rows', rows)
+        if record.get('rows') and record['seconds']:
+            record['rows_per_sec'] = round(record['rows'] / record['seconds'])
+        self.stages.append(record)
+
+
+def run_benchmark(services: int, workdir: str, engine: str = 'query', workers: int = 1,
+                  batch_size: int = 500, trace_memory: bool = False, keep_output: bool = False) -> List[Dict]:
+    """Один прогон на реестре из services услуг; возвращает замеры стадий"""
+    timer = StageTimer(trace_memory)
+    registry_dir = os.path.join(workdir, f'registry_{services}')
+    db_path = os.path.join(workdir, f'stand_in_{services}.sqlite')
+
+    with timer.stage('generate_registry', services):
+        generate_registry(registry_dir, services)
+    with timer.stage('load_stand_in_db', services):
+        load_stand_in_db(db_path, registry_dir)
+
+    merger = DBFMerger()
+    merger.db_query_class = SQLiteQuery
+    db_params = {
+        'host': '', 'user': '', 'password': '', 'database': db_path,
+        'sql_query': main_query, 'workers': workers, 'engine': 'snapshot' if engine == 'snapshot' else 'query',
+    }
+    if engine == 'batch':
+        db_params['batch_size'] = batch_size
+
+    status = 'ok'
+    with timer.stage('merge_dbf_files') as record:
+        dbf_df = merger.dbf_processor.merge_dbf_files(registry_dir)
+        record['rows'] = len(dbf_df)
+    if 'eu.DATO' not in dbf_df.columns:
+        logging.getLogger('benchmark').warning(
+            "В объединенных данных нет eu.DATO (порядок файлов в каталоге), стадии запросов будут пустыми")
+
+    with timer.stage('process_db_queries') as record:
+        db_df = merger.process_db_queries(dbf_df, db_params)
+        record['rows'] = 0 if db_df is None else len(db_df)
+        record['not_found'] = merger.get_not_found()
+
+    if db_df is None:
+        # Ошибка уже записана в лог DBFMerger; сравнивать не с чем
+        logging.getLogger('benchmark').error(f"{services} услуг: запросы к базе завершились ошибкой")
+        status = 'failed'
+    else:
+        with timer.stage('compare_results') as record:
+            try:
+                comparison = merger.comparator.compare_results_frame(dbf_df, db_df)
+            except (ValueError, KeyError):
+                comparison = pd.DataFrame(columns=['Type', 'Field', 'DBF_Value', 'DB_Value', 'Status'])
+            record['rows'] = len(comparison)
+            record['diffs'] = merger.comparator.get_count_compare()
+
+        output_path = os.path.join(workdir, f'comparison_{services}.xlsx')
+        with timer.stage('save_comparison', len(comparison)):
+            merger.comparator.save_comparison(comparison, output_path)
+        if not keep_output:
+            os.remove(output_path)
+
+    for record in timer.stages:
+        record.update(services=services, engine=engine, workers=workers, status=status)
+    return timer.stages
+
+
+def measure_import(module: str) -> Dict:
+    """Время импорта модуля в отдельном интерпретаторе и загруженные им тяжелые модули"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Не удалось импортировать {module}: {result.stderr.strip().splitlines()[-1]}")
+    seconds = None
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        loaded.add(name.strip().split('.')[0])
+        if name.strip() == module and not name.startswith('  '):
+            seconds = int(cumulative) / 1e6
+    return {'module': module, 'seconds': seconds, 'heavy': sorted(loaded & set(HEAVY_MODULES))}
+
+
+def check_imports(budgets: Dict[str, float] = IMPORT_BUDGETS) -> List[Dict]:
+    """Проверяет бюджеты времени импорта; ok = уложились и не загрузили тяжелые модули"""
+    records = []
+    for module, budget in budgets.items():
+        record = measure_import(module)
+        record['budget'] = budget
+        record['ok'] = record['seconds'] is not None and record['seconds'] <= budget and not record['heavy']
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер производительности сверки на синтетических реестрах")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000],
+                        help="Количество услуг в реестре (от 1000 до 1000000)")
+    parser.add_argument('--workdir', default=os.path.join('results', 'benchmark'))
+    parser.add_argument('--engine', choices=('query', 'batch', 'snapshot'), default='batch')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--trace-memory', action='store_true', help="Пик памяти Python по tracemalloc (медленнее)")
+    parser.add_argument('--keep-output', action='store_true', help="Не удалять файл сравнения")
+    parser.add_argument('--report', default=None, help="JSON с результатами (по умолчанию в workdir)")
+    parser.add_argument('--check-imports', action='store_true',
+                        help="Проверить время импорта GUI и CLI по IMPORT_BUDGETS и выйти")
+    args = parser.parse_args()
+
+    if args.check_imports:
+        records = check_imports()
+        for record in records:
+            heavy = f", загружены {', '.join(record['heavy'])}" if record['heavy'] else ''
+            print(f"{record['module']}: {record['seconds']:.3f} с (бюджет {record['budget']} с){heavy} - "
+                  f"{'OK' if record['ok'] else 'ПРЕВЫШЕН'}")
+        sys.exit(0 if all(record['ok'] for record in records) else 1)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    # Промежуточные файлы DBFMerger пишутся в results/ рабочего каталога
+    os.chdir(workdir)
+
+    results = []
+    for services in args.scales:
+        results.extend(run_benchmark(services, workdir, args.engine, args.workers, args.batch_size,
+                                     args.trace_memory, args.keep_output))
+
+    table = pd.DataFrame(results)
+    print(table.to_string(index=False))
+    report = args.report or os.path.join(workdir, 'benchmark.json')
+    with open(report, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Отчет: {report}")
+
+    failed = sorted({record['services'] for record in results if record['status'] != 'ok'})
+    if failed:
+        print(f"С ошибкой: {', '.join(map(str, failed))} услуг")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
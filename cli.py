@@ -0,0 +1,242 @@
+"""Сверка реестров DBF с базой из командной строки, без графического интерфейса.
+
+    python cli.py 12070709800161 16070709800200 --database s12 [--jobs 2] [--max-connections 8]
+    python cli.py --resume-from results --database s12
+
+Каталоги реестров обрабатываются параллельно (не больше --jobs сразу),
+общее число подключений к базе всех каталогов ограничено --max-connections.
+Результаты каждого каталога лежат в <results-dir>/<имя каталога>: промежуточные
+таблицы dbf_merged и db_results (Parquet, нужен pyarrow) и файл
+сравнения. Итоги по каталогам сохраняются в summary_<время>.json и .csv,
+метрики каждого каталога - в его каталоге результатов.
+
+--resume-from берет промежуточные таблицы прошлого запуска из
+<каталог>/<имя каталога реестра>: dbf_merged заменяет разбор DBF,
+db_results (если есть) - запросы к базе. Без каталогов реестров
+обрабатываются все подкаталоги --resume-from с dbf_merged.
+Excel-копии промежуточных таблиц пишутся только с --excel.
+
+--incremental хранит состояние сверки в <results-dir>/<имя>/incremental и при
+повторном запуске заново запрашивает и сравнивает только изменившиеся SN.
+--pipeline выполняет разбор DBF, запросы, сравнение и запись отчета
+одновременно, блоками; промежуточные таблицы при этом не сохраняются.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import main_query
+from metrics import Metrics
+
+# dbf_merger и intermediate (pandas, openpyxl, pymysql) импортируются внутри функций:
+# --help и ошибки аргументов не ждут их загрузки
+
+logger = logging.getLogger('CLI')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сверка реестров DBF с базой данных")
+    parser.add_argument('input_dirs', nargs='*', help="Каталоги реестров с DBF файлами")
+    parser.add_argument('--resume-from', metavar='DIR',
+                        help="Каталог результатов прошлого запуска: dbf_merged/db_results вместо разбора DBF и запросов")
+    parser.add_argument('--results-dir', default='results', help="Каталог результатов (по умолчанию results)")
+    parser.add_argument('--excel', action='store_true', help="Дополнительно сохранить промежуточные таблицы в Excel")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Пересчитывать только SN, изменившиеся с прошлого запуска в том же --results-dir")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Разбор DBF, запросы и сравнение одновременно, блоками (без промежуточных таблиц)")
+    parser.add_argument('--jobs', type=int, default=2, help="Каталогов, обрабатываемых одновременно")
+    parser.add_argument('--log-file', help="Писать лог в файл вместо консоли")
+
+    db = parser.add_argument_group("База данных")
+    db.add_argument('--host', default='kkoddb')
+    db.add_argument('--user', default='dbuser')
+    db.add_argument('--password', default=os.environ.get('DB_PASSWORD', 'dbpassword'),
+                    help="Пароль (по умолчанию из переменной DB_PASSWORD)")
+    db.add_argument('--database', required=True)
+    db.add_argument('--engine', choices=('auto', 'query', 'snapshot'), default='auto')
+    db.add_argument('--workers', type=int, default=1, help="Подключений к базе на один каталог")
+    db.add_argument('--max-connections', type=int,
+                    help="Общий предел подключений к базе всех каталогов (по умолчанию jobs * workers)")
+    db.add_argument('--async-queries', action='store_true',
+                    help="Запросы через asyncio (нужен aiomysql): много запросов в работе на --workers подключениях")
+    db.add_argument('--max-concurrency', type=int,
+                    help="С --async-queries: запросов, одновременно выполняемых на сервере (по умолчанию workers)")
+    db.add_argument('--batch-size', type=int, help="Пар SPN/DATO в одном пакетном запросе")
+    db.add_argument('--dbf-workers', type=int, help="Процессов для разбора DBF одного каталога")
+
+    parser.add_argument('--profile', action='store_true',
+                        help="cProfile и tracemalloc, отчеты в каталогах результатов (только с --jobs 1)")
+
+    args = parser.parse_args(argv)
+    if not args.input_dirs and not args.resume_from:
+        parser.error("нужны каталоги реестров или --resume-from")
+    for option in ('incremental', 'pipeline'):
+        if getattr(args, option) and (args.resume_from or not args.input_dirs):
+            parser.error(f"--{option} работает с каталогами реестров и без --resume-from")
+    if args.incremental and args.pipeline:
+        parser.error("--incremental и --pipeline нельзя использовать вместе")
+    return args
+
+
+def folder_name(input_dir: str) -> str:
+    return os.path.basename(os.path.normpath(input_dir))
+
+
+def list_folders(args: argparse.Namespace) -> List[Dict]:
+    """Каталоги для обработки: имя, каталог реестра (или None) и каталог прошлого запуска"""
+    from intermediate import find_frame
+    if args.input_dirs:
+        return [{
+            'name': folder_name(input_dir),
+            'input_dir': input_dir,
+            'resume_dir': os.path.join(args.resume_from, folder_name(input_dir)) if args.resume_from else None
+        } for input_dir in args.input_dirs]
+
+    return [{'name': name, 'input_dir': None, 'resume_dir': os.path.join(args.resume_from, name)}
+            for name in sorted(os.listdir(args.resume_from))
+            if find_frame(os.path.join(args.resume_from, name), 'dbf_merged')]
+
+
+def run_folder(folder: Dict, args: argparse.Namespace, db_params: Dict, profile: bool = False) -> Dict:
+    """Сверка одного каталога со своими метриками; возвращает строку итоговой сводки"""
+    from dbf_merger import DBFMerger
+    name = folder['name']
+    summary = {'folder': name, 'status': 'error', 'count_compare': 0, 'not_found': 0, 'seconds': 0.0,
+               'output': None}
+    start = time.perf_counter()
+    folder_metrics = Metrics()
+    merger = DBFMerger(metrics=folder_metrics)
+    merger.results_dir = os.path.join(args.results_dir, name)
+    merger.export_excel = args.excel
+
+    try:
+        with folder_metrics.run(name, profile=profile, trace_memory=profile, output_dir=merger.results_dir):
+            return _reconcile_folder(folder, args, merger, db_params, summary)
+    finally:
+        summary['count_compare'] = merger.get_count_compare()
+        summary['not_found'] = merger.get_not_found()
+        summary['seconds'] = round(time.perf_counter() - start, 2)
+        logger.info(f"{name}: {summary['status']}, различий {summary['count_compare']}, "
+                    f"не найдено {summary['not_found']}, {summary['seconds']} с")
+
+
+def _reconcile_folder(folder: Dict, args: argparse.Namespace, merger, db_params: Dict, summary: Dict) -> Dict:
+    name = folder['name']
+    try:
+        output_path = os.path.join(merger.results_dir, 'comparison_results.xlsx')
+        if args.incremental or args.pipeline:
+            logger.info(f"{name}: {'инкрементальная сверка' if args.incremental else 'сверка конвейером'}")
+            os.makedirs(merger.results_dir, exist_ok=True)
+            run_mode = merger.run_incremental if args.incremental else merger.run_pipeline
+            if run_mode(folder['input_dir'], db_params, output_path):
+                summary['status'] = 'ok'
+                summary['output'] = output_path
+            return summary
+
+        dbf_df = db_df = None
+        if folder['resume_dir']:
+            dbf_df = merger.load_intermediate('dbf_merged', folder['resume_dir'])
+            db_df = merger.load_intermediate('db_results', folder['resume_dir'])
+        if dbf_df is None:
+            if not folder['input_dir']:
+                logger.error(f"{name}: нет dbf_merged, а каталог реестра не указан")
+                return summary
+            logger.info(f"{name}: объединение DBF")
+            dbf_df = merger.process_dbf(folder['input_dir'], workers=args.dbf_workers)
+            if dbf_df is None:
+                return summary
+        if db_df is None:
+            logger.info(f"{name}: запросы к базе")
+            db_df = merger.process_db_queries(dbf_df, db_params)
+            if db_df is None:
+                return summary
+
+        # При продолжении с готовыми dbf_merged и db_results каталог результатов еще не создан
+        os.makedirs(merger.results_dir, exist_ok=True)
+        if merger.compare_and_save(dbf_df, db_df, output_path):
+            summary['status'] = 'ok'
+            summary['output'] = output_path
+        return summary
+    except Exception as e:
+        logger.error(f"{name}: ошибка сверки: {str(e)}")
+        return summary
+
+
+def save_summary(rows: List[Dict], results_dir: str) -> str:
+    """Сохраняет итоги по каталогам и общие суммы в summary_<время>.json и .csv"""
+    os.makedirs(results_dir, exist_ok=True)
+    totals = {
+        'folders': len(rows),
+        'failed': sum(row['status'] != 'ok' for row in rows),
+        'count_compare': sum(row['count_compare'] for row in rows),
+        'not_found': sum(row['not_found'] for row in rows),
+    }
+    base = os.path.join(results_dir, f"summary_{time.strftime('%Y%m%d_%H%M%S')}")
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump({'folders': rows, 'totals': totals}, f, ensure_ascii=False, indent=2)
+    with open(base + '.csv', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['folder', 'status', 'count_compare', 'not_found', 'seconds', 'output'])
+        writer.writeheader()
+        writer.writerows(rows)
+    logger.info(f"Каталогов: {totals['folders']}, с ошибками: {totals['failed']}, "
+                f"различий: {totals['count_compare']}, не найдено: {totals['not_found']}")
+    return base + '.json'
+
+
+def run(args: argparse.Namespace) -> bool:
+    folders = list_folders(args)
+    if not folders:
+        logger.error("Нет каталогов для обработки")
+        return False
+
+    jobs = max(1, min(args.jobs, len(folders)))
+    # cProfile видит только свой поток, tracemalloc общий на процесс: одновременные каталоги смешали бы отчеты
+    profile = args.profile and jobs == 1
+    if args.profile and not profile:
+        logger.warning("--profile работает только с --jobs 1, профилирование отключено")
+    max_connections = args.max_connections or jobs * max(1, args.workers)
+    if args.async_queries and max_connections < args.workers:
+        # Асинхронный каталог занимает все workers подключений сразу и ждал бы их бесконечно
+        logger.error(f"С --async-queries --max-connections ({max_connections}) "
+                     f"должно быть не меньше --workers ({args.workers})")
+        return False
+    db_params = {
+        'host': args.host,
+        'user': args.user,
+        'password': args.password,
+        'database': args.database,
+        'sql_query': main_query,
+        'engine': args.engine,
+        'workers': args.workers,
+        'batch_size': args.batch_size,
+        'async_queries': args.async_queries,
+        'max_concurrency': args.max_concurrency,
+        'dbf_workers': args.dbf_workers,
+        # Один семафор на все каталоги: подключений к базе не больше max_connections
+        'connection_limiter': threading.BoundedSemaphore(max_connections),
+    }
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='Folder') as executor:
+        rows = list(executor.map(lambda folder: run_folder(folder, args, db_params, profile), folders))
+
+    path = save_summary(rows, args.results_dir)
+    logger.info(f"Сводка сохранена: {path}")
+    return all(row['status'] == 'ok' for row in rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, filename=args.log_file,
+                        format='%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s')
+    return 0 if run(args) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
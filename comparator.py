@@ -1,14 +1,24 @@
+import operator
+import numpy as np
 import pandas as pd
 import logging
 from openpyxl.styles import PatternFill, Font
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.workbook import Workbook
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, Union
 from config import exclude_cols
+from excel_writer import ComparisonWriter
+from key_index import KeyIndex
+from metrics import Metrics, metrics as default_metrics
+
+# Поэлементные операции над object-массивами
+_is_str = np.frompyfunc(lambda value: isinstance(value, str), 1, 1)
+_is_empty = np.frompyfunc(operator.not_, 1, 1)
+_capitalize = np.frompyfunc(str.capitalize, 1, 1)
 
 
 class ResultComparator:
-    def __init__(self):
+    def __init__(self, metrics: Optional[Metrics] = None):
+        # Метрики прогона; по умолчанию общий сборщик
+        self.metrics = metrics or default_metrics
         # Стили для оформления
         self.diff_fill = PatternFill(
             start_color='CD5C5C',  # Красный для различий
@@ -33,78 +43,105 @@ class ResultComparator:
         self.header_font = Font(bold=True)
         self.logger = logging.getLogger('ResultComparator')
         self.count_compare = 0
+        self.last_row_number = 0
 
     def compare_results(self, dbf_df: pd.DataFrame, db_df: pd.DataFrame) -> List[Dict]:
         """Сравнивает два DataFrame по строкам с одинаковыми SPN и DATO"""
+        return self.compare_results_frame(dbf_df, db_df).to_dict('records')
+
+    def compare_results_frame(self, dbf_df: pd.DataFrame, db_df: pd.DataFrame, start_index: int = 0,
+                              with_keys: bool = False, dbf_index: Optional[KeyIndex] = None,
+                              db_index: Optional[KeyIndex] = None) -> pd.DataFrame:
+        """Сравнивает два DataFrame по строкам с одинаковыми SPN и DATO.
+
+        Результат - DataFrame с колонками Type, Field, DBF_Value, DB_Value, Status
+        в том же порядке строк, что и список из compare_results: для каждой пары
+        строк заголовок, строки по общим колонкам и разделитель. Нумерация строк
+        DBF в заголовках начинается с start_index + 1, количество сравненных
+        строк DBF сохраняется в last_row_number. При with_keys добавляется
+        колонка COMP_KEY с ключом блока для каждой строки. Готовые индексы ключей
+        можно передать в dbf_index и db_index; сами DataFrame не изменяются.
+        """
         # Находим общие колонки (без учета префиксов)
-        idx = 0
-
         common_columns = self._find_common_columns(dbf_df.columns, db_df.columns)
 
         if not common_columns:
             raise ValueError("Нет общих колонок для сравнения")
 
-        comparison_results = []
-
-        # Объединяем SPN и DATO для поиска пар
-        dbf_df['COMP_KEY'] = dbf_df['SPN'].astype(str) + '_' + dbf_df['eu.DATO'].astype(str)
-        db_df['COMP_KEY'] = db_df['SPN'].astype(str) + '_' + db_df['eu.DATO'].astype(str)
-
-        # Находим общие ключи
-        common_keys = set(dbf_df['COMP_KEY']).intersection(set(db_df['COMP_KEY']))
+        # Индексы по ключу SPN + DATO и все пары строк с общими ключами
+        if dbf_index is None:
+            dbf_index = KeyIndex.from_frame(dbf_df)
+        if db_index is None:
+            db_index = KeyIndex.from_frame(db_df)
+        dbf_pos, db_pos = dbf_index.join(db_index)
 
-        if not common_keys:
+        if not len(dbf_pos):
             raise ValueError("Нет строк с одинаковыми SPN и DATO")
 
-        for key in common_keys:
-            dbf_rows = dbf_df[dbf_df['COMP_KEY'] == key]
-            db_rows = db_df[db_df['COMP_KEY'] == key]
-            # Для каждой пары строк с одинаковыми SPN и DATO
-            for _, dbf_row in dbf_rows.iterrows():
-                idx +=1
-                for _, db_row in db_rows.iterrows():
-                    # Добавляем заголовок с SPN и DATO
-                    comparison_results.append({
-                        'Type': 'Header',
-                        'Field': f"{idx}. SPN: {dbf_row['SPN']}, DATO: {dbf_row['eu.DATO']}",
-                        'DBF_Value': '',
-                        'DB_Value': '',
-                        'Status': 'MATCH'
-                    })
-
-                    # Сравниваем общие колонки
-                    for col in common_columns:
-                        dbf_val = dbf_row[col] if col in dbf_row else None
-                        db_val = db_row[col] if col in db_row else None
-
-                        if isinstance(dbf_val, str) and isinstance(db_val, str):
-                            dbf_val = dbf_val.capitalize()
-                            db_val = db_val.capitalize()
-
-                        if dbf_val == db_val or (not dbf_val and not dbf_val) or (col in exclude_cols):
-                            status = 'MATCH'
-                        else:
-                            status = 'DIFF'
-                            self.count_compare += 1
-
-                        comparison_results.append({
-                            'Type': 'Data',
-                            'Field': col,
-                            'DBF_Value': dbf_val,
-                            'DB_Value': db_val,
-                            'Status': status
-                        })
-
-                    # Добавляем разделитель
-                    comparison_results.append({
-                        'Type': 'Separator',
-                        'Field': '---',
-                        'DBF_Value': '---',
-                        'DB_Value': '---',
-                        'Status': ''
-                    })
-
-        return comparison_results
+        # Порядок как при переборе по ключам: группа ключа, внутри - строки DBF, затем строки DB
+        row_numbers = pd.factorize(dbf_pos)[0] + 1 + start_index
+        self.last_row_number = int(row_numbers[-1])
+
+        count = len(dbf_pos)
+        block = len(common_columns) + 2
+        types = np.full(count * block, 'Data', dtype=object)
+        fields = np.empty(count * block, dtype=object)
+        dbf_values = np.empty(count * block, dtype=object)
+        db_values = np.empty(count * block, dtype=object)
+        statuses = np.empty(count * block, dtype=object)
+
+        # Заголовок с SPN и DATO
+        spns = dbf_df['SPN'].to_numpy(dtype=object)[dbf_pos]
+        datos = dbf_df['eu.DATO'].to_numpy(dtype=object)[dbf_pos]
+        types[0::block] = 'Header'
+        fields[0::block] = [f"{idx}. SPN: {spn}, DATO: {dato}" for idx, spn, dato in zip(row_numbers, spns, datos)]
+        dbf_values[0::block] = ''
+        db_values[0::block] = ''
+        statuses[0::block] = 'MATCH'
+
+        # Сравниваем общие колонки целиком
+        for offset, col in enumerate(common_columns, 1):
+            dbf_col = dbf_df[col].to_numpy(dtype=object)[dbf_pos]
+            db_col = db_df[col].to_numpy(dtype=object)[db_pos]
+
+            both_str = _is_str(dbf_col).astype(bool) & _is_str(db_col).astype(bool)
+            if both_str.any():
+                dbf_col[both_str] = _capitalize(dbf_col[both_str])
+                db_col[both_str] = _capitalize(db_col[both_str])
+
+            if col in exclude_cols:
+                match = np.ones(count, dtype=bool)
+            else:
+                match = (dbf_col == db_col).astype(bool) | _is_empty(dbf_col).astype(bool)
+            self.count_compare += int(count - match.sum())
+
+            fields[offset::block] = col
+            dbf_values[offset::block] = dbf_col
+            db_values[offset::block] = db_col
+            statuses[offset::block] = np.where(match, 'MATCH', 'DIFF')
+
+        # Разделитель
+        types[block - 1::block] = 'Separator'
+        fields[block - 1::block] = '---'
+        dbf_values[block - 1::block] = '---'
+        db_values[block - 1::block] = '---'
+        statuses[block - 1::block] = ''
+
+        result = pd.DataFrame({
+            'Type': types,
+            'Field': fields,
+            'DBF_Value': dbf_values,
+            'DB_Value': db_values,
+            'Status': statuses
+        })
+        if with_keys:
+            result['COMP_KEY'] = np.repeat(dbf_index.row_keys(dbf_pos), block)
+        return result
+
+    @staticmethod
+    def make_keys(df: pd.DataFrame) -> pd.Series:
+        """Ключ сравнения строки: SPN и DATO через подчеркивание"""
+        return KeyIndex.make_keys(df)
 
     def get_count_compare(self):
         tmp = self.count_compare
@@ -112,71 +149,43 @@ class ResultComparator:
         return tmp
 
     def _find_common_columns(self, cols1: List[str], cols2: List[str]) -> List[str]:
-        """Находит общие колонки"""
-        # Удаляем префиксы (DBF_, DB_ и т.д.)
-        base_cols1 = {col for col in cols1}
-        base_cols2 = {col for col in cols2}
+        """Находит общие колонки в порядке колонок первой таблицы"""
+        # Порядок не зависит от хэширования строк: отчеты разных запусков совпадают
+        base_cols2 = set(cols2)
 
-        return list(base_cols1 & base_cols2)
+        return list(dict.fromkeys(col for col in cols1 if col in base_cols2))
 
-    def save_comparison(self, comparison_data: List[Dict], output_path: str):
-        """Сохраняет сравнение с подсветкой различий"""
+    def save_comparison(self, comparison_data: Union[Iterable[Dict], pd.DataFrame], output_path: str):
+        """Сохраняет сравнение с подсветкой различий.
+
+        Строки пишутся потоково, поэтому comparison_data может быть генератором.
+        """
         try:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Comparison Results"
-
-            # Заголовки
-            headers = ['Field', 'DBF_Value', 'DB_Value', 'Status']
-            ws.append(headers)
-
-            # Форматируем заголовки
-            for cell in ws[1]:
-                cell.fill = self.header_fill
-                cell.font = self.header_font
-
-            # Записываем данные
-            for row_data in comparison_data:
-                if row_data['Type'] == 'Separator':
-                    ws.append(['---'] * 4)
-                    continue
-
-                row = [
-                    row_data['Field'],
-                    row_data['DBF_Value'],
-                    row_data['DB_Value'],
-                    row_data['Status']
-                ]
-                ws.append(row)
-
-                # Форматируем строки
-                current_row = ws.max_row
-
-                if row_data['Type'] == 'Header':
-                    for cell in ws[current_row]:
-                        cell.font = self.header_font
-                elif row_data['Status'] == 'DIFF':
-                    for cell in ws[current_row]:
-                        cell.fill = self.diff_fill
+            with self.metrics.stage('excel_comparison') as stage, self.open_writer(output_path) as writer:
+                if isinstance(comparison_data, pd.DataFrame):
+                    for row in zip(comparison_data['Type'], comparison_data['Field'], comparison_data['DBF_Value'],
+                                   comparison_data['DB_Value'], comparison_data['Status']):
+                        writer.write(*row)
+                    rows = len(comparison_data)
                 else:
-                    ws.cell(row=current_row, column=2).fill = self.dbf_fill
-                    ws.cell(row=current_row, column=3).fill = self.db_fill
-
-            for column in ws.columns:
-                max_length = 0
-                column_cells = [cell for cell in column]
-                for cell in column_cells:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2) * 1.2
-                ws.column_dimensions[column_cells[0].column_letter].width = adjusted_width
-
-            wb.save(output_path)
+                    rows = 0
+                    for row_data in comparison_data:
+                        writer.write_record(row_data)
+                        rows += 1
+                stage['rows'] = rows
             self.logger.info(f"Файл сравнения сохранен: {output_path}")
 
         except Exception as e:
             self.logger.error(f"Ошибка сохранения сравнения: {str(e)}")
             raise
+
+    def open_writer(self, output_path: str) -> ComparisonWriter:
+        """Создает потоковый writer с общими стилями сравнения"""
+        return ComparisonWriter(
+            output_path,
+            header_fill=self.header_fill,
+            header_font=self.header_font,
+            diff_fill=self.diff_fill,
+            dbf_fill=self.dbf_fill,
+            db_fill=self.db_fill
+        )
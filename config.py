@@ -19,4 +19,73 @@ client_policy_query = """
 
 exportfile_query = """
                       SELECT * FROM exportfile tbl WHERE {col} = '{value}'
-                    """
\ No newline at end of file
+                    """
+
+""" Пакетный вариант main_query: ищет сразу блок пар SPN/DATO. Вместо {SPN_LIST} и {DATO_LIST}
+ подставляются списки плейсхолдеров %s, значения передаются параметрами запроса """
+batch_query = """
+                SELECT ep.*, eu.* FROM exportfilep ep
+                JOIN (SELECT SPN, MAX(NS) AS MAX_NS FROM exportfilep
+                      WHERE SPN IN ({SPN_LIST}) GROUP BY SPN) mx
+                  ON ep.SPN = mx.SPN AND ep.NS = mx.MAX_NS
+                JOIN exportfileu eu ON ep.SN = eu.SN AND eu.NS = mx.MAX_NS
+                WHERE eu.DATO IN ({DATO_LIST})
+              """
+
+""" Количество пар SPN/DATO в одном пакетном запросе """
+batch_size = 500
+
+""" Запросы режима снимка: строки exportfilep с максимальным NS читаются блоками SPN, exportfileu - по списку NS.
+ Вместо {SPN_LIST} и {NS_LIST} подставляются списки плейсхолдеров %s """
+snapshot_p_query = """
+                      SELECT ep.* FROM exportfilep ep
+                      JOIN (SELECT SPN, MAX(NS) AS MAX_NS FROM exportfilep
+                            WHERE SPN IN ({SPN_LIST}) GROUP BY SPN) mx
+                        ON ep.SPN = mx.SPN AND ep.NS = mx.MAX_NS
+                   """
+
+snapshot_u_query = """
+                      SELECT * FROM exportfileu WHERE NS IN ({NS_LIST})
+                   """
+
+""" Число пар SPN/DATO, начиная с которого main_query заменяется локальным снимком таблиц """
+snapshot_threshold = 20000
+
+""" Пакетный поиск пациентов: полисы всех пациентов с фамилиями из списка {LASTNAME_LIST} """
+client_policy_batch_query = """
+                              SELECT Client.lastName, Client.firstName, Client.patrName, cp.number
+                              FROM ClientPolicy cp
+                              JOIN Client ON cp.client_id = Client.id
+                              WHERE Client.deleted = 0 AND cp.deleted = 0
+                              AND Client.lastName IN ({LASTNAME_LIST})
+                            """
+
+""" Строки exportfile* сразу для списка значений колонки {col}. Вариант _latest оставляет
+ для каждого значения только строки с максимальным NS (как поиск одного пациента в s12) """
+exportfile_batch_query = """
+                            SELECT tbl.* FROM exportfile tbl WHERE tbl.{col} IN ({VALUE_LIST})
+                         """
+
+exportfile_batch_latest_query = """
+                                   SELECT tbl.* FROM exportfile tbl
+                                   JOIN (SELECT {col}, MAX(NS) AS MAX_NS FROM exportfile
+                                         WHERE {col} IN ({VALUE_LIST}) GROUP BY {col}) mx
+                                     ON tbl.{col} = mx.{col} AND tbl.NS = mx.MAX_NS
+                                """
+
+""" Сколько секунд хранится прочитанная из information_schema структура базы """
+schema_cache_ttl = 3600
+
+""" Альтернативные названия таблиц exportfile* (например, в базах-снимках) """
+alternative_table_aliases = {
+    'exportfilep': ['vasP'],
+    'exportfileu': ['`123`'],
+    'exportfileo': ['vasO'],
+    'exportfilel': ['vasL']
+}
+
+""" Базы с заранее известными названиями таблиц: для них структура базы не читается.
+ Остальные базы (в том числе новые снимки) получают названия по information_schema """
+database_table_aliases = {
+    's12pays202504041322': alternative_table_aliases
+}
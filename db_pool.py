@@ -0,0 +1,148 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+from db_query import DBQuery
+
+
+class DBQueryPool:
+    """Пул из нескольких подключений DBQuery с параллельным выполнением задач.
+
+    Каждый рабочий поток держит собственное подключение. Задачи ставятся в
+    ограниченную очередь, результаты возвращаются в порядке постановки.
+    Класс подключения задается query_class (по умолчанию DBQuery).
+    Поток, который не смог подключиться, не берет задач: очередь разбирают
+    подключившиеся потоки, а если не подключился ни один, map() прерывается
+    с ConnectionError.
+    """
+
+    def __init__(self, host: str, user: str, password: str, database: str,
+                 workers: int = 8, max_pending: Optional[int] = None, query_class: Type[DBQuery] = DBQuery,
+                 **db_kwargs):
+        self.connection_args = dict(host=host, user=user, password=password, database=database, **db_kwargs)
+        self.query_class = query_class
+        self.workers = max(1, int(workers))
+        self.max_pending = max_pending or self.workers * 4
+        self.should_stop = False
+        self.logger = logging.getLogger('DBQueryPool')
+        self._tasks = queue.Queue(maxsize=self.max_pending)
+        self._threads: List[threading.Thread] = []
+        self._db_queries: List[DBQuery] = []
+        self._lock = threading.Lock()
+        self.failed_workers = 0
+        self._no_connections = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'DBQueryPool-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self):
+        # Задачи, оставшиеся после ошибки подключения, уже никто не ждет
+        while True:
+            try:
+                self._tasks.get_nowait()
+            except queue.Empty:
+                break
+        for thread in self._threads:
+            if thread.is_alive():
+                self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self):
+        db_query = self.query_class(**self.connection_args)
+        db_query.should_stop = self.should_stop
+        # Регистрируем до подключения, чтобы stop() прервал и ожидание общего лимита подключений
+        with self._lock:
+            self._db_queries.append(db_query)
+        # После stop() поток без подключения все равно разбирает очередь: задачи вернут None
+        if not db_query.connect() and not self.should_stop:
+            db_query.disconnect()
+            self._connect_failed()
+            return
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                idx, func, item, results = task
+                result = None
+                if not self.should_stop:
+                    try:
+                        result = func(db_query, item)
+                    except Exception as e:
+                        self.logger.error(f"Ошибка выполнения задачи: {str(e)}")
+                results.put((idx, result))
+        finally:
+            db_query.disconnect()
+
+    def _connect_failed(self):
+        with self._lock:
+            self.failed_workers += 1
+            failed = self.failed_workers
+        self.logger.error(f"Поток пула не подключился к базе ({failed} из {self.workers})")
+        if failed == self.workers:
+            self._no_connections.set()
+
+    def map(self, func: Callable[[DBQuery, Any], Any], items: Iterable) -> Iterator:
+        """Выполняет func(db_query, item) для каждого элемента, отдавая результаты по порядку.
+
+        После stop() новые задачи не ставятся, а уже поставленные возвращают None.
+        """
+        items = iter(items)
+        results = queue.Queue()
+        ready = {}
+        submitted = 0
+        next_idx = 0
+        exhausted = False
+
+        while True:
+            while not exhausted and not self.should_stop and submitted - next_idx < self.max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self._tasks.put((submitted, func, item, results))
+                submitted += 1
+
+            if next_idx == submitted:
+                break
+
+            idx, result = self._next_result(results)
+            ready[idx] = result
+            while next_idx in ready:
+                yield ready.pop(next_idx)
+                next_idx += 1
+
+    def _next_result(self, results: queue.Queue) -> Tuple[int, Any]:
+        while True:
+            try:
+                return results.get(timeout=0.5)
+            except queue.Empty:
+                if self._no_connections.is_set():
+                    raise ConnectionError("Ни один поток пула не подключился к базе")
+
+    def execute_many(self, queries: Iterable[Tuple[str, Optional[tuple]]]) -> Iterator[Optional[List[Dict]]]:
+        """Параллельно выполняет запросы (query, params), результаты отдаются в порядке запросов"""
+        return self.map(lambda db_query, item: db_query.execute_query(*item), queries)
+
+    def stop(self):
+        self.should_stop = True
+        with self._lock:
+            for db_query in self._db_queries:
+                db_query.stop()
+
+    def get_not_found(self):
+        with self._lock:
+            return sum(db_query.get_not_found() for db_query in self._db_queries)
@@ -1,11 +1,59 @@
+import re
+import threading
+import time
 import pymysql
 from pymysql import Error
 import logging
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import Any, Iterator, List, Dict, Optional, Tuple, Union
+from query_cache import QueryCache
+from metrics import Metrics, metrics as default_metrics
+
+
+class QueryTemplate:
+    """Шаблон запроса из config.py, скомпилированный в параметризованный SQL.
+
+    Плейсхолдеры вида {SPN} или '{SPN}' (вместе с кавычками) превращаются в
+    именованные параметры %(SPN)s, значения экранирует драйвер. Плейсхолдеры,
+    переданные в identifiers (имена колонок вроде {col}), подставляются в текст,
+    так как идентификаторы нельзя передать параметром.
+    """
+    placeholder_pattern = re.compile(r"(['\"]?)\{([\w.]+)\}\1")
+
+    def __init__(self, template: str, identifiers: Optional[Dict[str, str]] = None):
+        identifiers = identifiers or {}
+        self.names: List[str] = []
+
+        def replace(match):
+            quote, name = match.group(1), match.group(2)
+            if name in identifiers:
+                return f"{quote}{identifiers[name]}{quote}"
+            if name not in self.names:
+                self.names.append(name)
+            return f"%({name})s"
+
+        # Литеральные % в шаблоне должны пережить подстановку параметров драйвером
+        self.sql = self.placeholder_pattern.sub(replace, template.replace('%', '%%'))
+
+    def bind(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Параметры запроса; отсутствующее значение - ошибка, как и при ручной подстановке"""
+        return {name: values[name] for name in self.names}
+
+
+@lru_cache(maxsize=256)
+def _compile_query(template: str, identifiers: Tuple[Tuple[str, str], ...]) -> QueryTemplate:
+    return QueryTemplate(template, dict(identifiers))
+
+
+def compile_query(template: str, **identifiers: str) -> QueryTemplate:
+    """Компилирует шаблон один раз; повторные вызовы с теми же аргументами берут его из кэша"""
+    return _compile_query(template, tuple(sorted(identifiers.items())))
 
 
 class DBQuery:
-    def __init__(self, host: str, user: str, password: str, database: str):
+    def __init__(self, host: str, user: str, password: str, database: str, connect_timeout: Optional[int] = None,
+                 cache: Optional[QueryCache] = None, limiter: Optional[threading.Semaphore] = None,
+                 metrics: Optional[Metrics] = None):
         self.connection_params = {
             'host': host,
             'user': user,
@@ -14,10 +62,17 @@ class DBQuery:
             'charset': 'utf8mb4',
             'cursorclass': pymysql.cursors.DictCursor
         }
+        if connect_timeout:
+            self.connection_params['connect_timeout'] = connect_timeout
         self.connection = None
         self.should_stop = False
         self.logger = logging.getLogger('DBQuery')
         self.count_not_found = 0
+        self.cache = cache
+        # Общее ограничение числа одновременных подключений (например, на все каталоги cli.py)
+        self.limiter = limiter
+        self._holds_limiter = False
+        self.metrics = metrics or default_metrics
 
     def __enter__(self):
         self.connect()
@@ -27,32 +82,109 @@ class DBQuery:
         self.disconnect()
 
     def connect(self) -> bool:
+        if self.limiter and not self._acquire_limiter():
+            return False
         try:
             self.connection = pymysql.connect(**self.connection_params)
             return True
         except Error as e:
             self.logger.error(f"Ошибка подключения: {str(e)}")
+            self._release_limiter()
             return False
 
     def disconnect(self):
         if self.connection and self.connection.open:
             self.connection.close()
+        self._release_limiter()
+
+    def _acquire_limiter(self) -> bool:
+        """Ждет свободного места в limiter; False, если за это время запросы остановлены"""
+        while not self.limiter.acquire(timeout=0.5):
+            if self.should_stop:
+                return False
+        self._holds_limiter = True
+        return True
+
+    def _release_limiter(self):
+        if self._holds_limiter:
+            self._holds_limiter = False
+            self.limiter.release()
 
     def execute_query(self, query: str, params: tuple = None) -> Optional[List[Dict]]:
         if self.should_stop:
             return None
 
+        if self.cache:
+            cached = self._cache_get(query, params)
+            if cached is not None:
+                if not cached:
+                    self.count_not_found += 1
+                return cached
+
         try:
+            start = time.perf_counter()
             with self.connection.cursor() as cursor:
                 cursor.execute(query, params)
                 res = cursor.fetchall()
+                self.metrics.observe('db_query', time.perf_counter() - start)
                 if not res:
                     self.count_not_found += 1
+                if self.cache:
+                    self._cache_put(query, params, list(res))
                 return res
         except Error as e:
             self.logger.error(f"Ошибка выполнения запроса: {str(e)}")
             return None
 
+    def _cache_get(self, query: str, params: tuple) -> Optional[List[Dict]]:
+        """Читает результат из кэша; ошибка кэша (например, блокировка SQLite) считается промахом"""
+        try:
+            return self.cache.get(self.connection_params['database'], query, params)
+        except Exception as e:
+            self.logger.warning(f"Ошибка чтения кэша запросов: {str(e)}")
+            return None
+
+    def _cache_put(self, query: str, params: tuple, rows: List[Dict]):
+        """Сохраняет результат в кэш; ошибка кэша не отменяет полученный из базы результат"""
+        try:
+            self.cache.put(self.connection_params['database'], query, params, rows)
+        except Exception as e:
+            self.logger.warning(f"Ошибка записи в кэш запросов: {str(e)}")
+
+    def iter_query(self, query: str, params: tuple = None, fetch_size: int = 10000) -> Iterator[Dict]:
+        """Построчно отдает результат большого запроса.
+
+        Используется небуферизованный курсор SSDictCursor: строки читаются с
+        сервера порциями по fetch_size, а не загружаются в память целиком.
+        Кэш не используется. Ошибка запроса пробрасывается, так как неполный
+        результат нельзя отличить от полного.
+        """
+        if self.should_stop:
+            return
+        try:
+            with self.connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+                cursor.execute(query, params)
+                while not self.should_stop:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    yield from rows
+        except Error as e:
+            self.logger.error(f"Ошибка выполнения потокового запроса: {str(e)}")
+            raise
+
+    def execute_prepared(self, template: Union[str, QueryTemplate], values: Dict[str, Any],
+                         **identifiers: str) -> Optional[List[Dict]]:
+        """Выполняет шаблон запроса с привязанными параметрами.
+
+        pymysql не поддерживает серверные подготовленные выражения, поэтому
+        шаблон компилируется один раз на клиенте, а значения передаются
+        драйверу параметрами и экранируются им.
+        """
+        if not isinstance(template, QueryTemplate):
+            template = compile_query(template, **identifiers)
+        return self.execute_query(template.sql, template.bind(values))
+
     def stop(self):
         self.should_stop = True
 
@@ -0,0 +1,226 @@
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, NamedTuple
+import numpy as np
+
+
+class UnsupportedDBF(ValueError):
+    """Файл нельзя разобрать быстрым путем (тип поля или кодировка), нужен dbfread"""
+
+
+class DBFField(NamedTuple):
+    name: str
+    type: str
+    length: int
+    decimal_count: int
+    offset: int
+
+
+class DBFHeader(NamedTuple):
+    numrecords: int
+    header_length: int
+    record_length: int
+    fields: List[DBFField]
+
+
+SUPPORTED_TYPES = 'CNFDL'
+
+
+def read_dbf_header(data, encoding: str = 'cp866') -> DBFHeader:
+    """Разбирает заголовок dBase III/IV и описания полей"""
+    if len(data) < 32:
+        raise UnsupportedDBF("Слишком короткий заголовок DBF")
+
+    numrecords, header_length, record_length = struct.unpack('<IHH', data[4:12])
+    fields = []
+    # Первый байт записи - признак удаления
+    offset = 1
+    pos = 32
+    while pos + 32 <= min(header_length, len(data)) and data[pos] != 0x0D:
+        descriptor = bytes(data[pos:pos + 32])
+        name = descriptor[:11].split(b'\0')[0].decode(encoding)
+        field_type = chr(descriptor[11])
+        length, decimal_count = descriptor[16], descriptor[17]
+        fields.append(DBFField(name, field_type, length, decimal_count, offset))
+        offset += length
+        pos += 32
+
+    return DBFHeader(numrecords, header_length, record_length, fields)
+
+
+def _decode_table(encoding: str) -> np.ndarray:
+    """Таблица байт -> код символа для однобайтовой кодировки"""
+    decoded = bytes(range(256)).decode(encoding, errors='replace')
+    if len(decoded) != 256:
+        raise UnsupportedDBF(f"Кодировка {encoding} не однобайтовая")
+    return np.array([ord(char) for char in decoded], dtype=np.uint32)
+
+
+def _trailing(mask: np.ndarray) -> np.ndarray:
+    """Отмечает хвостовые позиции строк, где mask истинна до самого конца"""
+    return np.flip(np.logical_and.accumulate(np.flip(mask, axis=1), axis=1), axis=1)
+
+
+def _parse_char(block: np.ndarray, table: np.ndarray) -> np.ndarray:
+    codes = table[block]
+    # Как dbfread: отрезаем хвостовые пробелы и нулевые байты
+    codes[_trailing((block == 0x20) | (block == 0))] = 0
+    return np.ascontiguousarray(codes).view(f'<U{block.shape[1]}').reshape(len(block))
+
+
+def _parse_numeric(block: np.ndarray, decimal_count: int) -> np.ndarray:
+    raw = np.ascontiguousarray(block).view(f'S{block.shape[1]}').reshape(len(block))
+    data = np.char.strip(np.char.strip(raw), b'*')
+    empty = data == b''
+
+    try:
+        if decimal_count == 0:
+            values = data[~empty].astype(np.int64)
+        else:
+            # dbfread возвращает int для значения без дробной части и в поле с decimal_count > 0
+            integral = np.ones(len(data), dtype=bool)
+            for mark in (b'.', b',', b'e', b'E'):
+                integral &= np.char.find(data, mark) < 0
+            if (integral & ~empty).any():
+                raise ValueError("Целые значения в поле с дробной частью")
+            values = np.char.replace(data[~empty], b',', b'.').astype(np.float64)
+    except ValueError:
+        return np.array([_parse_numeric_value(value) for value in data], dtype=object)
+
+    if not empty.any():
+        return values
+    result = np.full(len(data), None, dtype=object)
+    result[~empty] = values.tolist()
+    return result
+
+
+def _parse_numeric_value(data: bytes):
+    try:
+        return int(data)
+    except ValueError:
+        if not data.strip():
+            return None
+        return float(data.replace(b',', b'.'))
+
+
+def _parse_date(block: np.ndarray) -> np.ndarray:
+    digits = block.astype(np.int64) - ord('0')
+    is_digits = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    weights = np.array([1000, 100, 10, 1, 10, 1, 10, 1])
+    parts = np.where(is_digits[:, None], digits, 0) * weights
+    year = parts[:, 0:4].sum(axis=1)
+    month = parts[:, 4:6].sum(axis=1)
+    day = parts[:, 6:8].sum(axis=1)
+
+    valid = is_digits & (year > 0) & (month >= 1) & (month <= 12) & (day >= 1)
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.where(valid, day - 1, 0)
+    valid &= dates.astype('datetime64[M]') == months
+
+    # Пустые даты (пробелы и нули) dbfread возвращает как None, остальное - ошибка
+    blank = ((block == 0x20) | (block == ord('0')) | (block == 0)).all(axis=1)
+    if (~valid & ~blank).any():
+        raise ValueError(f"invalid date {bytes(block[~valid & ~blank][0])!r}")
+
+    if valid.all():
+        return dates.astype(object)
+    result = np.full(len(block), None, dtype=object)
+    result[valid] = dates[valid].astype(object)
+    return result
+
+
+def _parse_logical(block: np.ndarray) -> np.ndarray:
+    data = block[:, 0]
+    result = np.full(len(data), None, dtype=object)
+    result[np.isin(data, list(b'TtYy'))] = True
+    result[np.isin(data, list(b'FfNn'))] = False
+    if not np.isin(data, list(b'TtYyFfNn? ')).all():
+        raise ValueError("Недопустимое значение логического поля")
+    return result
+
+
+def _decode_chunk(raw: np.ndarray, fields: List[DBFField], table: np.ndarray) -> Dict[str, np.ndarray]:
+    # Удаленные записи помечены '*', живые - пробелом
+    records = raw[raw[:, 0] == 0x20]
+    columns = {}
+    for field in fields:
+        block = records[:, field.offset:field.offset + field.length]
+        if field.type == 'C':
+            columns[field.name] = _parse_char(block, table)
+        elif field.type in 'NF':
+            columns[field.name] = _parse_numeric(block, field.decimal_count)
+        elif field.type == 'D':
+            columns[field.name] = _parse_date(block)
+        else:
+            columns[field.name] = _parse_logical(block)
+    return columns
+
+
+def iter_dbf_columns(filepath: str, encoding: str = 'cp866', chunk_size: int = 65536) -> Iterator[Dict[str, np.ndarray]]:
+    """Читает DBF файл блоками по chunk_size записей, отдавая колонки NumPy-массивами.
+
+    Значения совпадают с тем, что возвращает dbfread: строки без хвостовых
+    пробелов, int/float для N, datetime.date для D, bool для L, None для пустых.
+    Колонка без пустых значений имеет собственный dtype, иначе - object.
+    Заголовок проверяется до первого блока: при неподдерживаемых полях или
+    кодировке сразу выбрасывается UnsupportedDBF.
+    """
+    table = _decode_table(encoding)
+
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise UnsupportedDBF("Пустой файл")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = read_dbf_header(mm, encoding)
+            unsupported = [field.name for field in header.fields if field.type not in SUPPORTED_TYPES]
+            if unsupported:
+                raise UnsupportedDBF(f"Неподдерживаемые типы полей: {', '.join(unsupported)}")
+            if header.record_length < 1 + sum(field.length for field in header.fields):
+                raise UnsupportedDBF("Длина записи меньше суммы длин полей")
+
+            total = max(0, (len(mm) - header.header_length) // header.record_length)
+            # Записи заканчиваются на маркере конца файла 0x1A
+            if total:
+                marks = np.frombuffer(mm, dtype=np.uint8, count=total * header.record_length,
+                                      offset=header.header_length)[::header.record_length]
+                eof = np.flatnonzero(marks == 0x1A)
+                if len(eof):
+                    total = int(eof[0])
+                del marks
+
+            for start in range(0, total, chunk_size):
+                count = min(chunk_size, total - start)
+                raw = np.frombuffer(mm, dtype=np.uint8, count=count * header.record_length,
+                                    offset=header.header_length + start * header.record_length)
+                raw = raw.reshape(count, header.record_length)
+                columns = _decode_chunk(raw, header.fields, table)
+                del raw
+                yield columns
+
+            if total == 0:
+                yield {field.name: np.empty(0, dtype=object) for field in header.fields}
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                # На отображение еще ссылается массив из прерванного блока, его закроет сборщик мусора
+                pass
+
+
+def read_dbf_columns(filepath: str, encoding: str = 'cp866') -> Dict[str, np.ndarray]:
+    """Читает DBF файл целиком в словарь колонок"""
+    chunks = list(iter_dbf_columns(filepath, encoding))
+    if len(chunks) == 1:
+        return chunks[0]
+    return {
+        name: _concat([chunk[name] for chunk in chunks])
+        for name in chunks[0]
+    }
+
+
+def _concat(arrays: List[np.ndarray]) -> np.ndarray:
+    if len({array.dtype for array in arrays}) == 1:
+        return np.concatenate(arrays)
+    return np.concatenate([array.astype(object) for array in arrays])
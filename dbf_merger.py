@@ -1,34 +1,84 @@
+import numpy as np
 import pandas as pd
 import logging
 import os
-from typing import Dict, Optional, Callable
+import queue
+import threading
+from typing import Dict, List, Optional, Callable, Tuple
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 from dbf_processor import DBFProcessor
-from db_query import DBQuery
+from db_query import DBQuery, compile_query
+from db_pool import DBQueryPool
 from comparator import ResultComparator
+from query_cache import QueryCache
+from incremental import IncrementalState
+from key_index import KeyIndex
+from config import batch_query, main_query, snapshot_threshold
+from export_snapshot import ExportSnapshot
+from metrics import Metrics, metrics as default_metrics
+from intermediate import load_frame, save_frame
+
+# Признак конца данных в очередях конвейера
+_PIPELINE_DONE = object()
 
 
 class DBFMerger:
-    def __init__(self):
+    # Класс подключения к базе; заменяется, например, в benchmark.py
+    db_query_class = DBQuery
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        # Метрики прогона: отдельный объект на каждый одновременный прогон (например, каталог cli.py)
+        self.metrics = metrics or default_metrics
         self.dbf_processor = DBFProcessor()
-        self.comparator = ResultComparator()
+        self.comparator = ResultComparator(self.metrics)
         self.logger = logging.getLogger('DBFMerger')
         self.should_stop = False
         self.count_compare = 0
         self.not_found = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._pool = None
+        self._snapshot_query = None
+        # Каталог результатов и промежуточных таблиц; Excel-копии промежуточных таблиц - по запросу
+        self.results_dir = "results"
+        self.export_excel = False
 
     def stop(self):
         self.should_stop = True
+        if self._pool:
+            self._pool.stop()
+        if self._snapshot_query:
+            self._snapshot_query.stop()
 
-    def process_dbf(self, input_dir: str) -> Optional[pd.DataFrame]:
+    def process_dbf(self, input_dir: str, workers: Optional[int] = None) -> Optional[pd.DataFrame]:
         try:
-            dbf_df = self.dbf_processor.merge_dbf_files(input_dir)
-            self._save_to_excel(dbf_df, "dbf_merged.xlsx", "Merged_DBF")
+            dbf_df = self._merge_dbf(input_dir, workers)
+            self._save_intermediate(dbf_df, "dbf_merged", "Merged_DBF")
             return dbf_df
         except Exception as e:
             self.logger.error(f"Ошибка обработки DBF: {str(e)}")
             return None
 
+    def _merge_dbf(self, input_dir: str, workers: Optional[int] = None) -> pd.DataFrame:
+        """Объединяет DBF каталога с замером скорости разбора и размера объединенной таблицы"""
+        with self.metrics.stage('dbf_parse') as stage:
+            dbf_df = self.dbf_processor.merge_dbf_files(input_dir, workers=workers)
+            stage['rows'] = len(dbf_df)
+        self.metrics.frame_memory('merged_frame_mb', dbf_df)
+        return dbf_df
+
     def process_db_queries(self, dbf_df: pd.DataFrame, db_params: Dict) -> Optional[pd.DataFrame]:
+        """Ищет в базе строки для всех пар SPN/DATO.
+
+        Если в db_params задан batch_size, пары отправляются блоками через batch_query,
+        иначе для каждой пары выполняется отдельный sql_query. При workers > 1
+        запросы выполняются параллельно через пул подключений. С async_queries
+        запросы выполняются через asyncio (AsyncDBQueryRunner): до in_flight
+        запросов в работе на workers подключениях, не больше max_concurrency
+        одновременно на сервере. Когда пар больше snapshot_threshold, таблицы
+        читаются один раз и сверяются локально (см. _use_snapshot).
+        """
         if self.should_stop:
             return None
 
@@ -37,46 +87,248 @@ class DBFMerger:
             if not pairs:
                 return pd.DataFrame()
 
-            total = len(pairs)
-            db_results = []
-            progress_callback = db_params.get('progress_callback')
-
-            with DBQuery(
-                    host=db_params['host'],
-                    user=db_params['user'],
-                    password=db_params['password'],
-                    database=db_params['database']
-            ) as db_query:
-
-                for i, pair in enumerate(pairs, 1):
-                    if self.should_stop:
-                        break
-
-                    if progress_callback:
-                        progress_callback(i, total)
-
-                    query = db_params['sql_query'].replace('{SPN}', str(pair['SPN'])).replace('{DATO}',
-                                                                                              str(pair['DATO']))
-                    print(f'{i}. {query}')
-                    result = db_query.execute_query(query)
-                    if result:
-                        for row in result:
-                            row['SPN'] = pair['SPN']
-                            row['source_file'] = pair['source_file']
-                            db_results.append(row)
-                self.not_found += db_query.get_not_found()
+            with self.metrics.stage('db_queries', rows=len(pairs)):
+                db_results, not_found = self._fetch_pairs(pairs, db_params)
+            self.not_found += not_found
+            hits, misses = self.get_cache_stats()
+            self.logger.info(f"Не найдено: {not_found}, кэш: попаданий {hits}, промахов {misses}")
             db_df = pd.DataFrame(db_results) if db_results else pd.DataFrame()
-            self._save_to_excel(db_df, "db_results.xlsx", "DB_Results")
+            self._save_intermediate(db_df, "db_results", "DB_Results")
             return db_df
 
         except Exception as e:
             self.logger.error(f"Ошибка выполнения запросов: {str(e)}")
             return None
 
+    def _fetch_pairs(self, pairs: List[Dict], db_params: Dict) -> Tuple[List[Dict], int]:
+        """Строки базы для пар и число ненайденных пар: через снимок таблиц или запросами"""
+        if self._use_snapshot(db_params, len(pairs)):
+            db_results, not_found = self._load_snapshot(db_params, (pair['SPN'] for pair in pairs)).lookup(pairs)
+            progress_callback = db_params.get('progress_callback')
+            if progress_callback:
+                progress_callback(len(pairs), len(pairs))
+            return db_results, not_found
+
+        with self._db_executor(db_params) as executor:
+            return self._query_pairs(executor, pairs, db_params)
+
+    @staticmethod
+    def _use_snapshot(db_params: Dict, pair_count: int) -> bool:
+        """Нужен ли режим снимка.
+
+        db_params['engine'] = 'snapshot' или 'query' задает режим явно. По умолчанию
+        снимок выбирается, если пар больше snapshot_threshold и запрос - стандартный
+        main_query: снимок воспроизводит только его.
+        """
+        engine = db_params.get('engine', 'auto')
+        if engine != 'auto':
+            return engine == 'snapshot'
+        return (db_params.get('sql_query', main_query) == main_query
+                and pair_count > db_params.get('snapshot_threshold', snapshot_threshold))
+
+    def _load_snapshot(self, db_params: Dict, spns) -> ExportSnapshot:
+        self.logger.info("Загрузка снимка exportfilep/exportfileu")
+        connection_args = dict(host=db_params['host'], user=db_params['user'], password=db_params['password'],
+                               database=db_params['database'], metrics=self.metrics)
+        if db_params.get('connection_limiter'):
+            connection_args['limiter'] = db_params['connection_limiter']
+        with self.db_query_class(**connection_args) as db_query:
+            self._snapshot_query = db_query
+            if self.should_stop:
+                db_query.stop()
+            try:
+                return ExportSnapshot().load(db_query, spns)
+            finally:
+                self._snapshot_query = None
+
+    @contextmanager
+    def _db_executor(self, db_params: Dict):
+        """Открывает подключение (или пул при workers > 1) и отдает функцию пакетного выполнения запросов"""
+        connection_args = dict(
+            host=db_params['host'],
+            user=db_params['user'],
+            password=db_params['password'],
+            database=db_params['database'],
+            metrics=self.metrics
+        )
+        workers = int(db_params.get('workers') or 1)
+
+        # Кэш результатов: готовый объект в 'cache' или новый по метке снимка 'cache_snapshot'
+        cache = db_params.get('cache')
+        own_cache = cache is None and db_params.get('cache_snapshot') is not None
+        if own_cache:
+            cache = QueryCache(snapshot=db_params['cache_snapshot'], ttl=db_params.get('cache_ttl'))
+        if cache:
+            connection_args['cache'] = cache
+        if db_params.get('connection_limiter'):
+            connection_args['limiter'] = db_params['connection_limiter']
+
+        try:
+            if db_params.get('async_queries'):
+                # Ленивый импорт: asyncio-вариант нужен только по запросу
+                from async_db_query import AsyncDBQueryRunner
+                with AsyncDBQueryRunner(**connection_args, connections=workers,
+                                        max_concurrency=db_params.get('max_concurrency'),
+                                        in_flight=db_params.get('in_flight', 256)) as runner:
+                    self._pool = runner
+                    if self.should_stop:
+                        runner.stop()
+                    try:
+                        yield runner.execute_many, runner.get_not_found
+                    finally:
+                        self._pool = None
+            elif workers > 1:
+                with DBQueryPool(**connection_args, workers=workers, query_class=self.db_query_class) as pool:
+                    self._pool = pool
+                    if self.should_stop:
+                        pool.stop()
+                    try:
+                        yield pool.execute_many, pool.get_not_found
+                    finally:
+                        self._pool = None
+            else:
+                with self.db_query_class(**connection_args) as db_query:
+                    def execute_many(queries):
+                        for query, params in queries:
+                            yield db_query.execute_query(query, params)
+
+                    yield execute_many, db_query.get_not_found
+        finally:
+            if cache:
+                hits, misses = cache.get_stats()
+                self.cache_hits += hits
+                self.cache_misses += misses
+            if own_cache:
+                cache.close()
+
+    def _query_pairs(self, executor: Tuple[Callable, Callable], pairs: List[Dict],
+                     db_params: Dict) -> Tuple[List[Dict], int]:
+        """Выполняет запросы для пар выбранным способом, возвращает строки и число ненайденных пар"""
+        execute_many, get_not_found = executor
+        if db_params.get('batch_size'):
+            db_results, not_found = self._query_batched(execute_many, pairs, db_params)
+            # Пустые ответы пакетов подключение тоже считает; ненайденные пары уже посчитаны по парам
+            get_not_found()
+        else:
+            db_results = self._query_per_pair(execute_many, pairs, db_params)
+            not_found = get_not_found()
+        return db_results, not_found
+
+    def _iter_until_stopped(self, items):
+        for item in items:
+            if self.should_stop:
+                break
+            yield item
+
+    def _query_per_pair(self, execute_many: Callable, pairs: List[Dict], db_params: Dict) -> List[Dict]:
+        """Выполняет sql_query отдельно для каждой пары.
+
+        Пары, запрос которых завершился ошибкой (None вместо строк), считаются;
+        если такие есть, выполнение прерывается, а не показывает их ненайденными.
+        """
+        total = len(pairs)
+        db_results = []
+        failed = 0
+        progress_callback = db_params.get('progress_callback')
+
+        template = compile_query(db_params['sql_query'])
+
+        def queries():
+            for i, pair in enumerate(self._iter_until_stopped(pairs), 1):
+                params = template.bind({'SPN': str(pair['SPN']), 'DATO': str(pair['DATO'])})
+                self.logger.debug(f'{i}. SPN={params.get("SPN")}, DATO={params.get("DATO")}')
+                yield template.sql, params
+
+        for i, (pair, result) in enumerate(zip(pairs, execute_many(queries())), 1):
+            if progress_callback:
+                progress_callback(i, total)
+
+            if result is None and not self.should_stop:
+                failed += 1
+            if result:
+                for row in result:
+                    row['SPN'] = pair['SPN']
+                    row['source_file'] = pair['source_file']
+                    db_results.append(row)
+        if failed:
+            raise RuntimeError(f"Запросы для {failed} пар из {total} завершились ошибкой")
+        return db_results
+
+    def _query_batched(self, execute_many: Callable, pairs: List[Dict], db_params: Dict) -> Tuple[List[Dict], int]:
+        """Выполняет batch_query блоками по batch_size пар и раскладывает строки обратно по парам.
+
+        Возвращает строки результата и количество пар, для которых ничего не найдено.
+        Ошибка пакетного запроса (None вместо строк) прерывает выполнение.
+        """
+        total = len(pairs)
+        size = int(db_params['batch_size'])
+        template = db_params.get('batch_query', batch_query)
+        blocks = [pairs[start:start + size] for start in range(0, total, size)]
+        db_results = []
+        not_found = 0
+        done = 0
+        progress_callback = db_params.get('progress_callback')
+
+        def queries():
+            for block in self._iter_until_stopped(blocks):
+                spns = list(dict.fromkeys(str(pair['SPN']).rstrip() for pair in block))
+                datos = list(dict.fromkeys(str(pair['DATO']) for pair in block))
+                query = template.replace('{SPN_LIST}', ', '.join(['%s'] * len(spns))).replace(
+                    '{DATO_LIST}', ', '.join(['%s'] * len(datos)))
+                self.logger.debug(f'Пакет из {len(block)} пар')
+                yield query, tuple(spns + datos)
+
+        for block, rows in zip(blocks, execute_many(queries())):
+            if rows is None:
+                if self.should_stop:
+                    break
+                # Ошибка запроса: пары блока нельзя считать ненайденными
+                raise RuntimeError(f"Пакетный запрос для {len(block)} пар завершился ошибкой")
+            block_results, block_not_found = self._map_batch_rows(block, rows)
+            db_results.extend(block_results)
+            not_found += block_not_found
+            done += len(block)
+
+            if progress_callback:
+                progress_callback(done, total)
+        return db_results, not_found
+
+    @staticmethod
+    def _pair_key(spn, dato) -> tuple:
+        """Ключ пары так, как её сравнивает MySQL: SPN без учета регистра и хвостовых пробелов"""
+        return str(spn).rstrip().upper(), str(dato)
+
+    @staticmethod
+    def _map_batch_rows(block: List[Dict], rows: List[Dict]) -> Tuple[List[Dict], int]:
+        """Сопоставляет строки пакетного ответа с исходными парами (SPN, DATO, source_file).
+
+        Порядок и состав строк совпадают с построчным режимом: для каждой пары
+        берутся её строки, пары без строк учитываются в счетчике ненайденных.
+        """
+        by_key = defaultdict(list)
+        not_found = 0
+        for row in rows:
+            dato = row['eu.DATO'] if 'eu.DATO' in row else row.get('DATO')
+            by_key[DBFMerger._pair_key(row['SPN'], dato)].append(row)
+
+        db_results = []
+        for pair in block:
+            matched = by_key.get(DBFMerger._pair_key(pair['SPN'], pair['DATO']))
+            if not matched:
+                not_found += 1
+                continue
+            for row in matched:
+                row = dict(row)
+                row['SPN'] = pair['SPN']
+                row['source_file'] = pair['source_file']
+                db_results.append(row)
+        return db_results, not_found
+
     def compare_and_save(self, dbf_df: pd.DataFrame, db_df: pd.DataFrame, output_path: str) -> bool:
         """Сравнивает и сохраняет результаты в отдельный файл"""
         try:
-            comparison = self.comparator.compare_results(dbf_df, db_df)
+            with self.metrics.stage('compare', rows=len(dbf_df)):
+                comparison = self.comparator.compare_results_frame(dbf_df, db_df)
             self.comparator.save_comparison(comparison, output_path)
             self.count_compare += self.comparator.get_count_compare()
             return True
@@ -84,6 +336,263 @@ class DBFMerger:
             self.logger.error(f"Ошибка сравнения: {str(e)}")
             return False
 
+    def run_pipeline(self, input_dir: str, db_params: Dict, output_path: str, chunk_size: int = 2000,
+                     queue_size: int = 4) -> bool:
+        """Сверка реестра конвейером: запросы к базе, сравнение и запись идут одновременно.
+
+        Объединенные строки DBF делятся на блоки примерно по chunk_size строк так,
+        что все строки одного SPN попадают в один блок; тогда сравнение блока
+        совпадает с общим сравнением для его ключей. Файлы читаются колонками
+        один раз, а строки блока строятся, когда до него доходит очередь, так что
+        запросы первых блоков идут, пока объединяются следующие. Стадии связаны
+        очередями ограниченного размера, различия пишутся в файл по мере появления.
+        Промежуточные dbf_merged и db_results в этом режиме не сохраняются.
+        Как и compare_and_save, возвращает False, если общих ключей нет.
+        """
+        # Остановка прошлого запуска не должна прерывать новый
+        self.should_stop = False
+        chunks = queue.Queue(maxsize=queue_size)
+        results = queue.Queue(maxsize=queue_size)
+        comparisons = queue.Queue(maxsize=queue_size)
+        errors = []
+        query_params = {key: value for key, value in db_params.items() if key != 'progress_callback'}
+        total_rows = [0]
+        snapshot_spns = []
+
+        def stage(target, source, destination):
+            def run():
+                try:
+                    with self.metrics.stage(f"pipeline_{target.__name__}"):
+                        target(source, destination)
+                except Exception as e:
+                    errors.append(e)
+                    self.logger.error(f"Ошибка конвейера: {str(e)}")
+                    self.stop()
+                    # Дочитываем входную очередь, чтобы предыдущая стадия не осталась заблокированной
+                    if source is not None:
+                        for _ in self._iter_queue(source):
+                            pass
+                finally:
+                    if destination is not None:
+                        destination.put(_PIPELINE_DONE)
+            return threading.Thread(target=run, daemon=True)
+
+        def parse(_, destination):
+            with self.metrics.stage('dbf_parse') as parse_stage:
+                plan = self.dbf_processor.plan_merge(input_dir, db_params.get('dbf_workers'))
+                if plan is None:
+                    # Большой реестр объединяется целиком потоково, с группировкой на диске
+                    dbf_df = self.dbf_processor.merge_dbf_files(input_dir)
+                    key_df = dbf_df
+                else:
+                    # Для деления на блоки и списка пар достаточно колонок SN, SPN и eu.DATO
+                    key_df = plan.build(names=[name for name in plan.column_names
+                                               if name == 'SN' or name.startswith(('SPN', 'eu.DATO'))])
+                parse_stage['rows'] = len(key_df)
+            self.logger.info(f"DBF прочитаны: {len(key_df)} строк")
+            total_rows[0] = len(key_df)
+            pair_spns = self.dbf_processor.extract_spn_dato_frame(key_df)['SPN']
+            if self._use_snapshot(query_params, len(pair_spns)):
+                snapshot_spns.append(pair_spns)
+            for positions in self._spn_chunks(key_df, chunk_size):
+                if self.should_stop:
+                    break
+                chunk = dbf_df.iloc[positions] if plan is None else plan.build(positions)
+                # Индекс ключей блока строится здесь, пока предыдущие блоки ждут ответа базы
+                destination.put((chunk, KeyIndex.from_frame(chunk)))
+
+        def query(source, destination):
+            snapshot = None
+            with self._db_executor(query_params) as executor:
+                for chunk, chunk_index in self._iter_queue(source):
+                    if self.should_stop:
+                        continue
+                    # Список SPN для снимка parse кладет до первого блока
+                    if snapshot_spns and snapshot is None:
+                        snapshot = self._load_snapshot(query_params, snapshot_spns.pop())
+                    pairs = self.dbf_processor.extract_spn_dato_pairs(chunk)
+                    if not pairs:
+                        db_results, not_found = [], 0
+                    elif snapshot is not None:
+                        db_results, not_found = snapshot.lookup(pairs)
+                    else:
+                        db_results, not_found = self._query_pairs(executor, pairs, query_params)
+                    self.not_found += not_found
+                    db_chunk = pd.DataFrame(db_results)
+                    db_index = KeyIndex.from_frame(db_chunk) if not db_chunk.empty else None
+                    destination.put((chunk, chunk_index, db_chunk, db_index))
+
+        def compare(source, destination):
+            start_index = 0
+            for chunk, chunk_index, db_chunk, db_index in self._iter_queue(source):
+                if self.should_stop or db_chunk.empty:
+                    continue
+                try:
+                    comparison = self.comparator.compare_results_frame(
+                        chunk, db_chunk, start_index, dbf_index=chunk_index, db_index=db_index)
+                except ValueError:
+                    # В блоке нет общих ключей SPN/DATO
+                    continue
+                start_index = self.comparator.last_row_number
+                destination.put(comparison)
+
+        threads = [
+            stage(parse, None, chunks),
+            stage(query, chunks, results),
+            stage(compare, results, comparisons)
+        ]
+        for thread in threads:
+            thread.start()
+
+        progress_callback = db_params.get('progress_callback')
+        diffs = 0
+        writer = None
+        try:
+            with self.metrics.stage('pipeline_write') as write_stage, ExitStack() as stack:
+                write_stage['rows'] = 0
+                for comparison in self._iter_queue(comparisons):
+                    if writer is None:
+                        # Файл создается с первым блоком сравнения: пустой отчет не пишется
+                        writer = stack.enter_context(self.comparator.open_writer(output_path))
+                    chunk_diffs = int((comparison['Status'] == 'DIFF').sum())
+                    if chunk_diffs:
+                        diffs += chunk_diffs
+                        self.logger.info(f"Найдено различий: {diffs}")
+                    for row in zip(comparison['Type'], comparison['Field'], comparison['DBF_Value'],
+                                   comparison['DB_Value'], comparison['Status']):
+                        writer.write(*row)
+                    write_stage['rows'] += len(comparison)
+                    if progress_callback:
+                        progress_callback(self.comparator.last_row_number, total_rows[0])
+        except Exception as e:
+            errors.append(e)
+            self.logger.error(f"Ошибка записи сравнения: {str(e)}")
+            self.stop()
+            # Дочитываем очередь, чтобы стадии не остались заблокированными
+            for _ in self._iter_queue(comparisons):
+                pass
+
+        for thread in threads:
+            thread.join()
+        self.count_compare += self.comparator.get_count_compare()
+        if errors:
+            return False
+        if writer is None:
+            self.logger.error("Ошибка сравнения: Нет строк с одинаковыми SPN и DATO")
+            return False
+        self.logger.info(f"Файл сравнения сохранен: {output_path}")
+        return True
+
+    def run_incremental(self, input_dir: str, db_params: Dict, output_path: str,
+                        state_dir: Optional[str] = None) -> bool:
+        """Повторная сверка каталога с пересчетом только изменившихся SN.
+
+        Заново запрашиваются и сравниваются только ключи SPN/DATO строк тех SN,
+        чей хэш содержимого изменился (или которые появились/исчезли), и ключи,
+        по которым в прошлый раз были различия. Остальные блоки отчета и строки
+        результатов запросов берутся из прошлого запуска. Первый запуск без
+        состояния выполняет полную сверку.
+        """
+        state = IncrementalState(state_dir or os.path.join(
+            self.results_dir, "incremental", os.path.basename(os.path.normpath(input_dir))))
+
+        try:
+            dbf_df = self._merge_dbf(input_dir, db_params.get('dbf_workers'))
+            sn_hashes = state.hash_sn_rows(dbf_df)
+            dbf_index = KeyIndex.from_frame(dbf_df)
+            sn_keys = pd.DataFrame({
+                'SN': dbf_df['SN'].to_numpy(),
+                'COMP_KEY': dbf_index.row_keys(np.arange(len(dbf_df)))
+            }).drop_duplicates()
+
+            if state.load():
+                keys = state.changed_keys(sn_hashes, sn_keys)
+                self.logger.info(f"Инкрементальная сверка: пересчитывается ключей {len(keys)}")
+                dirty_df = dbf_df.iloc[dbf_index.positions_of(keys)]
+                kept_db = state.db_results
+                if not kept_db.empty:
+                    stale = KeyIndex.from_frame(kept_db).positions_of(keys)
+                    kept_db = kept_db.drop(index=kept_db.index[stale])
+                kept_comparison = state.comparison[~state.comparison['COMP_KEY'].isin(keys)]
+            else:
+                self.logger.info("Состояние прошлой сверки не найдено, выполняется полная сверка")
+                dirty_df = dbf_df
+                kept_db = pd.DataFrame()
+                kept_comparison = pd.DataFrame()
+
+            new_db = pd.DataFrame()
+            if not dirty_df.empty:
+                pairs = self.dbf_processor.extract_spn_dato_pairs(dirty_df)
+                if pairs:
+                    with self.metrics.stage('db_queries', rows=len(pairs)):
+                        db_results, not_found = self._fetch_pairs(pairs, db_params)
+                    self.not_found += not_found
+                    new_db = pd.DataFrame(db_results)
+
+            new_comparison = pd.DataFrame()
+            if not new_db.empty:
+                try:
+                    with self.metrics.stage('compare', rows=len(dirty_df)):
+                        new_comparison = self.comparator.compare_results_frame(dirty_df, new_db, with_keys=True)
+                except ValueError:
+                    # Среди пересчитанных строк нет общих ключей
+                    self.comparator.get_count_compare()
+
+            comparison = pd.concat([kept_comparison, new_comparison], ignore_index=True)
+            if comparison.empty:
+                raise ValueError("Нет строк с одинаковыми SPN и DATO")
+            # Блоки в порядке первого появления ключа в DBF, как при полной сверке
+            key_order = pd.Series(np.arange(len(dbf_index.keys)), index=dbf_index.keys)
+            comparison = comparison.iloc[np.argsort(comparison['COMP_KEY'].map(key_order).to_numpy(), kind='stable')]
+            comparison = IncrementalState.renumber(comparison.reset_index(drop=True))
+
+            self.comparator.get_count_compare()
+            self.count_compare += int((comparison['Status'] == 'DIFF').sum())
+            self.comparator.save_comparison(comparison, output_path)
+
+            state.sn_hashes = sn_hashes
+            state.sn_keys = sn_keys
+            state.db_results = pd.concat([kept_db, new_db], ignore_index=True)
+            state.comparison = comparison
+            try:
+                state.save()
+            except Exception as e:
+                # Отчет уже сохранен; без состояния следующий запуск выполнит полную сверку
+                self.logger.warning(f"Состояние инкрементальной сверки не сохранено: {str(e)}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Ошибка инкрементальной сверки: {str(e)}")
+            return False
+
+    @staticmethod
+    def _iter_queue(source: queue.Queue):
+        while True:
+            item = source.get()
+            if item is _PIPELINE_DONE:
+                return
+            yield item
+
+    @staticmethod
+    def _spn_chunks(dbf_df: pd.DataFrame, chunk_size: int):
+        """Делит объединенные строки на блоки позиций, не разрывая группы одного SPN"""
+        if 'SPN' not in dbf_df.columns:
+            return
+        codes = pd.factorize(dbf_df['SPN'].astype(str).where(dbf_df['SPN'].notna()))[0]
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        if not len(order):
+            return
+        sorted_codes = codes[order]
+        # Границы групп SPN; блок закрывается на первой границе после chunk_size строк
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        start = 0
+        for boundary in boundaries:
+            if boundary - start >= chunk_size:
+                yield order[start:boundary]
+                start = boundary
+        yield order[start:]
+
     def get_count_compare(self):
         tmp = self.count_compare
         self.count_compare = 0
@@ -94,13 +603,43 @@ class DBFMerger:
         self.not_found = 0
         return tmp
 
+    def get_cache_stats(self):
+        """Возвращает (попадания, промахи) кэша запросов и сбрасывает счетчики"""
+        stats = self.cache_hits, self.cache_misses
+        self.cache_hits = self.cache_misses = 0
+        return stats
+
+    def _save_intermediate(self, df: pd.DataFrame, name: str, sheet_name: str):
+        """Сохраняет промежуточную таблицу в results_dir (Parquet) и по запросу - в Excel.
+
+        Ошибка сохранения (например, нет pyarrow) только пишется в лог: таблица
+        уже посчитана и нужна для сверки, без файла недоступно лишь продолжение
+        прошлого запуска.
+        """
+        try:
+            with self.metrics.stage(f"save_{name}", rows=len(df)):
+                filepath = save_frame(df, self.results_dir, name)
+            self.logger.info(f"Файл сохранен: {filepath}")
+        except Exception as e:
+            self.logger.warning(f"Промежуточная таблица {name} не сохранена: {str(e)}")
+        if self.export_excel:
+            self._save_to_excel(df, f"{name}.xlsx", sheet_name)
+
+    def load_intermediate(self, name: str, directory: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """Читает промежуточную таблицу прошлого запуска (dbf_merged, db_results); None, если её нет"""
+        df = load_frame(directory or self.results_dir, name)
+        if df is not None:
+            self.logger.info(f"Загружена таблица {name}: {len(df)} строк")
+        return df
+
     def _save_to_excel(self, df: pd.DataFrame, filename: str, sheet_name: str):
         """Сохраняет DataFrame в Excel файл"""
         try:
-            os.makedirs("results", exist_ok=True)
-            filepath = os.path.join("results", filename)
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
+            os.makedirs(self.results_dir, exist_ok=True)
+            filepath = os.path.join(self.results_dir, filename)
+            with self.metrics.stage(f"excel_{sheet_name}", rows=len(df)):
+                with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
             self.logger.info(f"Файл сохранен: {filepath}")
         except Exception as e:
             self.logger.error(f"Ошибка сохранения Excel: {str(e)}")
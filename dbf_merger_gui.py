@@ -3,24 +3,62 @@ from tkinter import ttk, filedialog, messagebox
 import os
 import logging
 from threading import Thread
-from patient_search import PatientSearcher  # Импортируем новый класс
-from dbf_merger import DBFMerger
-from config import main_query
+from gui_channel import GuiChannel
+from metrics import metrics
+
+# pandas, openpyxl и pymysql загружаются при первом поиске (или фоном после открытия окна),
+# поэтому модули поиска импортируются внутри методов
+
+
+class LogPaneHandler(logging.Handler):
+    """Передает записи лога в окно лога приложения через канал событий"""
+
+    def __init__(self, channel: GuiChannel):
+        super().__init__()
+        self.channel = channel
+
+    def emit(self, record):
+        try:
+            self.channel.log(self.format(record))
+        except Exception:
+            self.handleError(record)
 
 
 class DBFMergerApp:
+    # Строк в окне лога; более старые удаляются, чтобы вставка не замедлялась
+    max_log_lines = 5000
+
     def __init__(self, root):
         self.root = root
         self.root.title("Vasyatkinator 3000 v1.2")
         self.root.geometry("1000x900")
 
-        # Инициализация классов
-        self.patient_searcher = PatientSearcher()
+        self._patient_searcher = None
         self.processing = False
 
         self.setup_logging()
         self.setup_ui()
+        # Рабочие потоки передают лог, прогресс и диалоги окну только через канал
+        self.channel = GuiChannel(self.root, self.append_log, self.show_search_progress)
+        self.channel.start()
+        self.setup_metrics_log()
         self.create_results_dir()
+        # Тяжелые модули загружаем фоном, когда окно уже показано
+        self.root.after(200, lambda: Thread(target=self.preload_modules, daemon=True).start())
+
+    @property
+    def patient_searcher(self):
+        """Поиск пациентов создается при первом обращении"""
+        if self._patient_searcher is None:
+            from patient_search import PatientSearcher
+            self._patient_searcher = PatientSearcher()
+        return self._patient_searcher
+
+    @staticmethod
+    def preload_modules():
+        """Импортирует модули поиска заранее, чтобы первый поиск не ждал загрузки pandas"""
+        import patient_search  # noqa: F401
+        import batch_patient_search  # noqa: F401
 
     def create_results_dir(self):
         """Создает каталог results если его нет"""
@@ -35,6 +73,12 @@ class DBFMergerApp:
             filename='app.log'
         )
 
+    def setup_metrics_log(self):
+        """Сводка метрик прогона выводится в окно лога"""
+        handler = LogPaneHandler(self.channel)
+        handler.setFormatter(logging.Formatter('[Метрики] %(message)s'))
+        logging.getLogger('Metrics').addHandler(handler)
+
     def setup_ui(self):
         """Настройка пользовательского интерфейса"""
         # Создаем вкладки
@@ -161,6 +205,11 @@ class DBFMergerApp:
             state=tk.DISABLED)
         self.stop_search_btn.pack(side=tk.LEFT, padx=5)
 
+        self.batch_search_btn = ttk.Button(
+            btn_frame, text="Пакетный поиск из файла",
+            command=self.start_batch_search)
+        self.batch_search_btn.pack(side=tk.LEFT, padx=5)
+
     def setup_common_elements(self):
         """Общие элементы для всех вкладок"""
         # Статус бар
@@ -180,13 +229,38 @@ class DBFMergerApp:
         self.log_text.config(yscrollcommand=scrollbar.set)
         scrollbar.config(command=self.log_text.yview)
 
+        # Профилирование прогона: cProfile и tracemalloc, отчеты в results
+        self.profile_run = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.root, text="Профилирование (cProfile, tracemalloc)",
+                        variable=self.profile_run).pack(anchor=tk.W, padx=10)
+
     def log_message(self, message):
-        """Вывод сообщения в лог"""
+        """Вывод сообщения в лог (из любого потока)"""
+        self.channel.log(message)
+        logging.info(message)
+
+    def append_log(self, messages):
+        """Добавляет накопленные строки в окно лога одной вставкой"""
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
+        self.log_text.insert(tk.END, "\n".join(messages) + "\n")
+        lines = int(self.log_text.index('end-1c').split('.')[0])
+        if lines > self.max_log_lines:
+            self.log_text.delete('1.0', f'{lines - self.max_log_lines}.0')
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
-        logging.info(message)
+
+    def finish_search(self, status):
+        """Возвращает кнопки поиска в исходное состояние (в главном потоке)"""
+        self.processing = False
+        self.search_btn.config(state=tk.NORMAL)
+        self.batch_search_btn.config(state=tk.NORMAL)
+        self.stop_search_btn.config(state=tk.DISABLED)
+        self.status.set(status)
+
+    @staticmethod
+    def run_metrics(name, profile):
+        """Прогон с отчетом метрик в results; profile включает cProfile и tracemalloc"""
+        return metrics.run(name, profile=profile, trace_memory=profile)
 
     def start_patient_search(self):
         """Запуск поиска пациента"""
@@ -198,43 +272,96 @@ class DBFMergerApp:
             messagebox.showerror("Ошибка", "Введите ФИО пациента!")
             return
 
-        # Параметры для первой базы
-        db1_params = {
-            'host': self.db1_host.get(),
-            'user': self.db1_user.get(),
-            'password': self.db1_password.get(),
-            'database': self.db1_name.get(),
+        # Параметры для обеих баз
+        patient = {
             'patient_lastname': last_name,
             'patient_firstname': first_name,
             'patient_patrname': patr_name
         }
+        db1_params, db2_params = (dict(params, **patient) for params in self.get_search_db_params())
 
-        # Параметры для второй базы
+        # Настройка интерфейса перед поиском
+        self.patient_searcher.stop_search = False
+        self.processing = True
+        self.search_btn.config(state=tk.DISABLED)
+        self.stop_search_btn.config(state=tk.NORMAL)
+        self.status.set(f"Поиск пациента: {last_name} {first_name} {patr_name}")
+        self.log_message(f"Начало поиска пациента: {last_name} {first_name} {patr_name}")
+        self.search_progress['value'] = 0
+
+        # Запуск поиска в отдельном потоке
+        Thread(
+            target=self.run_patient_search,
+            args=(db1_params, db2_params, self.profile_run.get()),
+            daemon=True
+        ).start()
+
+    def get_search_db_params(self):
+        """Параметры подключения к обеим базам вкладки поиска"""
+        db1_params = {
+            'host': self.db1_host.get(),
+            'user': self.db1_user.get(),
+            'password': self.db1_password.get(),
+            'database': self.db1_name.get()
+        }
         db2_params = {
             'host': self.db2_host.get(),
             'user': self.db2_user.get(),
             'password': self.db2_password.get(),
-            'database': self.db2_name.get(),
-            'patient_lastname': last_name,
-            'patient_firstname': first_name,
-            'patient_patrname': patr_name
+            'database': self.db2_name.get()
         }
+        return db1_params, db2_params
+
+    def start_batch_search(self):
+        """Запуск пакетного поиска по списку ФИО из CSV/XLSX"""
+        input_path = filedialog.askopenfilename(
+            title="Список пациентов",
+            filetypes=[("Списки пациентов", "*.xlsx *.xls *.csv"), ("Все файлы", "*.*")])
+        if not input_path:
+            return
 
-        # Настройка интерфейса перед поиском
+        self.patient_searcher.stop_search = False
         self.processing = True
         self.search_btn.config(state=tk.DISABLED)
+        self.batch_search_btn.config(state=tk.DISABLED)
         self.stop_search_btn.config(state=tk.NORMAL)
-        self.status.set(f"Поиск пациента: {last_name} {first_name} {patr_name}")
-        self.log_message(f"Начало поиска пациента: {last_name} {first_name} {patr_name}")
+        self.status.set(f"Пакетный поиск: {os.path.basename(input_path)}")
+        self.log_message(f"Начало пакетного поиска по файлу: {input_path}")
         self.search_progress['value'] = 0
 
-        # Запуск поиска в отдельном потоке
         Thread(
-            target=self.run_patient_search,
-            args=(db1_params, db2_params),
+            target=self.run_batch_search,
+            args=(input_path, *self.get_search_db_params(), self.profile_run.get()),
             daemon=True
         ).start()
 
+    def run_batch_search(self, input_path, db1_params, db2_params, profile=False):
+        """Выполнение пакетного поиска"""
+        try:
+            from batch_patient_search import BatchPatientSearcher
+            with self.run_metrics('batch_search', profile):
+                batch_searcher = BatchPatientSearcher(self.patient_searcher)
+                patients = batch_searcher.read_patients(input_path)
+                self.log_message(f"Пациентов в списке: {len(patients)}")
+
+                with metrics.stage('search', rows=len(patients)):
+                    results = batch_searcher.search(patients, [db1_params, db2_params], self.update_search_progress)
+                output_file = os.path.join(
+                    'results',
+                    f'{os.path.splitext(os.path.basename(input_path))[0]}_batch_results.xlsx'
+                )
+                with metrics.stage('excel_save'):
+                    batch_searcher.save_consolidated(patients, results, output_file)
+
+            self.log_message(f"Результаты пакетного поиска сохранены в: {output_file}")
+            self.channel.call(messagebox.showinfo, "Готово", f"Результаты пакетного поиска сохранены в:\n{output_file}")
+
+        except Exception as e:
+            self.log_message(f"Ошибка пакетного поиска: {str(e)}")
+            self.channel.call(messagebox.showerror, "Ошибка", f"Ошибка при пакетном поиске:\n{str(e)}")
+        finally:
+            self.channel.call(self.finish_search, "Пакетный поиск завершен")
+
     def stop_patient_search(self):
         """Остановка поиска пациента"""
         self.patient_searcher.stop_search = True
@@ -244,58 +371,58 @@ class DBFMergerApp:
         self.stop_search_btn.config(state=tk.DISABLED)
         self.processing = False
 
-    def run_patient_search(self, db1_params, db2_params):
+    def run_patient_search(self, db1_params, db2_params, profile=False):
         """Выполнение поиска пациента"""
         try:
-            # Поиск в первой базе
+            # Поиск в обеих базах одновременно
             self.update_search_progress(0, 2)
-            self.log_message(f"Поиск в базе {db1_params['database']}...")
-            df1 = self.patient_searcher.search_patient(db1_params)
-
-            # Поиск во второй базе
-            self.update_search_progress(1, 2)
-            self.log_message(f"Поиск в базе {db2_params['database']}...")
-            df2 = self.patient_searcher.search_patient(db2_params)
-
-            # Сохранение результатов
-            self.update_search_progress(2, 2)
-            result_file_name = f'{db1_params["patient_lastname"]}{("_" + db1_params["patient_firstname"][0].upper()) if db1_params["patient_firstname"] else ""}{"_" + db1_params["patient_patrname"][0].upper() if db1_params["patient_patrname"] else ""}_results.xlsx'
-            output_file = os.path.join(
-                'results',
-                result_file_name
-            )
+            self.log_message(f"Поиск в базах {db1_params['database']} и {db2_params['database']}...")
+            with self.run_metrics('patient_search', profile):
+                with metrics.stage('search'):
+                    df1, df2 = self.patient_searcher.search_patients(db1_params, db2_params,
+                                                                     self.update_search_progress)
+
+                # Сохранение результатов
+                result_file_name = f'{db1_params["patient_lastname"]}{("_" + db1_params["patient_firstname"][0].upper()) if db1_params["patient_firstname"] else ""}{"_" + db1_params["patient_patrname"][0].upper() if db1_params["patient_patrname"] else ""}_results.xlsx'
+                output_file = os.path.join(
+                    'results',
+                    result_file_name
+                )
 
-            result = self.patient_searcher.save_results(df1, df2, output_file)
+                with metrics.stage('excel_save'):
+                    result = self.patient_searcher.save_results(df1, df2, output_file)
 
             if result:
                 self.log_message(f"Результаты сохранены в: {output_file}")
-                messagebox.showinfo(
+                self.channel.call(
+                    messagebox.showinfo,
                     "Готово",
                     f"Результаты поиска сохранены в:\n{output_file}"
                 )
             else:
-                messagebox.showwarning(
+                self.channel.call(
+                    messagebox.showwarning,
                     "Внимание",
                     "Пациент не найден в указанных базах данных"
                 )
 
         except Exception as e:
             self.log_message(f"Ошибка поиска: {str(e)}")
-            messagebox.showerror("Ошибка", f"Ошибка при поиске пациента:\n{str(e)}")
+            self.channel.call(messagebox.showerror, "Ошибка", f"Ошибка при поиске пациента:\n{str(e)}")
         finally:
-            self.processing = False
-            self.search_btn.config(state=tk.NORMAL)
-            self.stop_search_btn.config(state=tk.DISABLED)
-            self.status.set("Поиск завершен")
+            self.channel.call(self.finish_search, "Поиск завершен")
 
     def update_search_progress(self, current: int, total: int):
-        """Обновление прогресс-бара поиска"""
+        """Прогресс поиска из рабочего потока; окно обновляется не чаще 10 раз в секунду"""
+        self.channel.progress(current, total)
+
+    def show_search_progress(self, current: int, total: int):
+        """Обновление прогресс-бара поиска (в главном потоке)"""
         if total > 0:
             percent = (current / total) * 100
             self.search_progress['value'] = percent
             self.search_progress_label.config(
                 text=f"Выполнено: {current}/{total} ({percent:.1f}%)")
-        self.root.update_idletasks()
 
 
 if __name__ == "__main__":
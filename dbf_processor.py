@@ -1,90 +1,419 @@
+import itertools
 import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from dbfread import DBF
+import numpy as np
 import pandas as pd
 import logging
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from collections import defaultdict
+from dbf_columnar import iter_dbf_columns, read_dbf_columns, read_dbf_header, UnsupportedDBF
+
+
+def read_dbf_file(filepath: str, encoding: str = 'cp866') -> Dict[str, np.ndarray]:
+    """Читает DBF файл в словарь колонок; функция уровня модуля для запуска в пуле процессов"""
+    try:
+        return read_dbf_columns(filepath, encoding)
+    except UnsupportedDBF:
+        table = DBF(filepath, encoding=encoding, recfactory=dict)
+        records = list(table)
+        columns = {}
+        for name in table.field_names:
+            column = np.empty(len(records), dtype=object)
+            column[:] = [record[name] for record in records]
+            columns[name] = column
+        return columns
+
+
+def _columns_to_records(columns: Dict[str, np.ndarray]) -> Iterator[Dict]:
+    names = list(columns)
+    for values in zip(*(column.tolist() for column in columns.values())):
+        yield dict(zip(names, values))
+
+
+class _SNSpill:
+    """Группировка записей по SN через временные файлы.
+
+    Записи раскладываются по partitions файлам по хэшу SN, затем каждый файл
+    группируется в памяти отдельно, так что в памяти одновременно находится
+    только одна часть данных.
+    """
+
+    def __init__(self, partitions: int):
+        self.tmp_dir = tempfile.TemporaryDirectory(prefix='dbf_spill_')
+        self.paths = [os.path.join(self.tmp_dir.name, f'part_{i}.bin') for i in range(partitions)]
+        self.files = [open(path, 'wb') for path in self.paths]
+
+    def add(self, sn: Any, filename: str, record: Dict):
+        pickle.dump((sn, filename, record), self.files[hash(sn) % len(self.files)], pickle.HIGHEST_PROTOCOL)
+
+    def iter_groups(self) -> Iterator[Tuple[Any, List[Tuple[str, Dict]]]]:
+        for f in self.files:
+            f.close()
+        for path in self.paths:
+            sn_data = defaultdict(list)
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        sn, filename, record = pickle.load(f)
+                    except EOFError:
+                        break
+                    sn_data[sn].append((filename, record))
+            os.remove(path)
+            yield from sn_data.items()
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.tmp_dir.cleanup()
+
+
+class MergePlan:
+    """Объединение по SN уже прочитанных колонками файлов.
+
+    Результат совпадает с построчным объединением (DBFProcessor._merge_sn_records),
+    но строится индексами массивов: имена колонок с префиксами e<буква>.
+    определяются один раз для каждого набора файлов, в которых есть SN,
+    а циклический выбор записей (i % len(records)) считается для всех строк сразу.
+    Строки и колонки объединенной таблицы можно строить частями (build).
+    """
+
+    def __init__(self, file_columns: List[Tuple[str, Dict[str, np.ndarray]]]):
+        self.files = []
+        sn_values = []
+        for filename, columns in file_columns:
+            sn = columns.get('SN')
+            if sn is None or not len(sn):
+                continue
+            rows = np.flatnonzero(~pd.isna(sn))
+            self.files.append((filename, columns, rows))
+            sn_values.append(sn[rows].astype(object))
+
+        if not self.files:
+            raise ValueError("Нет данных для объединения")
+
+        # Коды SN в порядке первого появления, как ключи словаря в построчном варианте
+        codes, self.uniques = pd.factorize(np.concatenate(sn_values))
+        sn_count = len(self.uniques)
+        if not sn_count:
+            raise ValueError("Нет данных для объединения")
+
+        # Для каждого файла: записи, отсортированные по SN, их количество и начало группы SN
+        self.counts, self.orders, self.starts = [], [], []
+        offset = 0
+        self.signature = np.zeros(sn_count, dtype=np.int64)
+        for f_idx, (_, _, rows) in enumerate(self.files):
+            file_codes = codes[offset:offset + len(rows)]
+            offset += len(rows)
+            file_counts = np.bincount(file_codes, minlength=sn_count)
+            self.counts.append(file_counts)
+            self.orders.append(rows[np.argsort(file_codes, kind='stable')])
+            self.starts.append(np.cumsum(file_counts) - file_counts)
+            self.signature |= (file_counts > 0).astype(np.int64) << f_idx
+
+        # Строки результата: для каждого SN столько, сколько записей в самом большом файле
+        max_count = np.max(self.counts, axis=0)
+        self.row_sn = np.repeat(np.arange(sn_count), max_count)
+        self.row_i = np.arange(len(self.row_sn)) - np.repeat(np.cumsum(max_count) - max_count, max_count)
+
+        # Для каждого набора файлов: какие колонки каких файлов под какими именами попадают в строку
+        column_names = {'SN': None}
+        self.signature_columns = {}
+        for sig in pd.unique(self.signature):
+            merged_names = {'SN': None}
+            sig_files = []
+            for f_idx, (filename, columns, _) in enumerate(self.files):
+                if not (sig >> f_idx) & 1:
+                    continue
+                prefix = 'e' + filename[0].lower() + '.'
+                file_names = []
+                for key in columns:
+                    if key == 'SN':
+                        continue
+                    name = f"{prefix if key in merged_names else ''}{key}"
+                    merged_names[name] = None
+                    file_names.append((key, name))
+                sig_files.append((f_idx, file_names))
+            self.signature_columns[sig] = sig_files
+            column_names.update(merged_names)
+        self.column_names = list(column_names)
+
+    def __len__(self) -> int:
+        return len(self.row_sn)
+
+    def build(self, rows: Optional[np.ndarray] = None, names: Optional[List[str]] = None) -> pd.DataFrame:
+        """Строит строки rows (позиции объединенной таблицы, по умолчанию все) с колонками names.
+
+        Набор колонок не зависит от rows: колонки, которых нет у выбранных строк, пустые.
+        """
+        row_sn = self.row_sn if rows is None else self.row_sn[rows]
+        row_i = self.row_i if rows is None else self.row_i[rows]
+        names = self.column_names if names is None else names
+        wanted = set(names)
+        row_signature = self.signature[row_sn]
+        values = {'SN': np.asarray(self.uniques, dtype=object)[row_sn]}
+
+        for sig, sig_files in self.signature_columns.items():
+            sig_rows = np.flatnonzero(row_signature == sig)
+            if not len(sig_rows):
+                continue
+            sig_sn = row_sn[sig_rows]
+            sig_i = row_i[sig_rows]
+            for f_idx, file_names in sig_files:
+                file_names = [(key, name) for key, name in file_names if name in wanted]
+                if not file_names:
+                    continue
+                columns = self.files[f_idx][1]
+                # Циклически выбираем записи
+                source = self.orders[f_idx][self.starts[f_idx][sig_sn] + sig_i % self.counts[f_idx][sig_sn]]
+                for key, name in file_names:
+                    if name not in values:
+                        values[name] = np.full(len(row_sn), np.nan, dtype=object)
+                    values[name][sig_rows] = columns[key][source]
+
+        return pd.DataFrame({
+            name: values[name] if name in values else np.full(len(row_sn), np.nan, dtype=object) for name in names
+        }).infer_objects()
 
 
 class DBFProcessor:
+    # Сколько записей группируется в памяти, прежде чем группировка уходит на диск
+    spill_threshold = 2_000_000
+    spill_partitions = 64
+    # По сколько объединенных записей превращается в DataFrame при потоковом объединении
+    merge_chunk_size = 100_000
+
     def __init__(self):
         self.logger = logging.getLogger('DBFProcessor')
 
-    def merge_dbf_files(self, input_dir: str) -> pd.DataFrame:
-        """Объединяет DBF файлы по полю SN с дублированием строк"""
+    def merge_dbf_files(self, input_dir: str, workers: Optional[int] = None) -> pd.DataFrame:
+        """Объединяет DBF файлы по полю SN с дублированием строк.
+
+        При workers > 1 файлы разбираются параллельно в отдельных процессах.
+        """
+        # Небольшие реестры объединяем колонками, большие - потоково с ограниченной памятью
+        dbf_files = self._list_dbf_files(input_dir)
+        if (workers and workers > 1) or self._count_records(input_dir, dbf_files) <= self.spill_threshold:
+            return MergePlan(self._read_columns(input_dir, dbf_files, workers)).build()
+
+        # Словари записей держим в памяти только блоками, в таблицу собираются компактные DataFrame
+        records = self.iter_merged_records(input_dir)
+        frames = []
+        while True:
+            chunk = list(itertools.islice(records, self.merge_chunk_size))
+            if not chunk:
+                break
+            frames.append(pd.DataFrame(chunk))
+
+        if not frames:
+            raise ValueError("Нет данных для объединения")
+
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    def plan_merge(self, input_dir: str, workers: Optional[int] = None) -> Optional[MergePlan]:
+        """Читает файлы каталога колонками и готовит объединение, не строя таблицу.
+
+        Строки объединенной таблицы затем можно строить частями (MergePlan.build).
+        None, если записей больше spill_threshold: такой каталог объединяется
+        потоково через merge_dbf_files.
+        """
+        dbf_files = self._list_dbf_files(input_dir)
+        if self._count_records(input_dir, dbf_files) > self.spill_threshold:
+            return None
+        return MergePlan(self._read_columns(input_dir, dbf_files, workers))
+
+    def _read_columns(self, input_dir: str, dbf_files: List[str],
+                      workers: Optional[int] = None) -> List[Tuple[str, Dict[str, np.ndarray]]]:
+        """Читает файлы колонками, при workers > 1 - в пуле процессов; файлы с ошибкой чтения пропускаются"""
+        paths = [os.path.join(input_dir, filename) for filename in dbf_files]
+        executor = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+        try:
+            if executor:
+                futures = [executor.submit(read_dbf_file, path) for path in paths]
+                readers = [future.result for future in futures]
+            else:
+                readers = [lambda path=path: read_dbf_file(path) for path in paths]
+
+            file_columns = []
+            for filename, read in zip(dbf_files, readers):
+                try:
+                    file_columns.append((filename, read()))
+                except Exception as e:
+                    self.logger.error(f"Ошибка чтения файла {filename}: {str(e)}")
+            return file_columns
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def iter_merged_records(self, input_dir: str) -> Iterator[Dict]:
+        """Потоково отдает объединенные записи по SN.
+
+        Записи читаются из файлов по одной и группируются по SN в памяти; если их
+        больше spill_threshold, группировка продолжается через временные файлы на диске.
+        """
+        dbf_files = self._list_dbf_files(input_dir)
+        failed_files = set()
+
+        for sn, records in self._group_by_sn(self._iter_dbf_records(input_dir, dbf_files, failed_files),
+                                             failed_files):
+            yield from self._merge_sn_records(sn, records)
+
+    @staticmethod
+    def _count_records(input_dir: str, dbf_files: List[str]) -> int:
+        """Количество записей по заголовкам файлов, без чтения данных"""
+        total = 0
+        for filename in dbf_files:
+            try:
+                with open(os.path.join(input_dir, filename), 'rb') as f:
+                    total += read_dbf_header(f.read(32)).numrecords
+            except Exception:
+                continue
+        return total
+
+    def _list_dbf_files(self, input_dir: str) -> List[str]:
         if not os.path.isdir(input_dir):
             raise ValueError(f"Директория не существует: {input_dir}")
 
-        # Получаем все DBF файлы, исключая начинающиеся на D
-        dbf_files = [
+        # Получаем все DBF файлы, исключая начинающиеся на D. Порядок файлов задает префиксы
+        # повторяющихся колонок (eu.DATO), поэтому он алфавитный, как в Windows, на любой ФС
+        dbf_files = sorted(
             f for f in os.listdir(input_dir)
             if f.lower().endswith('.dbf') and not f.upper().startswith('D')
-        ]
+        )
 
         if not dbf_files:
             raise ValueError("Не найдено подходящих DBF файлов")
 
-        # Собираем данные из всех файлов, группируя по SN
-        sn_data = defaultdict(list)
-        file_data = {}
+        return dbf_files
 
+    def _iter_dbf_records(self, input_dir: str, dbf_files: List[str],
+                          failed_files: Optional[set] = None) -> Iterator[Tuple[str, Dict]]:
+        """Читает записи DBF файлов по одной, не загружая таблицы целиком.
+
+        Файл с ошибкой чтения добавляется в failed_files: уже отданные записи
+        этого файла отбрасывает _group_by_sn, как если бы файл не читался.
+        """
         for filename in dbf_files:
             filepath = os.path.join(input_dir, filename)
             try:
-                table = list(DBF(filepath, encoding='cp866'))
-                file_data[filename] = table
-                for record in table:
-                    sn = record.get('SN')
-                    if sn is not None:
-                        sn_data[sn].append((filename, dict(record)))
+                for record in self._read_records(filepath):
+                    yield filename, record
             except Exception as e:
                 self.logger.error(f"Ошибка чтения файла {filename}: {str(e)}")
+                if failed_files is not None:
+                    failed_files.add(filename)
                 continue
 
-        if not sn_data:
-            raise ValueError("Нет данных для объединения")
+    def _read_records(self, filepath: str) -> Iterator[Dict]:
+        """Читает записи через колоночный декодер, при неподдерживаемом формате - через dbfread"""
+        try:
+            chunks = iter_dbf_columns(filepath, encoding='cp866')
+            first = next(chunks, None)
+        except UnsupportedDBF as e:
+            self.logger.debug(f"{filepath}: {str(e)}, читаем через dbfread")
+            yield from DBF(filepath, encoding='cp866', recfactory=dict)
+            return
 
-        # Создаем объединенные записи с дублированием
-        merged_data = []
+        if first is None:
+            return
+        for columns in itertools.chain([first], chunks):
+            yield from _columns_to_records(columns)
+
+    def _group_by_sn(self, records: Iterator[Tuple[str, Dict]],
+                     failed_files: Optional[set] = None) -> Iterator[Tuple[Any, List[Tuple[str, Dict]]]]:
+        """Группирует записи по SN, при большом объеме сбрасывая их на диск.
+
+        Группы отдаются после чтения всех записей; записи файлов из failed_files
+        (прочитанных с ошибкой) в группы не попадают.
+        """
+        sn_data = defaultdict(list)
+        count = 0
+        spill = None
+
+        for filename, record in records:
+            sn = record.get('SN')
+            if sn is None:
+                continue
+            if spill is not None:
+                spill.add(sn, filename, record)
+                continue
+
+            sn_data[sn].append((filename, record))
+            count += 1
+            if count > self.spill_threshold:
+                self.logger.info(f"Записей больше {self.spill_threshold}, группировка по SN продолжается на диске")
+                spill = _SNSpill(self.spill_partitions)
+                for spilled_sn, spilled_records in sn_data.items():
+                    for spilled_filename, spilled_record in spilled_records:
+                        spill.add(spilled_sn, spilled_filename, spilled_record)
+                sn_data = None
 
-        for sn, records in sn_data.items():
-            # Группируем записи по файлам
-            files_records = defaultdict(list)
-            for filename, record in records:
-                files_records[filename].append(record)
+        groups = sn_data.items() if spill is None else spill.iter_groups()
+        try:
+            for sn, sn_records in groups:
+                if failed_files:
+                    sn_records = [item for item in sn_records if item[0] not in failed_files]
+                    if not sn_records:
+                        continue
+                yield sn, sn_records
+        finally:
+            if spill is not None:
+                spill.close()
 
-            # Получаем максимальное количество записей для этого SN
-            max_count = max(len(recs) for recs in files_records.values())
+    @staticmethod
+    def _merge_sn_records(sn: Any, records: List[Tuple[str, Dict]]) -> List[Dict]:
+        """Создает объединенные записи одного SN с дублированием"""
+        # Группируем записи по файлам
+        files_records = defaultdict(list)
+        for filename, record in records:
+            files_records[filename].append(record)
 
-            # Создаем дублированные записи
-            for i in range(max_count):
-                merged_record = {'SN': sn}
-                for filename, records in files_records.items():
-                    record = records[i % len(records)]  # Циклически выбираем записи
-                    for key, value in record.items():
-                        if key != 'SN':
-                            merged_record[f"{('e' + filename[0].lower() + '.') if key in merged_record.keys() else ''}{key}"] = value
-                merged_data.append(merged_record)
+        # Получаем максимальное количество записей для этого SN
+        max_count = max(len(recs) for recs in files_records.values())
 
-        return pd.DataFrame(merged_data)
+        # Создаем дублированные записи
+        merged_data = []
+        for i in range(max_count):
+            merged_record = {'SN': sn}
+            for filename, records in files_records.items():
+                record = records[i % len(records)]  # Циклически выбираем записи
+                for key, value in record.items():
+                    if key != 'SN':
+                        merged_record[f"{('e' + filename[0].lower() + '.') if key in merged_record.keys() else ''}{key}"] = value
+            merged_data.append(merged_record)
+        return merged_data
 
     def extract_spn_dato_pairs(self, df: pd.DataFrame) -> List[Dict]:
         """Извлекает пары SPN и DATO из объединенного DataFrame"""
-        pairs = []
-        for _, row in df.iterrows():
-            # Ищем все колонки SPN и DATO в объединенных данных
-            spn_cols = [col for col in df.columns if col.startswith('SPN')]
-            dato_cols = [col for col in df.columns if col.startswith('eu.DATO')]
-
-            for idx, spn_col in enumerate(spn_cols):
-                filename = spn_col[4:]  # Извлекаем имя файла
-                spn = row[spn_col]
-                dato = row[dato_cols[idx]]
-                if pd.notna(spn) and pd.notna(dato):
-                    pairs.append({
-                        'SN': row['SN'],
-                        'SPN': spn,
-                        'DATO': dato,
-                        'source_file': filename
-                    })
-        return pairs
\ No newline at end of file
+        return self.extract_spn_dato_frame(df).to_dict('records')
+
+    def extract_spn_dato_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Извлекает пары SPN и DATO в DataFrame с колонками SN, SPN, DATO, source_file.
+
+        Порядок строк тот же, что у extract_spn_dato_pairs: по строкам df, внутри строки - по парам колонок.
+        """
+        # Ищем все колонки SPN и DATO в объединенных данных один раз
+        spn_cols = [col for col in df.columns if col.startswith('SPN')]
+        dato_cols = [col for col in df.columns if col.startswith('eu.DATO')]
+
+        frames = []
+        for idx, (spn_col, dato_col) in enumerate(zip(spn_cols, dato_cols)):
+            frame = pd.DataFrame({
+                'SN': df['SN'].to_numpy(),
+                'SPN': df[spn_col].to_numpy(),
+                'DATO': df[dato_col].to_numpy(),
+                'source_file': spn_col[4:],  # Извлекаем имя файла
+                '_row': np.arange(len(df)),
+                '_pair': idx
+            })
+            frames.append(frame[frame['SPN'].notna() & frame['DATO'].notna()])
+
+        if not frames:
+            return pd.DataFrame(columns=['SN', 'SPN', 'DATO', 'source_file'])
+
+        pairs = pd.concat(frames, ignore_index=True)
+        if len(frames) > 1:
+            pairs = pairs.sort_values(['_row', '_pair'], kind='stable', ignore_index=True)
+        return pairs.drop(columns=['_row', '_pair'])
@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font
+from openpyxl.utils import get_column_letter
+from openpyxl.workbook import Workbook
+
+
+class ComparisonWriter:
+    """Потоковая запись результатов сравнения в xlsx.
+
+    Строки пишутся сразу через write-only режим openpyxl, стили заданы один раз
+    именованными стилями книги. В write-only режиме ширины колонок должны быть
+    известны до первой строки, поэтому первые width_sample строк буферизуются
+    и ширины считаются только по ним.
+    """
+    headers = ['Field', 'DBF_Value', 'DB_Value', 'Status']
+
+    def __init__(self, output_path: str, header_fill: PatternFill, header_font: Font, diff_fill: PatternFill,
+                 dbf_fill: PatternFill, db_fill: PatternFill, sheet_title: str = "Comparison Results",
+                 width_sample: int = 1000):
+        self.output_path = output_path
+        self.width_sample = width_sample
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(sheet_title)
+
+        styles = {
+            'title': NamedStyle(name='cmp_title', fill=header_fill, font=header_font),
+            'header': NamedStyle(name='cmp_header', font=header_font),
+            'diff': NamedStyle(name='cmp_diff', fill=diff_fill),
+            'dbf': NamedStyle(name='cmp_dbf', fill=dbf_fill),
+            'db': NamedStyle(name='cmp_db', fill=db_fill),
+        }
+        for style in styles.values():
+            self.wb.add_named_style(style)
+
+        # Стиль каждой из четырех колонок для каждого вида строки
+        self._row_styles = {
+            'Title': ['cmp_title'] * 4,
+            'Header': ['cmp_header'] * 4,
+            'DIFF': ['cmp_diff'] * 4,
+            'Data': [None, 'cmp_dbf', 'cmp_db', None],
+            'Separator': [None] * 4,
+        }
+        self.widths = [0] * len(self.headers)
+        self.rows_written = 0
+        self._buffer: Optional[List[Tuple[List[Any], str]]] = []
+        self._append(self.headers, 'Title')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def write(self, row_type: str, field: Any, dbf_value: Any, db_value: Any, status: str):
+        """Записывает одну строку сравнения (Header, Data или Separator)"""
+        if row_type == 'Separator':
+            self._append(['---'] * 4, 'Separator')
+        elif row_type == 'Header':
+            self._append([field, dbf_value, db_value, status], 'Header')
+        elif status == 'DIFF':
+            self._append([field, dbf_value, db_value, status], 'DIFF')
+        else:
+            self._append([field, dbf_value, db_value, status], 'Data')
+
+    def write_record(self, row_data: Dict):
+        self.write(row_data['Type'], row_data['Field'], row_data['DBF_Value'], row_data['DB_Value'],
+                   row_data['Status'])
+
+    def _append(self, values: List[Any], row_type: str):
+        if self._buffer is not None:
+            widths = self.widths
+            for i, value in enumerate(values):
+                length = len(str(value))
+                if length > widths[i]:
+                    widths[i] = length
+            self._buffer.append((values, row_type))
+            if len(self._buffer) >= self.width_sample:
+                self._flush_buffer()
+        else:
+            self._write_row(values, row_type)
+
+    def _flush_buffer(self):
+        for i, width in enumerate(self.widths):
+            self.ws.column_dimensions[get_column_letter(i + 1)].width = (width + 2) * 1.2
+        buffer, self._buffer = self._buffer, None
+        for values, row_type in buffer:
+            self._write_row(values, row_type)
+
+    def _write_row(self, values: List[Any], row_type: str):
+        row = []
+        for value, style in zip(values, self._row_styles[row_type]):
+            if style is None:
+                row.append(value)
+            else:
+                cell = WriteOnlyCell(self.ws, value=value)
+                cell.style = style
+                row.append(cell)
+        self.ws.append(row)
+        self.rows_written += 1
+
+    def close(self):
+        if self._buffer is not None:
+            self._flush_buffer()
+        self.wb.save(self.output_path)
+
+
+def save_tables(output_path: str, tables: Dict[str, pd.DataFrame], header_font: Optional[Font] = None,
+                width_sample: int = 1000):
+    """Потоково сохраняет таблицы на отдельные листы xlsx (имя листа - ключ словаря).
+
+    Пустые таблицы пропускаются. Ширина колонок считается по заголовку и
+    первым width_sample строкам.
+    """
+    wb = Workbook(write_only=True)
+    header_style = NamedStyle(name='table_header', font=header_font or Font(bold=True))
+    wb.add_named_style(header_style)
+
+    for sheet_name, df in tables.items():
+        if df.empty:
+            continue
+        ws = wb.create_sheet(sheet_name[:31])  # Ограничение Excel на длину имени листа
+        values = df.astype(object).where(df.notna(), None)
+
+        widths = [len(str(col)) for col in df.columns]
+        for row in values.head(width_sample).itertuples(index=False):
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(str(value)))
+        for i, width in enumerate(widths):
+            ws.column_dimensions[get_column_letter(i + 1)].width = width + 2
+
+        header = []
+        for col in df.columns:
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.style = 'table_header'
+            header.append(cell)
+        ws.append(header)
+        for row in values.itertuples(index=False):
+            ws.append(list(row))
+
+    if not wb.worksheets:
+        wb.create_sheet('Empty')
+    wb.save(output_path)
@@ -0,0 +1,75 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+from config import snapshot_p_query, snapshot_u_query
+from db_query import DBQuery
+
+
+class ExportSnapshot:
+    """Локальный срез exportfilep/exportfileu для сверки без запроса на каждую пару.
+
+    Строки exportfilep с максимальным NS для нужных SPN отбираются на сервере
+    блоками по spn_chunk SPN. Затем потоком читаются строки exportfileu
+    с этими NS и соединяются с ними по SN и NS так же, как в main_query.
+    Совпадающие колонки exportfileu получают префикс 'eu.', как у DictCursor.
+    Результат хранится в индексе по (SPN, DATO).
+    """
+
+    def __init__(self, fetch_size: int = 10000, spn_chunk: int = 1000, ns_chunk: int = 1000):
+        self.fetch_size = fetch_size
+        self.spn_chunk = spn_chunk
+        self.ns_chunk = ns_chunk
+        self.logger = logging.getLogger('ExportSnapshot')
+        self.rows_by_key: Dict[Tuple[str, str], List[Dict]] = defaultdict(list)
+
+    @staticmethod
+    def key(spn) -> str:
+        """SPN так, как его сравнивает MySQL: без учета регистра и хвостовых пробелов"""
+        return str(spn).rstrip().upper()
+
+    def load(self, db_query: DBQuery, spns: Iterable) -> 'ExportSnapshot':
+        wanted = sorted({self.key(spn) for spn in spns})
+
+        # Строки exportfilep с максимальным NS своего SPN; сравнение SPN на сервере,
+        # как и key(), не учитывает регистр и хвостовые пробелы
+        p_rows = defaultdict(list)
+        found = set()
+        for start in range(0, len(wanted), self.spn_chunk):
+            chunk = wanted[start:start + self.spn_chunk]
+            query = snapshot_p_query.replace('{SPN_LIST}', ', '.join(['%s'] * len(chunk)))
+            for row in db_query.iter_query(query, tuple(chunk), fetch_size=self.fetch_size):
+                key = self.key(row['SPN'])
+                p_rows[(row['SN'], row['NS'])].append((key, row))
+                found.add(key)
+        self.logger.info(f"exportfilep: найдено SPN {len(found)} из {len(wanted)}")
+
+        ns_values = sorted({ns for _, ns in p_rows})
+        u_count = 0
+        for start in range(0, len(ns_values), self.ns_chunk):
+            chunk = ns_values[start:start + self.ns_chunk]
+            query = snapshot_u_query.replace('{NS_LIST}', ', '.join(['%s'] * len(chunk)))
+            for u_row in db_query.iter_query(query, tuple(chunk), fetch_size=self.fetch_size):
+                for key, p_row in p_rows.get((u_row['SN'], u_row['NS']), ()):
+                    joined = dict(p_row)
+                    for col, value in u_row.items():
+                        joined[f'eu.{col}' if col in p_row else col] = value
+                    self.rows_by_key[(key, str(u_row['DATO']))].append(joined)
+                    u_count += 1
+        self.logger.info(f"exportfileu: соединено строк {u_count}")
+        return self
+
+    def lookup(self, pairs: List[Dict]) -> Tuple[List[Dict], int]:
+        """Строки для пар (SPN, DATO, source_file) и количество пар без строк, как в построчном режиме"""
+        db_results = []
+        not_found = 0
+        for pair in pairs:
+            matched = self.rows_by_key.get((self.key(pair['SPN']), str(pair['DATO'])))
+            if not matched:
+                not_found += 1
+                continue
+            for row in matched:
+                row = dict(row)
+                row['SPN'] = pair['SPN']
+                row['source_file'] = pair['source_file']
+                db_results.append(row)
+        return db_results, not_found
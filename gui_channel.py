@@ -0,0 +1,72 @@
+import queue
+import time
+from typing import Callable, List, Optional
+
+
+class GuiChannel:
+    """Канал событий от рабочих потоков к окну Tk.
+
+    Рабочие потоки только кладут события в очередь и не трогают виджеты.
+    Главный цикл раз в poll_ms забирает все накопленные события: строки лога
+    передаются в on_log одним списком, из обновлений прогресса применяется
+    последнее и не чаще max_progress_rate раз в секунду, остальные действия
+    (диалоги, состояние кнопок) выполняются в порядке поступления.
+    """
+
+    def __init__(self, root, on_log: Callable[[List[str]], None], on_progress: Callable[[int, int], None],
+                 poll_ms: int = 100, max_progress_rate: float = 10):
+        self.root = root
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.poll_ms = poll_ms
+        self.progress_interval = 1 / max_progress_rate
+        self._events = queue.Queue()
+        self._pending_progress: Optional[tuple] = None
+        self._last_progress = 0.0
+
+    def start(self):
+        self.root.after(self.poll_ms, self._poll)
+
+    def log(self, message: str):
+        self._events.put(('log', message))
+
+    def progress(self, current: int, total: int):
+        self._events.put(('progress', (current, total)))
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Выполняет func(*args, **kwargs) в главном потоке"""
+        self._events.put(('call', (func, args, kwargs)))
+
+    def _poll(self):
+        try:
+            self._drain()
+        finally:
+            self.root.after(self.poll_ms, self._poll)
+
+    def _drain(self):
+        lines = []
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                lines.append(payload)
+            elif kind == 'progress':
+                self._pending_progress = payload
+            else:
+                # Перед диалогом выводим накопленный лог и прогресс, чтобы порядок сообщений сохранился
+                self._flush(lines, force_progress=True)
+                lines = []
+                func, args, kwargs = payload
+                func(*args, **kwargs)
+        self._flush(lines)
+
+    def _flush(self, lines: List[str], force_progress: bool = False):
+        if lines:
+            self.on_log(lines)
+        now = time.monotonic()
+        if self._pending_progress and (force_progress or now - self._last_progress >= self.progress_interval):
+            self.on_progress(*self._pending_progress)
+            self._pending_progress = None
+            self._last_progress = now
@@ -0,0 +1,97 @@
+import logging
+import pickle
+from typing import Optional, Set
+import numpy as np
+import pandas as pd
+from intermediate import find_frame, load_frame, save_frame
+
+
+class IncrementalState:
+    """Состояние прошлой сверки каталога для повторного запуска.
+
+    Хранит хэш содержимого объединенных строк DBF по каждому SN, ключи
+    сравнения этих строк, результаты запросов к базе и последний отчет
+    сравнения с ключами блоков. Таблицы хранятся в Parquet в state_dir
+    рядом с результатами. Значения отчета (DBF_Value, DB_Value) хранятся
+    сериализованными: Parquet привел бы колонку со значениями разных типов к
+    строкам, и повторно использованные блоки отличались бы от полной сверки.
+    """
+
+    files = ('sn_hashes', 'sn_keys', 'db_results', 'comparison')
+    value_columns = ('DBF_Value', 'DB_Value')
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.logger = logging.getLogger('IncrementalState')
+        self.sn_hashes: Optional[pd.Series] = None
+        self.sn_keys: Optional[pd.DataFrame] = None
+        self.db_results: Optional[pd.DataFrame] = None
+        self.comparison: Optional[pd.DataFrame] = None
+
+    def load(self) -> bool:
+        """Загружает прошлое состояние; False, если его нет или оно неполное"""
+        if not all(find_frame(self.state_dir, name) for name in self.files):
+            return False
+        try:
+            for name in self.files:
+                setattr(self, name, load_frame(self.state_dir, name))
+            # Хэши хранятся таблицей SN/HASH, в памяти - Series с индексом SN
+            self.sn_hashes = self.sn_hashes.set_index('SN')['HASH']
+            for column in self.value_columns:
+                self.comparison[column] = self.comparison[column].map(pickle.loads).astype(object)
+            return True
+        except Exception as e:
+            self.logger.error(f"Не удалось прочитать состояние {self.state_dir}: {str(e)}")
+            return False
+
+    def save(self):
+        for name in self.files:
+            df = getattr(self, name)
+            if name == 'sn_hashes':
+                df = pd.DataFrame({'SN': df.index.to_numpy(), 'HASH': df.to_numpy()})
+            elif name == 'comparison':
+                df = df.assign(**{column: df[column].map(pickle.dumps) for column in self.value_columns})
+            save_frame(df, self.state_dir, name)
+
+    @staticmethod
+    def hash_sn_rows(dbf_df: pd.DataFrame) -> pd.Series:
+        """Хэш содержимого всех объединенных строк каждого SN (с учетом порядка строк и набора колонок)"""
+        row_hashes = pd.util.hash_pandas_object(dbf_df.astype(str), index=False).to_numpy()
+        positions = dbf_df.groupby('SN', sort=False).cumcount().to_numpy().astype(np.uint64)
+        columns_hash = np.uint64(pd.util.hash_array(np.array(['|'.join(map(str, dbf_df.columns))], dtype=object))[0])
+        with np.errstate(over='ignore'):
+            # Позиция смешивается с хэшем строки до нелинейного хэширования: иначе сумма
+            # по SN не зависит от того, какая строка на каком месте
+            mixed = pd.util.hash_array(row_hashes ^ columns_hash ^ positions * np.uint64(0x9E3779B97F4A7C15))
+        return pd.Series(mixed, index=dbf_df['SN'].to_numpy()).groupby(level=0, sort=False).sum()
+
+    def changed_keys(self, sn_hashes: pd.Series, sn_keys: pd.DataFrame) -> Set[str]:
+        """Ключи сравнения, которые нужно пересчитать.
+
+        Это ключи строк SN, которые появились, исчезли или изменились, и ключи
+        блоков, в которых в прошлый раз были различия.
+        """
+        old = self.sn_hashes
+        common = old.index.intersection(sn_hashes.index)
+        changed = set(common[old.loc[common].to_numpy() != sn_hashes.loc[common].to_numpy()])
+        changed |= set(old.index.difference(sn_hashes.index))
+        changed |= set(sn_hashes.index.difference(old.index))
+
+        keys = set(sn_keys.loc[sn_keys['SN'].isin(changed), 'COMP_KEY'])
+        keys |= set(self.sn_keys.loc[self.sn_keys['SN'].isin(changed), 'COMP_KEY'])
+        keys |= set(self.comparison.loc[self.comparison['Status'] == 'DIFF', 'COMP_KEY'])
+        return keys
+
+    @staticmethod
+    def renumber(comparison: pd.DataFrame) -> pd.DataFrame:
+        """Перенумеровывает строки DBF в заголовках объединенного отчета"""
+        headers = comparison['Type'] == 'Header'
+        if not headers.any():
+            return comparison
+        parts = comparison.loc[headers, 'Field'].str.split('. ', n=1, expand=True)
+        # Смежные заголовки одной строки DBF имеют один номер и один ключ
+        block_id = (parts[0] + '|' + comparison.loc[headers, 'COMP_KEY'].astype(str))
+        new_numbers = (block_id != block_id.shift()).cumsum()
+        comparison = comparison.copy()
+        comparison.loc[headers, 'Field'] = new_numbers.astype(str) + '. ' + parts[1]
+        return comparison
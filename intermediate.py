@@ -0,0 +1,63 @@
+import logging
+import os
+from typing import Optional
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger('Intermediate')
+
+EXTENSION = '.parquet'
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError("Для промежуточных таблиц (Parquet) нужен пакет pyarrow")
+
+
+def parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит к строкам колонки object со значениями разных типов.
+
+    Parquet хранит у колонки один тип, а в данных DBF и базы одна колонка
+    может содержать, например, строки и числа. Пустые значения сохраняются.
+    """
+    mixed = []
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        values = df[column].dropna()
+        if values.map(type).nunique() > 1:
+            mixed.append(column)
+    if not mixed:
+        return df
+    df = df.copy()
+    for column in mixed:
+        df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    logger.debug(f"Колонки приведены к строкам для Parquet: {', '.join(map(str, mixed))}")
+    return df
+
+
+def save_frame(df: pd.DataFrame, directory: str, name: str) -> str:
+    """Сохраняет промежуточную таблицу name в directory в Parquet, возвращает путь файла"""
+    _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + EXTENSION)
+    parquet_safe(df).to_parquet(path, index=False)
+    return path
+
+
+def find_frame(directory: str, name: str) -> Optional[str]:
+    path = os.path.join(directory, name + EXTENSION)
+    return path if os.path.exists(path) else None
+
+
+def load_frame(directory: str, name: str) -> Optional[pd.DataFrame]:
+    """Читает промежуточную таблицу name из directory; None, если её нет"""
+    path = find_frame(directory, name)
+    if path is None:
+        return None
+    _require_pyarrow()
+    return pd.read_parquet(path)
@@ -0,0 +1,129 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class KeyIndex:
+    """Хэш-индекс строк DataFrame по ключу сравнения SPN + eu.DATO.
+
+    Строкам присваиваются коды ключей, позиции строк группируются по кодам
+    один раз; поиск группы ключа - словарь и срез массива. Индекс можно
+    наполнять блоками (add) по мере поступления строк, например пока идет
+    объединение DBF или запросы к базе; позиции блоков идут подряд.
+    Исходные DataFrame не изменяются.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._chunks: List[np.ndarray] = []
+        self._size = 0
+        self._row_codes: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+        self._starts: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, spn_col: str = 'SPN', dato_col: str = 'eu.DATO') -> 'KeyIndex':
+        index = cls()
+        index.add_frame(df, spn_col, dato_col)
+        return index
+
+    @staticmethod
+    def make_keys(df: pd.DataFrame, spn_col: str = 'SPN', dato_col: str = 'eu.DATO') -> pd.Series:
+        """Ключ сравнения строки: SPN и DATO через подчеркивание"""
+        return df[spn_col].astype(str) + '_' + df[dato_col].astype(str)
+
+    def add_frame(self, df: pd.DataFrame, spn_col: str = 'SPN', dato_col: str = 'eu.DATO'):
+        self.add(self.make_keys(df, spn_col, dato_col).to_numpy(dtype=object))
+
+    def add(self, keys):
+        """Добавляет ключи очередных строк; в словарь попадают только новые уникальные ключи блока.
+
+        Пустой ключ (SPN или DATO нет) получает код -1: такие строки ни с чем не сопоставляются.
+        """
+        chunk_codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+        mapping = np.empty(len(uniques) + 1, dtype=np.int64)
+        mapping[-1] = -1
+        for i, key in enumerate(uniques):
+            code = self._codes.get(key)
+            if code is None:
+                code = self._codes[key] = len(self._keys)
+                self._keys.append(key)
+            mapping[i] = code
+        self._chunks.append(mapping[chunk_codes] if len(chunk_codes) else np.empty(0, dtype=np.int64))
+        self._size += len(chunk_codes)
+        self._row_codes = None
+
+    def _build(self):
+        if self._row_codes is not None:
+            return
+        self._row_codes = np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=np.int64)
+        self._chunks = [self._row_codes]
+        # Позиции, сгруппированные по коду ключа; внутри группы - по возрастанию
+        valid = np.flatnonzero(self._row_codes >= 0)
+        valid_codes = self._row_codes[valid]
+        self._order = valid[np.argsort(valid_codes, kind='stable')]
+        counts = np.bincount(valid_codes, minlength=len(self._keys))
+        self._starts = np.concatenate(([0], np.cumsum(counts)))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key) -> bool:
+        return key in self._codes
+
+    @property
+    def keys(self) -> List[str]:
+        """Уникальные ключи в порядке первого появления"""
+        return list(self._keys)
+
+    def positions(self, key) -> np.ndarray:
+        """Позиции строк с ключом key (пустой массив, если ключа нет)"""
+        code = self._codes.get(key)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        self._build()
+        return self._order[self._starts[code]:self._starts[code + 1]]
+
+    def positions_of(self, keys) -> np.ndarray:
+        """Позиции строк с любым из ключей keys, по возрастанию"""
+        self._build()
+        codes = np.array([self._codes[key] for key in keys if key in self._codes], dtype=np.int64)
+        return np.flatnonzero(np.isin(self._row_codes, codes))
+
+    def row_keys(self, positions: np.ndarray) -> np.ndarray:
+        """Ключи строк по их позициям (None для строк без ключа)"""
+        self._build()
+        keys = np.asarray(self._keys + [None], dtype=object)
+        return keys[self._row_codes[positions]]
+
+    def intersection(self, other: 'KeyIndex') -> List[str]:
+        """Общие ключи в порядке первого появления в этом индексе"""
+        return [key for key in self._keys if key in other._codes]
+
+    def join(self, other: 'KeyIndex') -> Tuple[np.ndarray, np.ndarray]:
+        """Все пары позиций строк (этот индекс, other) с общим ключом.
+
+        Порядок: ключи по первому появлению в этом индексе, внутри ключа -
+        позиции этого индекса, затем позиции other по возрастанию.
+        """
+        self._build()
+        other._build()
+        codes = np.arange(len(self._keys))
+        other_codes = np.array([other._codes.get(key, -1) for key in self._keys], dtype=np.int64)
+        matched = other_codes >= 0
+        codes, other_codes = codes[matched], other_codes[matched]
+
+        left_counts = self._starts[codes + 1] - self._starts[codes]
+        right_counts = other._starts[other_codes + 1] - other._starts[other_codes]
+        sizes = left_counts * right_counts
+        total = int(sizes.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        offsets = np.repeat(np.cumsum(sizes) - sizes, sizes)
+        inner = np.arange(total) - offsets
+        right_width = np.repeat(right_counts, sizes)
+        left_pos = self._order[np.repeat(self._starts[codes], sizes) + inner // right_width]
+        right_pos = other._order[np.repeat(other._starts[other_codes], sizes) + inner % right_width]
+        return left_pos, right_pos
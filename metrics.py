@@ -0,0 +1,206 @@
+import contextlib
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными границами корзин в миллисекундах"""
+    bounds_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        for i, bound in enumerate(self.bounds_ms):
+            if ms <= bound:
+                break
+        else:
+            i = len(self.bounds_ms)
+        self.buckets[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q (в мс)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                bound = self.bounds_ms[i] if i < len(self.bounds_ms) else float('inf')
+                return round(min(bound, self.max * 1000), 3)
+        return round(self.max * 1000, 3)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max * 1000, 3),
+            'buckets': {f"<={bound}ms": count for bound, count in zip(self.bounds_ms, self.buckets)}
+                       | {f">{self.bounds_ms[-1]}ms": self.buckets[-1]},
+        }
+
+
+class Metrics:
+    """Метрики прогона: время стадий, задержки запросов, скорость обработки строк, память.
+
+    Общий объект metrics собирает данные модулей по умолчанию; одновременные
+    прогоны (каталоги cli.py) получают по своему объекту Metrics, который
+    передается в DBFMerger. Прогон оформляется через run(): метрики
+    сбрасываются, по желанию включаются cProfile и tracemalloc, в конце отчет
+    сохраняется в JSON и CSV и сводка пишется в лог 'Metrics'.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('Metrics')
+        self._lock = threading.Lock()
+        self.trace_memory = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.run_name = ''
+            self.stages: List[Dict] = []
+            self.histograms: Dict[str, LatencyHistogram] = {}
+            self.values: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Dict]:
+        """Замеряет стадию; количество строк можно задать в rows или в record['rows'] внутри блока"""
+        record = {'stage': name, 'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            if record['rows'] and record['seconds']:
+                record['rows_per_sec'] = round(record['rows'] / record['seconds'], 1)
+            with self._lock:
+                self.stages.append(record)
+
+    def observe(self, name: str, seconds: float):
+        """Добавляет задержку в гистограмму name"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def set_value(self, name: str, value: float):
+        with self._lock:
+            self.values[name] = value
+
+    def max_value(self, name: str, value: float):
+        """Сохраняет максимум из уже записанного и value (пиковые величины)"""
+        with self._lock:
+            self.values[name] = max(self.values.get(name, value), value)
+
+    def frame_memory(self, name: str, df):
+        """Записывает пиковый размер DataFrame в МБ (с учетом объектов - только при trace_memory)"""
+        size = df.memory_usage(index=True, deep=self.trace_memory).sum()
+        self.max_value(name, round(size / 2 ** 20, 1))
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                'run': self.run_name,
+                'stages': [dict(stage) for stage in self.stages],
+                'latency': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                'values': dict(self.values),
+            }
+
+    def save(self, output_dir: str = 'results') -> str:
+        """Сохраняет отчет в metrics_<run>_<время>.json и стадии в .csv рядом, возвращает путь JSON"""
+        os.makedirs(output_dir, exist_ok=True)
+        report = self.report()
+        base = os.path.join(output_dir, f"metrics_{report['run'] or 'run'}_{time.strftime('%Y%m%d_%H%M%S')}")
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        with open(base + '.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['stage', 'seconds', 'rows', 'rows_per_sec'], extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(report['stages'])
+        return base + '.json'
+
+    def summary_lines(self) -> List[str]:
+        report = self.report()
+        lines = []
+        for stage in report['stages']:
+            speed = f", {stage['rows_per_sec']} строк/с" if stage.get('rows_per_sec') else ''
+            lines.append(f"{stage['stage']}: {stage['seconds']} с{speed}")
+        for name, latency in report['latency'].items():
+            lines.append(f"{name}: {latency['count']} запросов, p50 {latency['p50_ms']} мс, "
+                         f"p95 {latency['p95_ms']} мс, max {latency['max_ms']} мс")
+        for name, value in report['values'].items():
+            lines.append(f"{name}: {value}")
+        return lines
+
+    @contextlib.contextmanager
+    def run(self, name: str, profile: bool = False, trace_memory: bool = False,
+            output_dir: Optional[str] = 'results'):
+        """Прогон с отчетом в output_dir; profile включает cProfile, trace_memory - tracemalloc.
+
+        cProfile профилирует только поток, вызвавший run(), а tracemalloc
+        действует на весь процесс, поэтому профилировать можно один прогон за раз.
+        """
+        # Профилировщики импортируются только когда нужны: модуль загружается при старте GUI и CLI
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        self.reset()
+        self.run_name = name
+        self.trace_memory = trace_memory
+        profiler = cProfile.Profile() if profile else None
+        if trace_memory:
+            tracemalloc.start()
+        if profiler:
+            profiler.enable()
+        try:
+            with self.stage('total'):
+                yield self
+        finally:
+            if profiler:
+                profiler.disable()
+            if trace_memory:
+                self.set_value('traced_peak_mb', round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1))
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            self.trace_memory = False
+
+            for line in self.summary_lines():
+                self.logger.info(f"{name}: {line}")
+            if output_dir:
+                try:
+                    path = self.save(output_dir)
+                    base = path[:-len('.json')]
+                    if profiler:
+                        profiler.dump_stats(base + '.prof')
+                        with open(base + '_profile.txt', 'w', encoding='utf-8') as f:
+                            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+                    if trace_memory:
+                        with open(base + '_memory.txt', 'w', encoding='utf-8') as f:
+                            for stat in snapshot.statistics('lineno')[:40]:
+                                f.write(f"{stat}\n")
+                    self.logger.info(f"Отчет метрик сохранен: {path}")
+                except OSError as e:
+                    self.logger.error(f"Ошибка сохранения отчета метрик: {str(e)}")
+
+
+# Общий сборщик метрик для всех модулей
+metrics = Metrics()
@@ -5,8 +5,13 @@ import pymysql
 from pymysql import cursors
 import logging
 import os
-from typing import Dict, Optional, List, Tuple
-from config import client_policy_query, exportfile_query
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, List, Tuple
+from config import (alternative_table_aliases, client_policy_query, database_table_aliases, exportfile_query,
+                    schema_cache_ttl)
+from db_pool import DBQueryPool
+from db_query import compile_query
+from schema_cache import SchemaCache
 
 
 class PatientSearcher:
@@ -22,16 +27,29 @@ class PatientSearcher:
             'exportfileo': ['exportfileo'],
             'exportfilel': ['exportfilel']
         }
-        self.table_aliases_2 = {
-            'exportfilep': ['vasP'],
-            'exportfileu': ['`123`'],
-            'exportfileo': ['vasO'],
-            'exportfilel': ['vasL']
-        }
-        self.sn = None
+        self.table_aliases_2 = alternative_table_aliases
+        # Базы с заранее известными названиями таблиц (config.database_table_aliases)
+        self.database_aliases = database_table_aliases
+        # Структура баз для выбора названий таблиц
+        self.schema_cache = SchemaCache(ttl=schema_cache_ttl)
+
+    def search_patients(self, db1_params: Dict, db2_params: Dict,
+                        progress_callback: Optional[Callable[[int, int], None]] = None
+                        ) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Поиск пациента одновременно в двух базах, результаты - в порядке баз"""
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='PatientSearch') as executor:
+            futures = [executor.submit(self.search_patient, params) for params in (db1_params, db2_params)]
+            for done, _ in enumerate(as_completed(futures), 1):
+                if progress_callback:
+                    progress_callback(done, len(futures))
+            return futures[0].result(), futures[1].result()
 
     def search_patient(self, db_params: Dict) -> Optional[Dict]:
-        """Поиск пациента и его данных в таблицах с учетом возможных альтернативных названий"""
+        """Поиск пациента и его данных в таблицах с учетом возможных альтернативных названий.
+
+        SN, найденный в exportfilep, передается в поиск остальных таблиц явно,
+        поэтому несколько поисков могут идти одновременно.
+        """
         if self.stop_search:
             return None
 
@@ -46,7 +64,7 @@ class PatientSearcher:
             )
 
             # 1. Находим полис клиента
-            policy_data = self._find_client_policy(connection, db_params)
+            policy_data = self.find_client_policy(connection, db_params)
             if not policy_data:
                 self.logger.warning(f"Пациент не найден в {db_params['database']}")
                 return None
@@ -54,27 +72,33 @@ class PatientSearcher:
             # 2. Ищем данные в таблицах, проверяя возможные варианты названий
             exportfile_results = {}
 
-            if db_params['database'] == 's12pays202504041322':
-                aliaseses = self.table_aliases_2
-            else:
-                aliaseses = self.table_aliases
-
-            for base_table, aliases in aliaseses.items():
-                table_data = None
-                for table_name in aliases:
-                    try:
-                        table_data = self._search_exportfile(connection, policy_data['number'], table_name,
-                                                             db_params['database'])
+            # exportfilep ищем первой: из нее берется SN для остальных таблиц
+            tables = list(self.get_table_aliases(connection, db_params).items())
+            first_table, first_aliases = tables[0]
+            table_data = self._search_table_aliases(connection, 'tbl.SPN', policy_data['number'], first_table,
+                                                    first_aliases, db_params['database'])
+            if table_data:
+                exportfile_results[first_table] = table_data
+            sn = str(table_data[0]['SN']) if table_data else None
+
+            # Остальные таблицы запрашиваем параллельно, каждую через свое подключение
+            if sn and len(tables) > 1 and not self.stop_search:
+                with DBQueryPool(
+                        host=db_params['host'],
+                        user=db_params['user'],
+                        password=db_params['password'],
+                        database=db_params['database'],
+                        workers=db_params.get('workers', len(tables) - 1),
+                        connect_timeout=10
+                ) as pool:
+                    results = pool.map(
+                        lambda db_query, table: self._search_table_aliases(
+                            db_query.connection, 'tbl.SN', sn, table[0], table[1], db_params['database']),
+                        tables[1:]
+                    )
+                    for (base_table, _), table_data in zip(tables[1:], results):
                         if table_data:
-                            # Сохраняем с основным названием таблицы для единообразия
                             exportfile_results[base_table] = table_data
-                            break
-                    except pymysql.Error as e:
-                        self.logger.debug(
-                            f"Таблица {table_name} не найдена в {db_params['database']}, пробуем следующий вариант")
-
-                if not table_data:
-                    self.logger.warning(f"Не удалось найти данные для таблицы {base_table} в {db_params['database']}")
 
             return {
                 'policy': policy_data,
@@ -89,48 +113,84 @@ class PatientSearcher:
             if 'connection' in locals() and connection:
                 connection.close()
 
-    def _find_client_policy(self, connection, db_params: Dict) -> Optional[Dict]:
-        """Поиск полиса клиента (без изменений)"""
+    def get_table_aliases(self, connection, db_params: Dict) -> Dict[str, List[str]]:
+        """Названия таблиц exportfile* в базе.
+
+        Для баз из database_aliases первыми идут их известные названия, структура
+        базы не читается. Для остальных название выбирается по кэшу
+        information_schema из всех известных вариантов: подходит первая
+        существующая таблица с колонкой поиска (SPN или SN). Если структуру базы
+        прочитать не удалось, возвращаются все варианты для перебора.
+        """
+        db_name = db_params['database']
+        known = self.database_aliases.get(db_name)
+        if known:
+            return {base_table: known.get(base_table, []) + [alias for alias in aliases
+                                                             if alias not in known.get(base_table, [])]
+                    for base_table, aliases in self.table_aliases.items()}
+
+        candidates = {base_table: aliases + [alias for alias in self.table_aliases_2.get(base_table, [])
+                                             if alias not in aliases]
+                      for base_table, aliases in self.table_aliases.items()}
+        try:
+            resolved = {}
+            for base_table, aliases in candidates.items():
+                column = 'SPN' if base_table == 'exportfilep' else 'SN'
+                table_name = self.schema_cache.resolve_table(connection, db_params['host'], db_name, aliases, column)
+                if not table_name:
+                    self.logger.warning(f"Таблица {base_table} не найдена в {db_name}")
+                resolved[base_table] = [table_name] if table_name else []
+            return resolved
+        except pymysql.Error as e:
+            self.logger.warning(f"Не удалось прочитать структуру базы {db_name}: {str(e)}")
+            return candidates
+
+    def _search_table_aliases(self, connection, col: str, value, base_table: str, aliases: List[str],
+                              db_name: str) -> Optional[List[Dict]]:
+        """Ищет данные таблицы, перебирая ее возможные названия"""
+        for table_name in aliases:
+            try:
+                table_data = self._search_exportfile(connection, col, value, table_name, db_name)
+                if table_data:
+                    # Сохраняем с основным названием таблицы для единообразия
+                    return table_data
+            except pymysql.Error as e:
+                self.logger.debug(f"Таблица {table_name} не найдена в {db_name}, пробуем следующий вариант")
+
+        self.logger.warning(f"Не удалось найти данные для таблицы {base_table} в {db_name}")
+        return None
+
+    def find_client_policy(self, connection, db_params: Dict) -> Optional[Dict]:
+        """Поиск полиса клиента по ФИО (ключи patient_lastname, patient_firstname, patient_patrname).
+
+        Пустые части ФИО не учитываются, значения передаются параметрами запроса.
+        """
         with connection.cursor() as cursor:
             conditions = 'WHERE Client.deleted = 0 AND cp.deleted = 0'
-            if db_params['patient_lastname']:
-                conditions += f' AND Client.lastName = "{db_params["patient_lastname"]}"'
-            if db_params['patient_firstname']:
-                conditions += f' AND Client.firstName = "{db_params["patient_firstname"]}"'
-            if db_params['patient_patrname']:
-                conditions += f' AND Client.patrName = "{db_params["patient_patrname"]}"'
-
-            query = self.search_query + '\n' + conditions + '\n LIMIT 1'
-            print(f"Выполняем запрос: {query}")
-            cursor.execute(query)
+            params = []
+            for column, key in (('lastName', 'patient_lastname'), ('firstName', 'patient_firstname'),
+                                ('patrName', 'patient_patrname')):
+                if db_params[key]:
+                    conditions += f' AND Client.{column} = %s'
+                    params.append(db_params[key])
+
+            query = self.search_query.replace('%', '%%') + '\n' + conditions + '\n LIMIT 1'
+            self.logger.debug(f"Выполняем запрос: {query} {params}")
+            cursor.execute(query, params)
             return cursor.fetchone()
 
-    def _search_exportfile(self, connection, client_id: int, table_name: str, db_name: str) -> List[Dict]:
-        """Поиск данных в таблице с обработкой разных названий"""
+    def _search_exportfile(self, connection, col: str, value, table_name: str, db_name: str) -> List[Dict]:
+        """Поиск строк таблицы по значению колонки col (tbl.SPN для exportfilep, tbl.SN для остальных)"""
 
         with connection.cursor() as cursor:
             try:
-                if table_name.lower().startswith('exportfilep') or table_name.lower().startswith('vasp'):
-                    query = self.exportfile_query.replace('exportfile', table_name).replace('{col}', 'tbl.SPN').replace(
-                        '{value}', client_id)
-                    if db_name == 's12':
-                        query += f' AND tbl.NS = (SELECT MAX(NS) FROM {table_name} WHERE SPN = "{client_id}")'
-                    print(f"Поиск в {table_name} (база {db_name}) для client_policy={client_id}: \n{query}")
-                    cursor.execute(query)
-                    result = cursor.fetchall()
-                    if result:
-                        self.sn = str(result[0]['SN'])
-                    return result
-                else:
-                    if not self.sn:
-                        return []
-                    query = self.exportfile_query.replace('exportfile', table_name).replace('{col}', 'tbl.SN').replace(
-                        '{value}', self.sn)
-                    if db_name == 's12':
-                        query += f' AND tbl.NS = (SELECT MAX(NS) FROM {table_name} WHERE SN = "{self.sn}")'
-                    print(f"Поиск в {table_name} (база {db_name}) для SN={self.sn}: \n {query}")
-                    cursor.execute(query)
-                    return cursor.fetchall()
+                template = compile_query(self.exportfile_query.replace('exportfile', table_name), col=col)
+                query = template.sql
+                if db_name == 's12':
+                    query += f' AND tbl.NS = (SELECT MAX(NS) FROM {table_name} WHERE {col.split(".")[-1]} = %(value)s)'
+                self.logger.debug(f"Поиск в {table_name} (база {db_name}) для {col}={value}: \n{query}")
+                cursor.execute(query, template.bind({'value': str(value)}))
+                return cursor.fetchall()
             except pymysql.Error as e:
                 self.logger.debug(f"Ошибка при доступе к таблице {table_name}: {str(e)}")
                 raise
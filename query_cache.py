@@ -0,0 +1,157 @@
+import datetime
+import decimal
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class QueryCache:
+    """Постоянный кэш результатов запросов в SQLite.
+
+    Ключ - нормализованный текст запроса, параметры, имя базы и метка снимка
+    (snapshot), которую задает пользователь: при смене снимка старые записи
+    просто перестают совпадать. Записи старше ttl секунд не используются,
+    при превышении max_entries удаляются давно не использованные.
+
+    Файл общий для одновременных прогонов (каталогов cli.py, процессов), поэтому
+    каждая запись фиксируется сразу, а база работает в режиме WAL: чтение не
+    ждет записи, запись ждет освободившейся базы не дольше busy_timeout секунд.
+    Если база так и осталась заблокированной, запись пропускается, а чтение
+    считается промахом; это пишется в лог.
+    """
+
+    def __init__(self, path: str = os.path.join('results', 'query_cache.sqlite'), snapshot: str = '',
+                 ttl: Optional[float] = None, max_entries: int = 1_000_000, busy_timeout: float = 5.0):
+        self.path = path
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger('QueryCache')
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.lock_errors = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS query_cache ('
+            'key TEXT PRIMARY KEY, rows TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS query_cache_accessed ON query_cache (accessed)')
+        self.connection.commit()
+
+    def key(self, database: str, query: str, params: Any = None) -> str:
+        normalized = re.sub(r'\s+', ' ', query).strip()
+        raw = json.dumps([self.snapshot, database, normalized, params], default=str, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, database: str, query: str, params: Any = None) -> Optional[List[Dict]]:
+        key = self.key(database, query, params)
+        now = time.time()
+        with self._lock:
+            try:
+                row = self.connection.execute('SELECT rows, created FROM query_cache WHERE key = ?',
+                                              (key,)).fetchone()
+                if row is not None and (self.ttl is None or now - row[1] <= self.ttl):
+                    self.connection.execute('UPDATE query_cache SET accessed = ? WHERE key = ?', (now, key))
+                    self.connection.commit()
+            except sqlite3.OperationalError as e:
+                self._locked('чтение', e)
+                row = None
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0], object_hook=_decode_value)
+
+    def put(self, database: str, query: str, params: Any, rows: List[Dict]):
+        key = self.key(database, query, params)
+        now = time.time()
+        data = json.dumps(rows, default=_encode_value, ensure_ascii=False)
+        with self._lock:
+            try:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO query_cache (key, rows, created, accessed) VALUES (?, ?, ?, ?)',
+                    (key, data, now, now)
+                )
+                self._puts += 1
+                if self._puts % 1000 == 0:
+                    self._evict()
+                # Открытая транзакция держала бы блокировку записи от других прогонов
+                self.connection.commit()
+            except sqlite3.OperationalError as e:
+                self._locked('запись', e)
+
+    def _locked(self, operation: str, error: Exception):
+        """Откатывает незавершенную транзакцию и пишет в лог ошибку блокировки базы"""
+        self.connection.rollback()
+        self.lock_errors += 1
+        self.logger.warning(f"Кэш запросов {self.path} заблокирован ({operation}): {str(error)}")
+
+    def _evict(self):
+        if self.ttl is not None:
+            self.connection.execute('DELETE FROM query_cache WHERE created < ?', (time.time() - self.ttl,))
+        count = self.connection.execute('SELECT COUNT(*) FROM query_cache').fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM query_cache WHERE key IN '
+                '(SELECT key FROM query_cache ORDER BY accessed LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        with self._lock:
+            try:
+                self._evict()
+                self.connection.commit()
+            except sqlite3.OperationalError as e:
+                self._locked('очистка', e)
+            self.connection.close()
+
+    def get_stats(self):
+        """Возвращает (попадания, промахи) и сбрасывает счетчики"""
+        with self._lock:
+            stats = self.hits, self.misses
+            self.hits = self.misses = 0
+        return stats
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'__type': 'datetime', 'value': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__type': 'date', 'value': value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {'__type': 'timedelta', 'value': value.total_seconds()}
+    if isinstance(value, decimal.Decimal):
+        return {'__type': 'decimal', 'value': str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {'__type': 'bytes', 'value': bytes(value).hex()}
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается кэшем")
+
+
+def _decode_value(obj):
+    value_type = obj.get('__type')
+    if value_type is None:
+        return obj
+    value = obj['value']
+    if value_type == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    if value_type == 'date':
+        return datetime.date.fromisoformat(value)
+    if value_type == 'timedelta':
+        return datetime.timedelta(seconds=value)
+    if value_type == 'decimal':
+        return decimal.Decimal(value)
+    return bytes.fromhex(value)
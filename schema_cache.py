@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class SchemaCache:
+    """Кэш структуры баз из information_schema: таблицы и их колонки.
+
+    Структура базы читается одним запросом при первом обращении и хранится
+    ttl секунд, ключ - хост и имя базы. По кэшу выбирается название таблицы
+    из списка возможных без пробных запросов к несуществующим таблицам.
+    """
+    schema_query = """
+                      SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+                      WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, ORDINAL_POSITION
+                   """
+
+    def __init__(self, ttl: Optional[float] = 3600):
+        self.ttl = ttl
+        self.logger = logging.getLogger('SchemaCache')
+        self._schemas: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get_schema(self, connection, host: str, db_name: str) -> Dict[str, List[str]]:
+        """Колонки всех таблиц базы: {имя таблицы: [колонки]}"""
+        key = (host, db_name)
+        now = time.time()
+        with self._lock:
+            cached = self._schemas.get(key)
+            if cached and (self.ttl is None or now - cached[0] <= self.ttl):
+                return cached[1]
+
+        schema = {}
+        with connection.cursor() as cursor:
+            cursor.execute(self.schema_query, (db_name,))
+            for row in cursor.fetchall():
+                schema.setdefault(row['TABLE_NAME'], []).append(row['COLUMN_NAME'])
+        self.logger.info(f"Структура базы {db_name} прочитана: таблиц {len(schema)}")
+
+        with self._lock:
+            self._schemas[key] = (now, schema)
+        return schema
+
+    def resolve_table(self, connection, host: str, db_name: str, aliases: List[str],
+                      required_column: Optional[str] = None) -> Optional[str]:
+        """Первое из названий aliases, которое есть в базе (и содержит required_column).
+
+        Имя возвращается в обратных кавычках, чтобы его можно было подставить в запрос.
+        """
+        schema = self.get_schema(connection, host, db_name)
+        tables = {name.lower(): name for name in schema}
+        for alias in aliases:
+            name = tables.get(alias.strip('`').lower())
+            if name is None:
+                continue
+            if required_column and required_column.lower() not in (col.lower() for col in schema[name]):
+                continue
+            return f"`{name}`"
+        return None
+
+    def invalidate(self, host: Optional[str] = None, db_name: Optional[str] = None):
+        """Сбрасывает кэш базы (или весь кэш без аргументов)"""
+        with self._lock:
+            if host is None and db_name is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop((host, db_name), None)
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+import pymysql
+import pytest
+import async_db_query
+import cli
+from async_db_query import AsyncDBQueryRunner
+from query_cache import QueryCache
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def execute(self, query, params=None):
+        self.pool.queries += 1
+        await asyncio.sleep(self.pool.delay(params[0]))
+        self.rows = [{'value': params[0]}]
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+
+class FakePool:
+    def __init__(self, delay):
+        self.delay = delay
+        self.queries = 0
+
+    def acquire(self):
+        return FakeConnection(self)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class FakeAiomysql:
+    """Замена aiomysql: задержка запроса задается функцией от его параметра"""
+    DictCursor = object
+
+    def __init__(self, delay=lambda value: 0, error=None):
+        self.delay = delay
+        self.error = error
+        self.pool = None
+
+    async def create_pool(self, **kwargs):
+        if self.error:
+            raise self.error
+        self.pool = FakePool(self.delay)
+        return self.pool
+
+
+def make_runner(monkeypatch, fake, **kwargs):
+    monkeypatch.setattr(async_db_query, 'aiomysql', fake)
+    return AsyncDBQueryRunner('host', 'user', 'password', 'db', **kwargs)
+
+
+def test_results_keep_query_order(monkeypatch):
+    # Поздние запросы завершаются раньше ранних
+    fake = FakeAiomysql(delay=lambda value: (20 - value) * 0.002)
+    with make_runner(monkeypatch, fake, connections=4, in_flight=8) as runner:
+        results = list(runner.execute_many(("SELECT %s", (i,)) for i in range(20)))
+
+    assert results == [[{'value': i}] for i in range(20)]
+
+
+def test_stop_cancels_pending_queries(monkeypatch):
+    fake = FakeAiomysql(delay=lambda value: 0 if value == 0 else 30)
+    with make_runner(monkeypatch, fake, connections=2, in_flight=4) as runner:
+        start = time.perf_counter()
+        results = []
+        for result in runner.execute_many(("SELECT %s", (i,)) for i in range(100)):
+            results.append(result)
+            if len(results) == 1:
+                threading.Timer(0.05, runner.stop).start()
+
+    assert results[0] == [{'value': 0}]
+    assert all(result is None for result in results[1:])
+    assert time.perf_counter() - start < 5
+    # Новые запросы после остановки не отправляются
+    assert fake.pool.queries <= 5
+
+
+def test_cache_is_used_through_executor(monkeypatch, tmp_path):
+    fake = FakeAiomysql()
+    cache = QueryCache(path=str(tmp_path / 'cache.sqlite'))
+    try:
+        with make_runner(monkeypatch, fake, connections=2, cache=cache) as runner:
+            first = list(runner.execute_many(("SELECT %s", (i,)) for i in range(5)))
+            second = list(runner.execute_many(("SELECT %s", (i,)) for i in range(5)))
+    finally:
+        cache.close()
+
+    assert first == second == [[{'value': i}] for i in range(5)]
+    assert fake.pool.queries == 5
+
+
+def test_failed_connect_raises_and_releases_limiter(monkeypatch):
+    limiter = threading.BoundedSemaphore(2)
+    fake = FakeAiomysql(error=pymysql.err.OperationalError(2003, "Can't connect"))
+    runner = make_runner(monkeypatch, fake, connections=2, limiter=limiter)
+
+    with pytest.raises(ConnectionError):
+        with runner:
+            pass
+
+    assert limiter.acquire(blocking=False) and limiter.acquire(blocking=False)
+    assert runner.execute_query("SELECT 1") is None
+
+
+def test_cli_rejects_fewer_connections_than_async_workers(tmp_path):
+    args = cli.parse_args([str(tmp_path), '--database', 'db', '--async-queries', '--workers', '4',
+                           '--max-connections', '2', '--results-dir', str(tmp_path / 'results')])
+
+    assert cli.run(args) is False
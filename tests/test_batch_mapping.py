@@ -0,0 +1,71 @@
+import pytest
+from dbf_merger import DBFMerger
+
+
+def make_pairs():
+    return [
+        {'SPN': 'ab1 ', 'DATO': '2024-01-01', 'source_file': 'P'},
+        {'SPN': 'CD2', 'DATO': '2024-01-02', 'source_file': 'P'},
+        {'SPN': 'EF3', 'DATO': '2024-01-03', 'source_file': 'U'},
+    ]
+
+
+def test_map_batch_rows_matches_like_mysql():
+    rows = [
+        {'SPN': 'AB1', 'eu.DATO': '2024-01-01', 'SUMM': 1},
+        {'SPN': 'AB1', 'eu.DATO': '2024-01-01', 'SUMM': 2},
+        {'SPN': 'CD2', 'eu.DATO': '2024-02-02', 'SUMM': 3},
+    ]
+    results, not_found = DBFMerger._map_batch_rows(make_pairs(), rows)
+
+    assert [row['SUMM'] for row in results] == [1, 2]
+    # SPN и источник берутся из пары DBF, а не из ответа базы
+    assert {row['SPN'] for row in results} == {'ab1 '}
+    assert {row['source_file'] for row in results} == {'P'}
+    assert not_found == 2
+
+
+class FakeExecutor:
+    """execute_many/get_not_found как у DBQuery: пустой ответ тоже увеличивает счетчик подключения"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.not_found = 0
+
+    def execute_many(self, queries):
+        for (query, params), answer in zip(queries, self.answers):
+            if answer is not None and not answer:
+                self.not_found += 1
+            yield answer
+
+    def get_not_found(self):
+        tmp = self.not_found
+        self.not_found = 0
+        return tmp
+
+
+def test_batched_not_found_counted_once():
+    merger = DBFMerger()
+    executor = FakeExecutor([[{'SPN': 'AB1', 'eu.DATO': '2024-01-01'}], []])
+    results, not_found = merger._query_pairs((executor.execute_many, executor.get_not_found), make_pairs(),
+                                             {'batch_size': 2})
+
+    assert len(results) == 1
+    # Во втором пакете одна пара, пустой ответ - одна ненайденная пара, а не две
+    assert not_found == 2
+
+
+def test_batched_query_error_is_not_counted_as_not_found():
+    merger = DBFMerger()
+    executor = FakeExecutor([None, []])
+    with pytest.raises(RuntimeError):
+        merger._query_pairs((executor.execute_many, executor.get_not_found), make_pairs(), {'batch_size': 2})
+
+
+def test_batched_stop_is_not_an_error():
+    merger = DBFMerger()
+    merger.should_stop = True
+    executor = FakeExecutor([None, None])
+    results, not_found = merger._query_pairs((executor.execute_many, executor.get_not_found), make_pairs(),
+                                             {'batch_size': 2})
+    assert results == [] and not_found == 0
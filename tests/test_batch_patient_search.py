@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import batch_patient_search
+from batch_patient_search import BatchPatientSearcher
+
+
+class FakeConnection:
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class FakeSearcher:
+    stop_search = False
+
+    def __init__(self):
+        self.calls = []
+
+    def find_client_policy(self, connection, patient):
+        self.calls.append(patient['patient_firstname'])
+        return {'number': 'P-' + patient['patient_firstname']}
+
+
+def test_read_patients_by_header(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text("Имя;Фамилия;Отчество\nИван;Иванов;Иванович\nПетр;Петров;\n", encoding='utf-8')
+
+    patients = BatchPatientSearcher(searcher=FakeSearcher()).read_patients(str(path))
+
+    assert patients.to_dict('records') == [
+        {'patient_lastname': 'Иванов', 'patient_firstname': 'Иван', 'patient_patrname': 'Иванович'},
+        {'patient_lastname': 'Петров', 'patient_firstname': 'Петр', 'patient_patrname': ''},
+    ]
+
+
+def test_read_patients_without_header_keeps_first_row(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text("Иванов;Иван;Иванович\nПетров;Петр;Петрович\n", encoding='utf-8')
+
+    patients = BatchPatientSearcher(searcher=FakeSearcher()).read_patients(str(path))
+
+    assert list(patients['patient_lastname']) == ['Иванов', 'Петров']
+    assert list(patients['patient_patrname']) == ['Иванович', 'Петрович']
+
+
+def test_patients_without_lastname_use_single_search():
+    searcher = FakeSearcher()
+    batch = BatchPatientSearcher(searcher=searcher)
+    patients = pd.DataFrame({'patient_lastname': [''], 'patient_firstname': ['Иван'], 'patient_patrname': ['']})
+
+    assert batch._resolve_policies(FakeConnection(), patients) == ['P-Иван']
+    assert searcher.calls == ['Иван']
+
+
+def test_per_patient_files_are_sanitized_and_unique(tmp_path, monkeypatch, caplog):
+    saved = []
+    monkeypatch.setattr(batch_patient_search, 'save_tables', lambda path, tables: saved.append(path))
+    batch = BatchPatientSearcher(searcher=FakeSearcher())
+    batch._build_tables = lambda patients, results, indexes: {}
+    patients = pd.DataFrame({'patient_lastname': ['Иванов', 'Иванов', 'Ива/нов', 'Петров'],
+                             'patient_firstname': ['Иван', 'Иван', 'Иван:', 'Петр'],
+                             'patient_patrname': ['', '', '', '"?*']})
+    results = [{'policies': ['P-1', 'P-2', 'P-3', 'P-4']}]
+
+    paths = batch.save_per_patient(patients, results, str(tmp_path))
+
+    assert [os.path.basename(path) for path in paths] == [
+        'Иванов_Иван_results.xlsx', 'Иванов_Иван_2_results.xlsx', 'Иванов_Иван_3_results.xlsx',
+        'Петров_Петр_results.xlsx']
+    assert paths == saved
+    assert caplog.text.count('уже встречался') == 2
@@ -0,0 +1,13 @@
+import benchmark
+from dbf_merger import DBFMerger
+
+
+def test_failed_queries_mark_scale_failed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DBFMerger, 'process_db_queries', lambda self, dbf_df, db_params: None)
+
+    stages = benchmark.run_benchmark(100, str(tmp_path))
+
+    assert [stage['stage'] for stage in stages] == [
+        'generate_registry', 'load_stand_in_db', 'merge_dbf_files', 'process_db_queries']
+    assert {stage['status'] for stage in stages} == {'failed'}
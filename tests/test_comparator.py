@@ -0,0 +1,80 @@
+import datetime
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from comparator import ResultComparator
+
+D1, D2, D3 = datetime.date(2025, 1, 1), datetime.date(2025, 1, 2), datetime.date(2025, 1, 3)
+
+# Результат построчной реализации compare_results (iterrows) на тех же таблицах.
+# Пустой SPN не сопоставляется, SPN C в базе нет; для B в базе две строки,
+# у обеих блоков один номер строки DBF
+BASELINE = [
+    ('Header', '1. SPN: A, DATO: 2025-01-01', '', '', 'MATCH'),
+    ('Data', 'SPN', 'A', 'A', 'MATCH'),
+    ('Data', 'DATO', D1, D1, 'MATCH'),
+    ('Data', 'eu.DATO', D1, D1, 'MATCH'),
+    ('Data', 'eu.NS', 1, 1, 'MATCH'),
+    ('Data', 'SUMM', 100.0, Decimal('100.00'), 'MATCH'),
+    ('Data', 'KOD', '5', 5, 'DIFF'),
+    ('Data', 'NAME', 'Иванов', 'Иванов', 'MATCH'),
+    ('Separator', '---', '---', '---', ''),
+    ('Header', '2. SPN: B, DATO: 2025-01-02', '', '', 'MATCH'),
+    ('Data', 'SPN', 'B', 'B', 'MATCH'),
+    ('Data', 'DATO', D2, D1, 'DIFF'),
+    ('Data', 'eu.DATO', D2, D2, 'MATCH'),
+    ('Data', 'eu.NS', 1, 2, 'MATCH'),
+    ('Data', 'SUMM', np.nan, 3.0, 'DIFF'),
+    ('Data', 'KOD', 7, 7, 'MATCH'),
+    ('Data', 'NAME', '', 'Петров', 'MATCH'),
+    ('Separator', '---', '---', '---', ''),
+    ('Header', '2. SPN: B, DATO: 2025-01-02', '', '', 'MATCH'),
+    ('Data', 'SPN', 'B', 'B', 'MATCH'),
+    ('Data', 'DATO', D2, D2, 'MATCH'),
+    ('Data', 'eu.DATO', D2, D2, 'MATCH'),
+    ('Data', 'eu.NS', 1, 1, 'MATCH'),
+    ('Data', 'SUMM', np.nan, np.nan, 'DIFF'),
+    ('Data', 'KOD', 7, 7, 'MATCH'),
+    ('Data', 'NAME', '', 'X', 'MATCH'),
+    ('Separator', '---', '---', '---', ''),
+]
+
+
+def _frames():
+    dbf_df = pd.DataFrame({
+        'SN': [1, 2, 3, 4],
+        'SPN': ['A', 'B', 'C', None],
+        'DATO': [D1, D2, D3, D1],
+        'eu.DATO': [D1, D2, D3, D1],
+        'eu.NS': [1, 1, 1, 1],
+        'SUMM': [100.0, np.nan, 5.0, 1.0],
+        'KOD': ['5', 7, '1', '1'],
+        'NAME': ['иванов', '', 'c', 'x'],
+    })
+    db_df = pd.DataFrame({
+        'SPN': ['B', 'A', 'B', None],
+        'eu.DATO': [D2, D1, D2, D1],
+        'DATO': [D1, D1, D2, D1],
+        'eu.NS': [2, 1, 1, 1],
+        'SUMM': [3.0, Decimal('100.00'), np.nan, 1.0],
+        'KOD': [7, 5, 7, '1'],
+        'NAME': ['ПЕТРОВ', 'Иванов', 'x', 'x'],
+    })
+    return dbf_df, db_df
+
+
+def test_compare_results_matches_baseline():
+    comparator = ResultComparator()
+    dbf_df, db_df = _frames()
+
+    result = comparator.compare_results(dbf_df, db_df)
+
+    assert len(result) == len(BASELINE)
+    for row, expected in zip(result, BASELINE):
+        values = tuple(row[column] for column in ('Type', 'Field', 'DBF_Value', 'DB_Value', 'Status'))
+        assert [type(value) for value in values] == [type(value) for value in expected], row
+        assert all(value == other or (pd.isna(value) and pd.isna(other))
+                   for value, other in zip(values, expected)), row
+    assert comparator.get_count_compare() == 4
+    # Исходные таблицы не меняются
+    assert 'COMP_KEY' not in dbf_df.columns and 'COMP_KEY' not in db_df.columns
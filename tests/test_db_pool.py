@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+import pytest
+from config import main_query
+from db_pool import DBQueryPool
+from dbf_merger import DBFMerger
+
+
+class FakeQuery:
+    """Замена DBQuery: первые failing подключений не открываются, запрос возвращает свой параметр"""
+    failing = 0
+    _connects = 0
+    _lock = threading.Lock()
+
+    def __init__(self, host, user, password, database, **kwargs):
+        self.should_stop = False
+        self.connected = False
+
+    def connect(self):
+        with FakeQuery._lock:
+            FakeQuery._connects += 1
+            self.connected = FakeQuery._connects > self.failing
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def stop(self):
+        self.should_stop = True
+
+    def execute_query(self, query, params=None):
+        if not self.connected:
+            raise AttributeError("'NoneType' object has no attribute 'cursor'")
+        time.sleep(random.uniform(0, 0.005))
+        return [{'value': params[0]}]
+
+    def get_not_found(self):
+        return 0
+
+
+@pytest.fixture
+def fake_query():
+    FakeQuery._connects = 0
+    FakeQuery.failing = 0
+    yield FakeQuery
+    FakeQuery.failing = 0
+
+
+def test_results_keep_submission_order(fake_query):
+    with DBQueryPool('host', 'user', 'password', 'db', workers=4, query_class=fake_query) as pool:
+        results = list(pool.execute_many(("SELECT %s", (i,)) for i in range(50)))
+
+    assert results == [[{'value': i}] for i in range(50)]
+
+
+def test_connected_workers_take_queue_of_failed_ones(fake_query):
+    fake_query.failing = 2
+    with DBQueryPool('host', 'user', 'password', 'db', workers=4, query_class=fake_query) as pool:
+        results = list(pool.execute_many(("SELECT %s", (i,)) for i in range(50)))
+
+    assert results == [[{'value': i}] for i in range(50)]
+    assert pool.failed_workers == 2
+
+
+def test_no_connections_raise(fake_query):
+    fake_query.failing = 3
+    start = time.perf_counter()
+    with pytest.raises(ConnectionError):
+        with DBQueryPool('host', 'user', 'password', 'db', workers=3, query_class=fake_query) as pool:
+            list(pool.execute_many(("SELECT %s", (i,)) for i in range(50)))
+
+    assert time.perf_counter() - start < 5
+
+
+def test_failed_pair_queries_are_not_reported_as_not_found():
+    merger = DBFMerger()
+    pairs = [{'SPN': str(i), 'DATO': 'd', 'source_file': 'f'} for i in range(4)]
+
+    def execute_many(queries):
+        # Запрос третьей пары завершился ошибкой
+        return [None if i == 2 else [{'value': i}] for i, _ in enumerate(queries)]
+
+    with pytest.raises(RuntimeError, match='1 пар из 4'):
+        merger._query_per_pair(execute_many, pairs, {'sql_query': main_query})
@@ -0,0 +1,83 @@
+import sqlite3
+from db_query import DBQuery
+from query_cache import QueryCache
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, *args):
+        return FakeCursor(self.rows)
+
+
+class BrokenCache:
+    def get(self, database, query, params=None):
+        raise sqlite3.OperationalError("database is locked")
+
+    def put(self, database, query, params, rows):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_cache_errors_do_not_lose_results():
+    db_query = DBQuery('host', 'user', 'password', 'db', cache=BrokenCache())
+    db_query.connection = FakeConnection([{'SPN': '1'}])
+
+    assert db_query.execute_query("SELECT 1", ('1',)) == [{'SPN': '1'}]
+
+
+def test_cache_errors_keep_not_found_count():
+    db_query = DBQuery('host', 'user', 'password', 'db', cache=BrokenCache())
+    db_query.connection = FakeConnection([])
+
+    assert db_query.execute_query("SELECT 1", ('1',)) == []
+    assert db_query.get_not_found() == 1
+
+
+def test_cache_file_is_shared_between_runs(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    first, second = QueryCache(path=path), QueryCache(path=path, busy_timeout=0.5)
+    try:
+        first.put('db', "SELECT 1", ('1',), [{'SPN': '1'}])
+        # Запись первого прогона сразу видна второму и не блокирует его записи
+        assert second.get('db', "SELECT 1", ('1',)) == [{'SPN': '1'}]
+        second.put('db', "SELECT 1", ('2',), [])
+        assert first.get('db', "SELECT 1", ('2',)) == []
+        assert first.lock_errors == second.lock_errors == 0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_locked_cache_is_logged(tmp_path, caplog):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = QueryCache(path=path, busy_timeout=0.1)
+    other = sqlite3.connect(path)
+    try:
+        other.execute('BEGIN EXCLUSIVE')
+        cache.put('db', "SELECT 1", ('1',), [{'SPN': '1'}])
+        other.rollback()
+
+        assert cache.get('db', "SELECT 1", ('1',)) is None
+        assert cache.lock_errors == 1
+        assert 'заблокирован' in caplog.text
+    finally:
+        other.close()
+        cache.close()
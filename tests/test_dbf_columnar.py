@@ -0,0 +1,84 @@
+import glob
+import os
+import shutil
+import pytest
+from dbfread import DBF
+from dbf_columnar import UnsupportedDBF, iter_dbf_columns, read_dbf_columns, read_dbf_header
+from dbf_processor import _columns_to_records, read_dbf_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILES = sorted(glob.glob(os.path.join(ROOT, '1*', '*.DBF')))
+SAMPLE_U = os.path.join(ROOT, '12070709800161', 'U07098.DBF')
+
+
+def _assert_same_records(records, path):
+    expected = list(DBF(path, encoding='cp866', recfactory=dict))
+
+    assert records == expected
+    # Сравнение == не отличает 1 от 1.0 и True от 1
+    assert [{name: type(value) for name, value in record.items()} for record in records] == \
+           [{name: type(value) for name, value in record.items()} for record in expected]
+
+
+def _patch(path, record, field_name, value: bytes):
+    with open(path, 'r+b') as f:
+        header = read_dbf_header(f.read(65536))
+        if field_name is None:
+            offset = 0
+        else:
+            offset = next(field.offset for field in header.fields if field.name == field_name)
+        f.seek(header.header_length + record * header.record_length + offset)
+        f.write(value)
+
+
+def test_sample_dirs_are_present():
+    assert len(SAMPLE_FILES) == 22
+
+
+@pytest.mark.parametrize('path', SAMPLE_FILES, ids=lambda path: os.path.relpath(path, ROOT))
+def test_sample_files_match_dbfread(path):
+    _assert_same_records(list(_columns_to_records(read_dbf_columns(path))), path)
+
+
+def test_deleted_records_and_blank_values_match_dbfread(tmp_path):
+    path = str(tmp_path / 'U07098.DBF')
+    shutil.copy(SAMPLE_U, path)
+    _patch(path, 0, None, b'*')
+    _patch(path, 5, None, b'*')
+    _patch(path, 1, 'SUMM', b' ' * 14)
+    _patch(path, 2, 'KSLP_IT', b' ' * 4)
+    _patch(path, 3, 'DATO', b' ' * 8)
+    _patch(path, 4, 'DATN', b'00000000')
+    _patch(path, 6, 'TARU', b'      12.5')
+    _patch(path, 7, 'SUMM', b'            12')
+
+    records = list(_columns_to_records(read_dbf_columns(path)))
+
+    assert len(records) == len(list(DBF(SAMPLE_U))) - 2
+    assert records[0]['SUMM'] is None and records[1]['KSLP_IT'] is None and records[2]['DATO'] is None
+    _assert_same_records(records, path)
+
+
+def test_memo_field_falls_back_to_dbfread(tmp_path):
+    path = str(tmp_path / 'U07098.DBF')
+    shutil.copy(SAMPLE_U, path)
+    with open(path, 'r+b') as f:
+        data = f.read(65536)
+        header = read_dbf_header(data)
+        index = next(i for i, field in enumerate(header.fields) if field.name == 'COMMENT')
+        # Версия dBase III с memo, тип поля COMMENT - M
+        f.seek(0)
+        f.write(b'\x83')
+        f.seek(32 + index * 32 + 11)
+        f.write(b'M')
+    for record in range(len(list(DBF(SAMPLE_U)))):
+        _patch(path, record, 'COMMENT', b'         1' if record == 0 else b' ' * 10)
+    with open(str(tmp_path / 'U07098.DBT'), 'wb') as f:
+        f.write(b'\x02' + b'\0' * 511 + 'примечание'.encode('cp866') + b'\x1a\x1a')
+
+    with pytest.raises(UnsupportedDBF):
+        next(iter_dbf_columns(path))
+    records = list(_columns_to_records(read_dbf_file(path)))
+
+    assert records[0]['COMMENT'] == 'примечание'
+    _assert_same_records(records, path)
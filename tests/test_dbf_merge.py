@@ -0,0 +1,76 @@
+import os
+import pandas as pd
+import pytest
+from benchmark import generate_registry
+from dbf_processor import DBFProcessor
+
+
+@pytest.fixture(scope='module')
+def registry(tmp_path_factory):
+    return generate_registry(str(tmp_path_factory.mktemp('registry')), 300, seed=1)
+
+
+def _sorted(df):
+    # Сброс на диск раскладывает SN по разделам, поэтому порядок строк сравнивать не нужно
+    df = df.astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def _streaming(processor):
+    # Порог 0 включает потоковое объединение, маленький блок - сборку таблицы по частям
+    processor.spill_threshold = 0
+    processor.merge_chunk_size = 50
+    return processor
+
+
+def test_files_are_merged_in_name_order(registry):
+    processor = DBFProcessor()
+    files = processor._list_dbf_files(registry)
+
+    assert files == sorted(files)
+    # P читается раньше U, поэтому дата услуги получает префикс eu.
+    assert 'eu.DATO' in processor.merge_dbf_files(registry).columns
+
+
+def test_streaming_merge_matches_columnar(registry):
+    expected = DBFProcessor().merge_dbf_files(registry)
+    result = _streaming(DBFProcessor()).merge_dbf_files(registry)
+
+    assert len(result) == len(expected)
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected), check_dtype=False)
+
+
+def test_failed_file_records_are_dropped(registry, tmp_path):
+    processor = _streaming(DBFProcessor())
+    failing = next(name for name in processor._list_dbf_files(registry) if name.upper().startswith('U'))
+    read_records = processor._read_records
+
+    def broken_read(filepath):
+        records = read_records(filepath)
+        if os.path.basename(filepath) != failing:
+            yield from records
+            return
+        # Часть записей файла отдается до ошибки
+        for _ in range(10):
+            yield next(records)
+        raise OSError("битый файл")
+
+    processor._read_records = broken_read
+    result = processor.merge_dbf_files(registry)
+
+    without_failing = tmp_path / 'registry'
+    without_failing.mkdir()
+    for name in os.listdir(registry):
+        if name != failing:
+            os.link(os.path.join(registry, name), without_failing / name)
+    expected = _streaming(DBFProcessor()).merge_dbf_files(str(without_failing))
+
+    assert len(result) == len(expected)
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(expected), check_dtype=False)
+
+
+def test_parallel_read_matches_sequential(registry):
+    expected = DBFProcessor().merge_dbf_files(registry)
+
+    pd.testing.assert_frame_equal(DBFProcessor().merge_dbf_files(registry, workers=2), expected)
@@ -0,0 +1,35 @@
+from openpyxl import load_workbook
+from openpyxl.styles import Font, PatternFill
+from excel_writer import ComparisonWriter
+
+
+def make_writer(path, width_sample):
+    fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+    return ComparisonWriter(str(path), header_fill=fill, header_font=Font(bold=True), diff_fill=fill,
+                            dbf_fill=fill, db_fill=fill, width_sample=width_sample)
+
+
+def test_widths_come_from_sample_only(tmp_path):
+    path = tmp_path / 'cmp.xlsx'
+    with make_writer(path, width_sample=3) as writer:
+        writer.write('Data', 'F', 'a', 'b', 'OK')
+        writer.write('Data', 'F', 'a', 'b', 'OK')
+        sample_widths = list(writer.widths)
+        # Строки после выборки не меняют ширины: они уже записаны в лист
+        writer.write('Data', 'F' * 50, 'a', 'b', 'OK')
+        assert writer.widths == sample_widths
+
+    ws = load_workbook(path).active
+    assert ws.max_row == 4
+    assert ws['A4'].value == 'F' * 50
+    assert ws.column_dimensions['A'].width == (sample_widths[0] + 2) * 1.2
+
+
+def test_short_output_flushed_on_close(tmp_path):
+    path = tmp_path / 'cmp.xlsx'
+    with make_writer(path, width_sample=1000) as writer:
+        writer.write('Header', '1. Row', '', '', '')
+        writer.write('Data', 'SUMM', 10, 12, 'DIFF')
+    ws = load_workbook(path).active
+    assert [cell.value for cell in ws[3]] == ['SUMM', 10, 12, 'DIFF']
+    assert writer.rows_written == 3
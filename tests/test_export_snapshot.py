@@ -0,0 +1,24 @@
+import sqlite3
+from benchmark import SQLiteQuery, generate_registry, load_stand_in_db
+from export_snapshot import ExportSnapshot
+
+
+def test_snapshot_reads_only_wanted_spns_with_latest_ns(tmp_path):
+    registry = generate_registry(str(tmp_path / 'registry'), 100, seed=3)
+    db_path = load_stand_in_db(str(tmp_path / 'stand_in.sqlite'), registry)
+    connection = sqlite3.connect(db_path)
+    spns = [row[0] for row in connection.execute('SELECT SPN FROM exportfilep ORDER BY SN LIMIT 20')]
+    # Устаревшая строка пациента с меньшим NS не должна попасть в срез
+    connection.execute('INSERT INTO exportfilep SELECT * FROM exportfilep WHERE SPN = ?', (spns[0],))
+    connection.execute('UPDATE exportfilep SET NS = 0 WHERE rowid = (SELECT MAX(rowid) FROM exportfilep)')
+    connection.commit()
+    connection.close()
+
+    with SQLiteQuery(database=db_path) as db_query:
+        chunked = ExportSnapshot(spn_chunk=7).load(db_query, spns + ['UNKNOWN'])
+        whole = ExportSnapshot().load(db_query, spns)
+
+    assert chunked.rows_by_key
+    assert dict(chunked.rows_by_key) == dict(whole.rows_by_key)
+    assert {spn for spn, _ in chunked.rows_by_key} <= set(spns)
+    assert all(row['NS'] == 1 for rows in chunked.rows_by_key.values() for row in rows)
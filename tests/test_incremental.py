@@ -0,0 +1,96 @@
+import os
+import pandas as pd
+import pytest
+from incremental import IncrementalState
+
+
+def test_hash_depends_on_row_order():
+    df = pd.DataFrame({'SN': ['1', '1'], 'A': ['x', 'y']})
+    swapped = df.iloc[::-1].reset_index(drop=True)
+
+    assert IncrementalState.hash_sn_rows(df)['1'] != IncrementalState.hash_sn_rows(swapped)['1']
+
+
+def test_hash_is_per_sn():
+    df = pd.DataFrame({'SN': ['1', '1', '2'], 'A': ['x', 'y', 'z']})
+    changed = df.copy()
+    changed.loc[2, 'A'] = 'w'
+
+    hashes = IncrementalState.hash_sn_rows(df)
+    changed_hashes = IncrementalState.hash_sn_rows(changed)
+
+    assert hashes['1'] == changed_hashes['1']
+    assert hashes['2'] != changed_hashes['2']
+    assert hashes.equals(IncrementalState.hash_sn_rows(df.copy()))
+
+
+def test_hash_depends_on_columns():
+    df = pd.DataFrame({'SN': ['1'], 'A': ['x']})
+
+    assert IncrementalState.hash_sn_rows(df)['1'] != IncrementalState.hash_sn_rows(df.rename(columns={'A': 'B'}))['1']
+
+
+def test_state_round_trip(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = pd.DataFrame({'SN': [1, 1, 2], 'A': ['x', 'y', 'z']})
+    state = IncrementalState(str(tmp_path))
+    state.sn_hashes = IncrementalState.hash_sn_rows(df)
+    state.sn_keys = pd.DataFrame({'SN': [1, 2], 'COMP_KEY': ['k1', 'k2']})
+    state.db_results = pd.DataFrame({'SPN': ['1'], 'DATO': ['2025-01-01']})
+    state.comparison = pd.DataFrame({'Type': ['Header'], 'Field': ['1. x'], 'DBF_Value': [1], 'DB_Value': ['1'],
+                                     'Status': ['DIFF'], 'COMP_KEY': ['k1']})
+    state.save()
+
+    loaded = IncrementalState(str(tmp_path))
+    assert loaded.load()
+    assert list(loaded.sn_hashes.index) == [1, 2]
+    assert (loaded.sn_hashes.to_numpy() == state.sn_hashes.to_numpy()).all()
+    assert loaded.changed_keys(state.sn_hashes, state.sn_keys) == {'k1'}
+
+
+def test_load_without_state(tmp_path):
+    assert not IncrementalState(str(tmp_path)).load()
+
+
+def _edit_summ(registry, record):
+    """Меняет SUMM одной услуги прямо в файле DBF"""
+    from dbf_columnar import read_dbf_header
+    name = next(name for name in sorted(os.listdir(registry)) if name.upper().startswith('U'))
+    path = os.path.join(registry, name)
+    with open(path, 'r+b') as f:
+        header = read_dbf_header(f.read(65536))
+        field = next(field for field in header.fields if field.name == 'SUMM')
+        f.seek(header.header_length + record * header.record_length + field.offset)
+        f.write(f"{999.5:>{field.length}.{field.decimal_count}f}".encode('ascii'))
+
+
+def test_incremental_run_matches_full_run(tmp_path):
+    pytest.importorskip('pyarrow')
+    from benchmark import SQLiteQuery, generate_registry, load_stand_in_db
+    from config import main_query
+    from dbf_merger import DBFMerger
+
+    registry = generate_registry(str(tmp_path / 'registry'), 100, seed=5)
+    db_params = {'host': '', 'user': '', 'password': '',
+                 'database': load_stand_in_db(str(tmp_path / 'stand_in.sqlite'), registry), 'sql_query': main_query}
+    saved = []
+
+    def merger():
+        result = DBFMerger()
+        result.db_query_class = SQLiteQuery
+        result.results_dir = str(tmp_path / 'results')
+        result.comparator.save_comparison = lambda comparison, output_path: saved.append(comparison)
+        return result
+
+    assert merger().run_incremental(registry, db_params, 'first.xlsx')
+    _edit_summ(registry, 3)
+
+    incremental = merger()
+    assert incremental.run_incremental(registry, db_params, 'second.xlsx')
+    full = merger()
+    dbf_df = full.process_dbf(registry)
+    assert full.compare_and_save(dbf_df, full.process_db_queries(dbf_df, db_params), 'full.xlsx')
+
+    columns = ['Type', 'Field', 'DBF_Value', 'DB_Value', 'Status']
+    pd.testing.assert_frame_equal(saved[1][columns].reset_index(drop=True), saved[2][columns])
+    assert incremental.get_count_compare() == full.get_count_compare()
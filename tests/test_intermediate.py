@@ -0,0 +1,89 @@
+import argparse
+import datetime
+import os
+import pandas as pd
+import pytest
+import intermediate
+from intermediate import parquet_safe
+
+
+def test_parquet_safe_casts_mixed_object_columns():
+    df = pd.DataFrame({
+        'mixed': pd.Series(['1', 2, None], dtype=object),
+        'dates': pd.Series([datetime.date(2025, 1, 1), None, datetime.date(2025, 1, 2)], dtype=object),
+        'number': [1, 2, 3],
+    })
+
+    result = parquet_safe(df)
+
+    assert list(result['mixed'][:2]) == ['1', '2']
+    assert pd.isna(result['mixed'][2])
+    # Колонки одного типа не меняются
+    assert list(result['dates']) == list(df['dates'])
+    assert result['number'].dtype == df['number'].dtype
+    assert list(df['mixed']) == ['1', 2, None]
+
+
+def test_save_frame_requires_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(intermediate, 'pyarrow', None)
+
+    with pytest.raises(ImportError):
+        intermediate.save_frame(pd.DataFrame({'a': [1]}), str(tmp_path), 'dbf_merged')
+    assert not os.listdir(tmp_path)
+
+
+def test_resume_skips_dbf_and_queries(tmp_path):
+    pytest.importorskip('pyarrow')
+    import cli
+    from benchmark import SQLiteQuery, generate_registry, load_stand_in_db
+    from config import main_query
+    from dbf_merger import DBFMerger
+
+    registry = generate_registry(str(tmp_path / 'registry'), 200, seed=2)
+    db_path = str(tmp_path / 'stand_in.sqlite')
+    load_stand_in_db(db_path, registry)
+
+    first_dir = tmp_path / 'first'
+    merger = DBFMerger()
+    merger.db_query_class = SQLiteQuery
+    merger.results_dir = str(first_dir / 'registry')
+    dbf_df = merger.process_dbf(registry)
+    db_df = merger.process_db_queries(dbf_df, {
+        'host': '', 'user': '', 'password': '', 'database': db_path, 'sql_query': main_query,
+    })
+
+    resumed = DBFMerger()
+    assert resumed.load_intermediate('dbf_merged', merger.results_dir).shape == dbf_df.shape
+    assert resumed.load_intermediate('db_results', merger.results_dir).shape == db_df.shape
+
+    # Без каталога реестра и с недоступной базой сверка возможна только по сохраненным таблицам
+    args = argparse.Namespace(results_dir=str(tmp_path / 'second'), excel=False, dbf_workers=None, incremental=False,
+                              pipeline=False)
+    folder = {'name': 'registry', 'input_dir': None, 'resume_dir': merger.results_dir}
+    summary = cli.run_folder(folder, args, {'host': 'unreachable', 'database': 'none'})
+
+    assert summary['status'] == 'ok'
+    assert os.path.exists(summary['output'])
+
+
+def test_results_survive_failed_intermediate_save(tmp_path, monkeypatch, caplog):
+    from benchmark import SQLiteQuery, generate_registry, load_stand_in_db
+    from config import main_query
+    from dbf_merger import DBFMerger
+
+    monkeypatch.setattr(intermediate, 'pyarrow', None)
+    registry = generate_registry(str(tmp_path / 'registry'), 100, seed=4)
+    db_path = load_stand_in_db(str(tmp_path / 'stand_in.sqlite'), registry)
+    merger = DBFMerger()
+    merger.db_query_class = SQLiteQuery
+    merger.results_dir = str(tmp_path / 'results')
+
+    dbf_df = merger.process_dbf(registry)
+    db_df = merger.process_db_queries(dbf_df, {
+        'host': '', 'user': '', 'password': '', 'database': db_path, 'sql_query': main_query,
+    })
+
+    assert dbf_df is not None and len(dbf_df)
+    assert db_df is not None and len(db_df)
+    assert "Промежуточная таблица dbf_merged не сохранена" in caplog.text
+    assert merger.compare_and_save(dbf_df, db_df, str(tmp_path / 'comparison.xlsx'))
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+from key_index import KeyIndex
+
+
+def test_missing_keys_are_not_matched():
+    left = KeyIndex.from_frame(pd.DataFrame({'SPN': ['1', '2', '3'], 'eu.DATO': ['d1', None, 'd3']}))
+    right = KeyIndex.from_frame(pd.DataFrame({'SPN': ['3', '2', '1'], 'eu.DATO': ['d3', None, 'd1']}))
+
+    left_pos, right_pos = left.join(right)
+
+    assert list(zip(left_pos, right_pos)) == [(0, 2), (2, 0)]
+    assert left.keys == ['1_d1', '3_d3']
+    assert list(left.row_keys(np.arange(3))) == ['1_d1', None, '3_d3']
+
+
+def test_missing_key_in_later_chunk_keeps_own_code():
+    index = KeyIndex()
+    index.add(['a', 'b'])
+    index.add([None, 'b'])
+
+    # Пустой ключ второго блока не должен получить код последнего известного ключа
+    assert list(index.positions('b')) == [1, 3]
+    assert list(index.positions_of(['a', 'b'])) == [0, 1, 3]
+    assert len(index) == 4
+
+
+def test_join_pairs_all_rows_of_key():
+    left = KeyIndex()
+    left.add(['k', 'x', 'k'])
+    right = KeyIndex()
+    right.add(['k', 'k', 'y'])
+
+    left_pos, right_pos = left.join(right)
+
+    assert list(zip(left_pos, right_pos)) == [(0, 0), (0, 1), (2, 0), (2, 1)]
@@ -0,0 +1,35 @@
+import threading
+from benchmark import generate_registry
+from dbf_merger import DBFMerger
+from metrics import Metrics, metrics
+
+
+def test_concurrent_runs_keep_separate_metrics(tmp_path):
+    registries = [generate_registry(str(tmp_path / f'registry_{i}'), 50 * (i + 1), seed=i) for i in range(2)]
+    run_metrics = [Metrics(), Metrics()]
+    shared_stages = len(metrics.stages)
+
+    def run(i):
+        with run_metrics[i].run(f'folder_{i}', output_dir=None):
+            DBFMerger(metrics=run_metrics[i])._merge_dbf(registries[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i, folder_metrics in enumerate(run_metrics):
+        report = folder_metrics.report()
+        assert report['run'] == f'folder_{i}'
+        assert [stage['stage'] for stage in report['stages']] == ['dbf_parse', 'total']
+    assert run_metrics[0].stages[0]['rows'] < run_metrics[1].stages[0]['rows']
+    assert len(metrics.stages) == shared_stages
+
+
+def test_merger_shares_metrics_with_comparator():
+    folder_metrics = Metrics()
+    merger = DBFMerger(metrics=folder_metrics)
+
+    assert merger.comparator.metrics is folder_metrics
+    assert DBFMerger().metrics is metrics
@@ -0,0 +1,42 @@
+from patient_search import PatientSearcher
+
+
+class FakeSchemaCache:
+    def __init__(self, tables):
+        self.tables = tables
+        self.calls = 0
+
+    def resolve_table(self, connection, host, database, aliases, column):
+        self.calls += 1
+        return next((alias for alias in aliases if alias in self.tables), None)
+
+
+def test_known_database_uses_its_aliases_first():
+    searcher = PatientSearcher()
+    searcher.schema_cache = FakeSchemaCache(set())
+
+    aliases = searcher.get_table_aliases(None, {'host': 'h', 'database': 's12pays202504041322'})
+
+    assert aliases['exportfilep'] == ['vasP', 'exportfilep']
+    assert aliases['exportfileu'] == ['`123`', 'exportfileu']
+    assert searcher.schema_cache.calls == 0
+
+
+def test_other_database_resolves_through_schema():
+    searcher = PatientSearcher()
+    searcher.schema_cache = FakeSchemaCache({'exportfilep', 'vasL'})
+
+    aliases = searcher.get_table_aliases(None, {'host': 'h', 'database': 's12'})
+
+    assert aliases == {'exportfilep': ['exportfilep'], 'exportfileu': [], 'exportfileo': [], 'exportfilel': ['vasL']}
+    assert searcher.schema_cache.calls == 4
+
+
+def test_new_snapshot_database_resolves_without_code_change():
+    searcher = PatientSearcher()
+    searcher.schema_cache = FakeSchemaCache({'vasP', 'vasO', 'exportfileu', 'vasL'})
+
+    aliases = searcher.get_table_aliases(None, {'host': 'h', 'database': 's12pays202601010000'})
+
+    assert aliases == {'exportfilep': ['vasP'], 'exportfileu': ['exportfileu'], 'exportfileo': ['vasO'],
+                       'exportfilel': ['vasL']}
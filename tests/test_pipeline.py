@@ -0,0 +1,73 @@
+import os
+from contextlib import contextmanager
+import pytest
+from benchmark import SQLiteQuery, generate_registry, load_stand_in_db
+from config import main_query
+from dbf_merger import DBFMerger
+
+
+@pytest.fixture(scope='module')
+def stand_in(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp('pipeline')
+    registry = generate_registry(str(workdir / 'registry'), 300, seed=6)
+    db_path = load_stand_in_db(str(workdir / 'stand_in.sqlite'), registry, diff_rate=0.05)
+    return registry, {'host': '', 'user': '', 'password': '', 'database': db_path, 'sql_query': main_query}
+
+
+def _merger(rows, tmp_path):
+    merger = DBFMerger()
+    merger.db_query_class = SQLiteQuery
+    merger.results_dir = str(tmp_path)
+
+    @contextmanager
+    def open_writer(output_path):
+        class Writer:
+            def write(self, *row):
+                rows.append(row)
+        yield Writer()
+
+    merger.comparator.open_writer = open_writer
+    return merger
+
+
+def _blocks(rows):
+    """Блоки отчета без номеров строк в заголовках, по порядку ключей"""
+    blocks, block = [], []
+    for row in rows:
+        if row[0] == 'Header':
+            row = (row[0], row[1].split('. ', 1)[1]) + row[2:]
+        block.append(row)
+        if row[0] == 'Separator':
+            blocks.append(tuple(block))
+            block = []
+    return sorted(blocks, key=repr)
+
+
+def test_pipeline_matches_compare_and_save(stand_in, tmp_path):
+    registry, db_params = stand_in
+    full_rows, pipeline_rows = [], []
+
+    full = _merger(full_rows, tmp_path)
+    dbf_df = full.process_dbf(registry)
+    assert full.compare_and_save(dbf_df, full.process_db_queries(dbf_df, db_params), 'full.xlsx')
+
+    pipeline = _merger(pipeline_rows, tmp_path)
+    # Маленькие блоки: запросы первых блоков идут, пока строятся следующие
+    assert pipeline.run_pipeline(registry, db_params, 'pipeline.xlsx', chunk_size=20)
+
+    assert len(pipeline_rows) == len(full_rows)
+    assert _blocks(pipeline_rows) == _blocks(full_rows)
+    assert pipeline.get_count_compare() == full.get_count_compare() > 0
+    assert pipeline.get_not_found() == full.get_not_found()
+
+
+def test_pipeline_without_common_keys_fails(stand_in, tmp_path):
+    registry, db_params = stand_in
+    db_params = dict(db_params, sql_query="SELECT * FROM exportfileu WHERE 0 = 1")
+    output_path = str(tmp_path / 'comparison_results.xlsx')
+
+    merger = DBFMerger()
+    merger.db_query_class = SQLiteQuery
+
+    assert merger.run_pipeline(registry, db_params, output_path) is False
+    assert not os.path.exists(output_path)